@@ -1,7 +1,19 @@
 import argparse
-from dotenv import load_dotenv
-from lib.hybrid_search import rrf_search
-from lib.search_utils import generate_content
+from lib.answer_cache import (
+    ANSWER_CACHE_MIN_OVERLAP,
+    ANSWER_CACHE_SIMILARITY,
+    format_answer_cache_stats,
+)
+from lib.augmented_generation import rag_command
+from lib.llm_gateway import format_llm_stats
+from lib.result_cache import format_cache_stats
+
+ANSWER_LABELS = {
+    "rag": "RAG Response:",
+    "summarize": "Summarized Response:",
+    "citations": "LLM Answer:",
+    "question": "LLM Answer:",
+}
 
 
 def main():
@@ -43,131 +55,43 @@ def main():
         "limit", type=int, help="Limit the number of results", default=5, nargs="?"
     )
 
+    for rag_command_parser in (
+        rag_parser,
+        summarize_parser,
+        citation_parser,
+        question_parser,
+    ):
+        rag_command_parser.add_argument(
+            "--similarity",
+            type=float,
+            default=ANSWER_CACHE_SIMILARITY,
+            help="Query embedding cosine similarity needed to reuse a cached answer",
+        )
+        rag_command_parser.add_argument(
+            "--min-overlap",
+            type=float,
+            default=ANSWER_CACHE_MIN_OVERLAP,
+            help="Fraction of retrieved documents a cached answer's retrieval must share",
+        )
+
     args = parser.parse_args()
 
     match args.command:
-        case "rag":
-            query = args.query
-            rrf_search_result = rrf_search(query, limit=5, evaluate=False)
-            results = rrf_search_result["results"]
-            titles_documents = []
-            titles_found = ""
-            for result in results:
-                titles_documents.append(f"{result['title']}\n{result['document']}")
-                titles_found += f"- {result['title']}\n"
-            titles_documents_text = "\n".join(titles_documents)
-            prompt = f"""Answer the question or provide information based on the provided documents. This should be tailored to Hoopla users. Hoopla is a movie streaming service.
-
-Query: {query}
-
-Documents:
-{titles_documents_text}
-
-Provide a comprehensive answer that addresses the query:"""
-            load_dotenv()
-            answer = generate_content(prompt)
-            print("Search Results:")
-            print(titles_found)
-            print("RAG Response:")
-            print(answer)
-
-        case "summarize":
-            query = args.query
-            limit = args.limit
-            rrf_search_result = rrf_search(query, limit=limit, evaluate=False)
-            results = rrf_search_result["results"]
-            titles_documents = []
-            titles_found = ""
-            for result in results:
-                titles_documents.append(f"{result['title']}\n{result['document']}")
-                titles_found += f"- {result['title']}\n"
-            titles_documents_text = "\n".join(titles_documents)
-            prompt = f"""
-Provide information useful to this query by synthesizing information from multiple search results in detail.
-The goal is to provide comprehensive information so that users know what their options are.
-Your response should be information-dense and concise, with several key pieces of information about the genre, plot, etc. of each movie.
-This should be tailored to Hoopla users. Hoopla is a movie streaming service.
-Query: {query}
-Search Results:
-{results}
-Provide a comprehensive 3–4 sentence answer that combines information from multiple sources:
-"""
-            load_dotenv()
-            answer = generate_content(prompt)
-            print("Search Results:")
-            print(titles_found)
-            print("Summarized Response:")
-            print(answer)
-        case "citations":
-            query = args.query
-            limit = args.limit
-            rrf_search_result = rrf_search(query, limit=limit, evaluate=False)
-            results = rrf_search_result["results"]
-            titles_documents = []
-            titles_found = ""
-            for result in results:
-                titles_documents.append(f"{result['title']}\n{result['document']}")
-                titles_found += f"- {result['title']}\n"
-            titles_documents_text = "\n".join(titles_documents)
-            prompt = f"""Answer the question or provide information based on the provided documents.
-
-This should be tailored to Hoopla users. Hoopla is a movie streaming service.
-
-If not enough information is available to give a good answer, say so but give as good of an answer as you can while citing the sources you have.
-
-Query: {query}
-
-Documents:
-{titles_documents_text}
-
-Instructions:
-- Provide a comprehensive answer that addresses the query
-- Cite sources using [1], [2], etc. format when referencing information
-- If sources disagree, mention the different viewpoints
-- If the answer isn't in the documents, say "I don't have enough information"
-- Be direct and informative
-
-Answer:"""
-            load_dotenv()
-            answer = generate_content(prompt)
-            print("Search Results:")
-            print(titles_found)
-            print("LLM Answer:")
-            print(answer)
-        case "question":
-            query = args.query
-            limit = args.limit
-            rrf_search_result = rrf_search(query, limit=limit, evaluate=False)
-            results = rrf_search_result["results"]
-            titles_documents = []
+        case "rag" | "summarize" | "citations" | "question":
+            limit = getattr(args, "limit", 5)
+            result = rag_command(
+                args.command, args.query, limit, args.similarity, args.min_overlap
+            )
             titles_found = ""
-            for result in results:
-                titles_documents.append(f"{result['title']}\n{result['document']}")
-                titles_found += f"- {result['title']}\n"
-            titles_documents_text = "\n".join(titles_documents)
-
-            load_dotenv()
-            prompt = f"""Answer the user's question based on the provided movies that are available on Hoopla.
-
-This should be tailored to Hoopla users. Hoopla is a movie streaming service.
-
-Question: {query}
-
-Documents:
-{titles_documents_text}
-
-Instructions:
-- Answer questions directly and concisely
-- Be casual and conversational
-- Don't be cringe or hype-y
-- Talk like a normal person would in a chat conversation
-
-Answer:"""
-            answer = generate_content(prompt)
+            for res in result["results"]:
+                titles_found += f"- {res['title']}\n"
             print("Search Results:")
             print(titles_found)
-            print("LLM Answer:")
-            print(answer)
+            print(ANSWER_LABELS[args.command])
+            print(result["answer"])
+            print(format_cache_stats(result["metadata"]["cache"]))
+            print(format_answer_cache_stats(result["metadata"]["answer_cache"]))
+            print(format_llm_stats(result["metadata"]["llm"]))
         case _:
             parser.print_help()
 
@@ -1,9 +1,6 @@
 import argparse
-import mimetypes
-import os
-from dotenv import load_dotenv
-from lib.search_utils import load_llm_client, GEMINI_FLASH_MODEL
-from google import genai
+from lib.image_pipeline import format_image_report, prepare_upload
+from lib.llm_gateway import format_llm_stats, get_llm_gateway
 
 
 def main():
@@ -13,15 +10,10 @@ def main():
         "--query", type=str, help="a text query to rewrite based on the image"
     )
     args = parser.parse_args()
-    mime_type, _ = mimetypes.guess_type(args.image)
-    mime_type = mime_type or "image/jpeg"
+    image_data, mime_type, image_report = prepare_upload(args.image)
 
-    image_file = open(args.image, "rb")
-    image_data = image_file.read()
-    image_file.close()
+    from google import genai
 
-    load_dotenv()
-    client = load_llm_client()
     prompt = f"""
     Given the included image and text query, rewrite the text query to improve search results from a movie database. Make sure to:
 - Synthesize visual and textual information
@@ -33,11 +25,13 @@ def main():
         genai.types.Part.from_bytes(mime_type=mime_type, data=image_data),
         prompt,
     ]
-    response = client.models.generate_content(model=GEMINI_FLASH_MODEL, contents=parts)
+    gateway = get_llm_gateway()
+    response = gateway.generate(parts)
 
     print(f"Rewritten query: {response.text.strip()}")
-    if response.usage_metadata is not None:
-        print(f"Total tokens:    {response.usage_metadata.total_token_count}")
+    print(f"Total tokens:    {response.total_tokens}")
+    print(format_image_report(image_report))
+    print(format_llm_stats(gateway.stats()))
 
 
 if __name__ == "__main__":
@@ -1,7 +1,7 @@
 import argparse
 from lib.search_utils import load_golden_dataset
 from lib.hybrid_search import rrf_search
-from lib.evaluation import evaluate_command
+from lib.evaluation import evaluate_command, routing_comparison_command
 
 
 def main():
@@ -13,7 +13,41 @@ def main():
         help="Number of results to evaluate (k for precision@k, recall@k)",
     )
 
+    parser.add_argument(
+        "--routing",
+        action="store_true",
+        help="Compare nDCG and latency of adaptive routing against the fixed pipeline",
+    )
+    parser.add_argument(
+        "--rerank-method",
+        type=str,
+        choices=["individual", "batch", "cross_encoder"],
+        help="Rerank stage to include in the routing comparison",
+    )
+
     args = parser.parse_args()
+    if args.routing:
+        report = routing_comparison_command(args.limit, args.rerank_method)
+        for query, res in report["results"].items():
+            decisions = res["decisions"]
+            print(f"Query: {query}")
+            print(
+                f"- nDCG@{args.limit}: fixed {res['fixed_ndcg']:.4f}, routed {res['routed_ndcg']:.4f}"
+            )
+            print(
+                f"- Latency: fixed {res['fixed_ms']:.1f} ms, routed {res['routed_ms']:.1f} ms"
+            )
+            print(
+                f"- Routing: semantic={decisions['semantic']}, depth={decisions['depth']}, rerank={decisions['rerank']}"
+            )
+            print()
+        print(
+            f"Mean nDCG@{args.limit}: fixed {report['fixed_ndcg']:.4f}, routed {report['routed_ndcg']:.4f}"
+        )
+        print(
+            f"Mean latency: fixed {report['fixed_ms']:.1f} ms, routed {report['routed_ms']:.1f} ms"
+        )
+        return
     # result = evaluate_command(args.limit)
 
     # print(f"k={args.limit}\n")
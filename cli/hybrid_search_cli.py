@@ -1,7 +1,19 @@
 import argparse
-from lib.hybrid_search import normalize, weighted_search, rrf_search, enhance_query
+import sys
+from lib.batch_search import DEFAULT_BATCH_SIZE, format_batch_summary
+from lib.doc_filter import build_named_filter
+from lib.hybrid_search import (
+    SPECULATIVE_DEADLINE,
+    normalize,
+    weighted_search,
+    rrf_search,
+    enhance_query,
+    batch_command,
+)
 from lib.search_utils import DEFAULT_ALPHA
+from lib.result_cache import format_cache_stats
 from lib.query_enhancment import evaluate
+from lib.sharded_search import DEFAULT_NUM_SHARDS, build_shards, sharded_search_command
 
 
 def main() -> None:
@@ -29,6 +41,12 @@ def main() -> None:
     weighted_search_parser.add_argument(
         "--limit", type=int, help="Limit the number of results", default=5, nargs="?"
     )
+    weighted_search_parser.add_argument(
+        "--filter",
+        action="append",
+        dest="filters",
+        help="Only return documents in this named filter (repeat to intersect)",
+    )
 
     rrf_search_parser = subparsers.add_parser(
         "rrf-search", help="Perform RRF hybrid search"
@@ -47,7 +65,7 @@ def main() -> None:
     rrf_search_parser.add_argument(
         "--enhance",
         type=str,
-        choices=["spell", "rewrite", "expand"],
+        choices=["spell", "rewrite", "expand", "local-expand"],
         help="Query enhancement method",
     )
     rrf_search_parser.add_argument(
@@ -60,6 +78,28 @@ def main() -> None:
     rrf_search_parser.add_argument(
         "--evaluate", action="store_true", help="Evaluate the search results"
     )
+    rrf_search_parser.add_argument(
+        "--adaptive",
+        action="store_true",
+        help="Let BM25 confidence decide whether to run the semantic leg, how deep to fuse and whether to rerank",
+    )
+    rrf_search_parser.add_argument(
+        "--filter",
+        action="append",
+        dest="filters",
+        help="Only return documents in this named filter (repeat to intersect)",
+    )
+    rrf_search_parser.add_argument(
+        "--speculative",
+        action="store_true",
+        help="Retrieve for the original query while --enhance runs, not after (fixed pipeline only)",
+    )
+    rrf_search_parser.add_argument(
+        "--deadline",
+        type=float,
+        default=SPECULATIVE_DEADLINE,
+        help="Seconds the enhanced query's results get before the original query's are used",
+    )
     enhance_query_parser = subparsers.add_parser(
         "enhance-query", help="Enhance a query"
     )
@@ -67,15 +107,101 @@ def main() -> None:
     enhance_query_parser.add_argument(
         "--enhance",
         type=str,
-        choices=["spell", "rewrite"],
+        choices=["spell", "rewrite", "expand", "local-expand"],
         help="Query enhancement method",
     )
 
+
+    build_shards_parser = subparsers.add_parser(
+        "build-shards", help="Partition the index and chunk embeddings into shards"
+    )
+    build_shards_parser.add_argument(
+        "--shards", type=int, default=DEFAULT_NUM_SHARDS, help="Number of shards"
+    )
+
+    sharded_search_parser = subparsers.add_parser(
+        "sharded-search", help="Search across shard worker processes"
+    )
+    sharded_search_parser.add_argument("query", type=str, help="Search query")
+    sharded_search_parser.add_argument(
+        "--mode",
+        type=str,
+        choices=["bm25", "semantic", "rrf"],
+        default="rrf",
+        help="Which retrieval to scatter across the shards",
+    )
+    sharded_search_parser.add_argument(
+        "--limit", type=int, help="Limit the number of results", default=5
+    )
+    sharded_search_parser.add_argument(
+        "--verify",
+        action="store_true",
+        help="Check bm25 results and scores against the unsharded index",
+    )
+    sharded_search_parser.add_argument(
+        "--filter",
+        action="append",
+        dest="filters",
+        help="Only return documents in this named filter (repeat to intersect)",
+    )
+
+    batch_parser = subparsers.add_parser(
+        "batch", help="Hybrid search every query of a JSONL file, streaming JSONL results"
+    )
+    batch_parser.add_argument(
+        "input",
+        type=str,
+        nargs="?",
+        default="-",
+        help='JSONL of {"query": ...} records or query strings, - for stdin',
+    )
+    batch_parser.add_argument(
+        "--output", "-o", type=str, default="-", help="JSONL results file, - for stdout"
+    )
+    batch_parser.add_argument(
+        "--mode",
+        type=str,
+        choices=["rrf", "weighted"],
+        default="rrf",
+        help="Fusion used for records that do not set their own",
+    )
+    batch_parser.add_argument("--k", type=int, default=60, help="RRF constant")
+    batch_parser.add_argument(
+        "--alpha", type=float, default=DEFAULT_ALPHA, help="Weighted search BM25 weight"
+    )
+    batch_parser.add_argument(
+        "--limit", type=int, default=5, help="Limit the number of results per query"
+    )
+    batch_parser.add_argument(
+        "--adaptive",
+        action="store_true",
+        help="Route RRF queries adaptively, skipping the semantic leg when BM25 is decisive",
+    )
+    batch_parser.add_argument(
+        "--batch-size",
+        type=int,
+        default=DEFAULT_BATCH_SIZE,
+        help="Queries embedded, searched and written between checkpoints",
+    )
+    batch_parser.add_argument(
+        "--checkpoint",
+        type=str,
+        help="Checkpoint file to resume from, <output>.checkpoint.json by default",
+    )
+
+    build_filter_parser = subparsers.add_parser(
+        "build-filter", help="Store a named doc id allowlist for --filter"
+    )
+    build_filter_parser.add_argument("name", type=str, help="Filter name")
+    build_filter_parser.add_argument(
+        "doc_ids", type=str, help='JSON file with a list of doc ids or {"doc_ids": [...]}'
+    )
+
     args = parser.parse_args()
 
     match args.command:
         case "weighted-search":
-            result = weighted_search(args.query, args.alpha, args.limit)
+            result = weighted_search(args.query, args.alpha, args.limit, args.filters)
 
             print(
                 f"Weighted Hybrid Search Results for '{result['query']}' (alpha={result['alpha']}):"
@@ -93,6 +219,7 @@ def main() -> None:
                     )
                 print(f"   {res['document'][:100]}...")
                 print()
+            print(format_cache_stats(result["metadata"]["cache"]))
         case "normalize":
             normalize(args.scores)
         case "rrf-search":
@@ -103,6 +230,10 @@ def main() -> None:
                 args.enhance,
                 args.rerank_method,
                 args.evaluate,
+                args.adaptive,
+                args.filters,
+                args.speculative,
+                args.deadline,
             )
             if result["enhanced_query"]:
                 print(
@@ -128,11 +259,66 @@ def main() -> None:
 
                 print(f"   {res['document'][:100]}...")
                 print()
+            print(format_cache_stats(result["metadata"]["cache"]))
+            routing = result["metadata"]["routing"]
+            if routing:
+                decisions = routing["decisions"]
+                signals = routing["signals"]
+                print(
+                    f"Routing: semantic={'run' if decisions['semantic'] else 'skipped'}, "
+                    f"depth={decisions['depth']}, "
+                    f"rerank={'run' if decisions['rerank'] else 'skipped'} "
+                    f"(bm25 margin {signals['bm25_margin']:.2f}, "
+                    f"title match {signals['title_match']}, "
+                    f"{signals['query_tokens']} query tokens)"
+                )
+            speculation = result["metadata"]["speculation"]
+            if speculation:
+                timings = ", ".join(
+                    f"{stage} {ms:.0f} ms" for stage, ms in speculation["timings_ms"].items()
+                )
+                print(
+                    f"Speculation: used {speculation['used']} query results after "
+                    f"{speculation['elapsed_ms']:.0f} ms "
+                    f"(deadline {speculation['deadline_ms']:.0f} ms; {timings})"
+                )
             if result["evaluate"] == True:
                 scores = evaluate(result["query"], result["results"])
                 for i, score in enumerate(scores, 1):
                     print(f"{i}. {result['results'][i - 1]['title']}: {score}/3")
 
+        case "enhance-query":
+            enhanced_query = enhance_query(args.query, args.enhance)
+            print(f"Enhanced query ({args.enhance}): '{args.query}' -> '{enhanced_query}'")
+        case "build-shards":
+            build_shards(args.shards)
+        case "sharded-search":
+            result = sharded_search_command(
+                args.query, args.mode, args.limit, args.verify, args.filters
+            )
+            print(
+                f"Sharded {result['mode']} results for '{result['query']}' ({result['num_shards']} shards):"
+            )
+            for i, res in enumerate(result["results"], 1):
+                print(f"{i}. {res['title']} ({res['score']:.4f})")
+            if result["matches_unsharded"] is not None:
+                print(f"Matches unsharded index: {result['matches_unsharded']}")
+        case "batch":
+            summary = batch_command(
+                args.input,
+                args.output,
+                args.mode,
+                args.k,
+                args.alpha,
+                args.limit,
+                args.adaptive,
+                args.batch_size,
+                args.checkpoint,
+            )
+            print(format_batch_summary(summary), file=sys.stderr)
+        case "build-filter":
+            doc_filter = build_named_filter(args.name, args.doc_ids)
+            print(f"Saved filter '{args.name}' with {len(doc_filter)} documents")
         case _:
             parser.print_help()
 
@@ -16,6 +16,19 @@ from lib.keyword_search import (
     tfidf_command,
     bm25_tf_command,
     bm25search_command,
+    batch_command,
+    postings_report_command,
+    impact_report_command,
+    suggest_command,
+)
+from lib.batch_search import DEFAULT_BATCH_SIZE, format_batch_summary
+from lib.generations import (
+    GENERATIONS_KEPT,
+    current_generation,
+    gc_generations,
+    list_generations,
+    read_manifest,
+    verify_generation,
 )
 from lib.search_utils import BM25_K1, BM25_B, DEFAULT_SEARCH_LIMIT
 
@@ -25,8 +38,23 @@ def main() -> None:
     subparsers = parser.add_subparsers(dest="command", help="Available commands")
 
     search_parser = subparsers.add_parser("search", help="Search movies using BM25")
-    search_parser.add_argument("query", type=str, help="Search query")
+    search_parser.add_argument(
+        "query",
+        type=str,
+        help='Search query, wrap phrases in double quotes e.g. \'"dark knight" gotham\'',
+    )
+    search_parser.add_argument(
+        "--limit",
+        type=int,
+        help="Limit the number of results",
+        default=DEFAULT_SEARCH_LIMIT,
+    )
     build_parser = subparsers.add_parser("build", help="Build index")
+    build_parser.add_argument(
+        "--positional",
+        action="store_true",
+        help="Also index token positions for phrase and proximity queries",
+    )
 
     tf_parser = subparsers.add_parser("tf", help="Get term frequency")
     tf_parser.add_argument("doc_id", type=int, help="Document ID")
@@ -65,17 +93,114 @@ def main() -> None:
         default=DEFAULT_SEARCH_LIMIT,
         nargs="?",
     )
+    bm25_search_parser.add_argument(
+        "--exact",
+        action="store_true",
+        help="Score with the BM25 formula instead of the precomputed quantized impacts",
+    )
+    bm25_search_parser.add_argument(
+        "--filter",
+        action="append",
+        dest="filters",
+        help="Only return documents in this named filter (repeat to intersect)",
+    )
+
+    batch_parser = subparsers.add_parser(
+        "batch", help="BM25 search every query of a JSONL file, streaming JSONL results"
+    )
+    batch_parser.add_argument(
+        "input",
+        type=str,
+        nargs="?",
+        default="-",
+        help='JSONL of {"query": ...} records or query strings, - for stdin',
+    )
+    batch_parser.add_argument(
+        "--output", "-o", type=str, default="-", help="JSONL results file, - for stdout"
+    )
+    batch_parser.add_argument(
+        "--limit",
+        type=int,
+        help="Limit the number of results per query",
+        default=DEFAULT_SEARCH_LIMIT,
+    )
+    batch_parser.add_argument(
+        "--exact",
+        action="store_true",
+        help="Score with the BM25 formula instead of the precomputed quantized impacts",
+    )
+    batch_parser.add_argument(
+        "--batch-size",
+        type=int,
+        default=DEFAULT_BATCH_SIZE,
+        help="Queries read and written between checkpoints",
+    )
+    batch_parser.add_argument(
+        "--checkpoint",
+        type=str,
+        help="Checkpoint file to resume from, <output>.checkpoint.json by default",
+    )
+
+    postings_report_parser = subparsers.add_parser(
+        "postings-report",
+        help="Compare compressed postings against uncompressed arrays",
+    )
+    postings_report_parser.add_argument(
+        "queries", type=str, nargs="+", help="Queries to time BM25 scoring with"
+    )
+    postings_report_parser.add_argument(
+        "--repeats", type=int, default=20, help="Times to run every query"
+    )
+
+    impact_report_parser = subparsers.add_parser(
+        "impact-report",
+        help="Compare quantized impact scoring against exact BM25",
+    )
+    impact_report_parser.add_argument(
+        "queries", type=str, nargs="+", help="Queries to time BM25 scoring with"
+    )
+    impact_report_parser.add_argument(
+        "--limit", type=int, default=DEFAULT_SEARCH_LIMIT, help="Top-k to retrieve"
+    )
+    impact_report_parser.add_argument(
+        "--repeats", type=int, default=20, help="Times to run every query"
+    )
+
+    suggest_parser = subparsers.add_parser(
+        "suggest", help="Typeahead completions for a title or word prefix"
+    )
+    suggest_parser.add_argument("prefix", type=str, help="Text typed so far")
+    suggest_parser.add_argument(
+        "--limit", type=int, default=DEFAULT_SEARCH_LIMIT, help="Completions per kind"
+    )
+
+    subparsers.add_parser("generations", help="List the published index generations")
+    verify_generation_parser = subparsers.add_parser(
+        "verify-generation", help="Check an index generation against its manifest"
+    )
+    verify_generation_parser.add_argument(
+        "generation", type=str, nargs="?", help="Generation to check, the current by default"
+    )
+    gc_generations_parser = subparsers.add_parser(
+        "gc-generations", help="Remove old index generations"
+    )
+    gc_generations_parser.add_argument(
+        "--keep",
+        type=int,
+        default=GENERATIONS_KEPT,
+        help="Newest generations to keep, the current one is always kept",
+    )
     args = parser.parse_args()
 
     match args.command:
         case "search":
             print(f"Searching for: {args.query}")
-            results = search_command(args.query)
+            results = search_command(args.query, args.limit)
             for index, result in enumerate(results, 1):
-                print(f"{index}. {result['title']} {result['id']}")
+                print(f"{index}. {result['title']} {result['doc_id']}")
         case "build":
             print("Building index...")
-            build_command()
+            build_command(args.positional)
         case "tf":
             result = tf_command(args.doc_id, args.term)
             print(f"Term frequency: {result}")
@@ -96,9 +221,79 @@ def main() -> None:
                 f"BM25 TF score of '{args.term}' in document '{args.doc_id}': {bm25tf:.2f}"
             )
         case "bm25search":
-            bm25 = bm25search_command(args.query, args.limit)
+            bm25 = bm25search_command(
+                args.query, args.limit, args.exact, args.filters
+            )
             for dic in bm25:
-                print(f"({dic['id']}) {dic['title']} {dic['score']:.2f}")
+                print(f"({dic['doc_id']}) {dic['title']} {dic['score']:.2f}")
+        case "batch":
+            summary = batch_command(
+                args.input,
+                args.output,
+                args.limit,
+                args.exact,
+                args.batch_size,
+                args.checkpoint,
+            )
+            print(format_batch_summary(summary), file=sys.stderr)
+        case "postings-report":
+            report = postings_report_command(args.queries, args.repeats)
+            ratio = report["uncompressed_bytes"] / max(report["compressed_bytes"], 1)
+            print(f"Terms: {report['terms']}, postings: {report['postings']}")
+            print(
+                f"Compressed:   {report['compressed_bytes'] / 1024:.1f} KiB, "
+                f"{report['compressed_ms']:.3f} ms/query"
+            )
+            print(
+                f"Uncompressed: {report['uncompressed_bytes'] / 1024:.1f} KiB, "
+                f"{report['uncompressed_ms']:.3f} ms/query"
+            )
+            print(f"Compression ratio: {ratio:.2f}x")
+        case "impact-report":
+            report = impact_report_command(args.queries, args.limit, args.repeats)
+            print(f"Impact index: {report['impact_bytes'] / 1024:.1f} KiB")
+            print(f"Exact:  {report['exact_ms']:.3f} ms/query")
+            print(f"Impact: {report['impact_ms']:.3f} ms/query")
+            print(
+                f"Postings accumulated: {report['accumulated']}/{report['postings']}"
+            )
+            print(f"Top-{report['limit']} overlap with exact: {report['overlap']:.1%}")
+            print(f"Max quantization error: {report['max_error']:.4f}")
+        case "suggest":
+            if args.limit < 1:
+                print(f"--limit must be at least 1, got {args.limit}")
+                sys.exit(1)
+            suggestions = suggest_command(args.prefix, args.limit)
+            print(f"Titles for '{suggestions['prefix']}':")
+            for suggestion in suggestions["titles"]:
+                print(f"  ({suggestion['doc_id']}) {suggestion['title']}")
+            print("Terms:")
+            for suggestion in suggestions["terms"]:
+                print(f"  {suggestion['term']}")
+            print(f"({suggestions['elapsed_ms']:.3f} ms)")
+        case "generations":
+            current = current_generation()
+            for generation in list_generations():
+                manifest = read_manifest(generation)
+                size = sum(f["bytes"] for f in manifest["files"].values())
+                marker = "*" if generation == current else " "
+                print(
+                    f"{marker} {generation} {len(manifest['files'])} files "
+                    f"{size / 1e6:.1f} MB (parent {manifest['parent']})"
+                )
+        case "verify-generation":
+            generation = args.generation or current_generation()
+            if generation is None:
+                print("No index generation has been published, run `build` first")
+                sys.exit(1)
+            mismatched = verify_generation(generation)
+            if mismatched:
+                print(f"Generation {generation} is corrupt: {', '.join(mismatched)}")
+                sys.exit(1)
+            print(f"Generation {generation} matches its manifest")
+        case "gc-generations":
+            for generation in gc_generations(args.keep):
+                print(f"Removed generation {generation}")
         case _:
             parser.print_help()
 
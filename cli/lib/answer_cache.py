@@ -0,0 +1,240 @@
+import os
+import time
+from functools import lru_cache
+
+import numpy as np
+
+from .result_cache import (
+    RESULT_CACHE_SAVE_EVERY,
+    index_generation,
+    read_pickle,
+    write_pickle_atomic,
+)
+from .search_utils import CACHE_PATH
+
+ANSWER_CACHE_PATH = os.path.join(CACHE_PATH, "answer_cache.pkl")
+# a cached answer is served for a query this similar (cosine of the query embeddings) ...
+ANSWER_CACHE_SIMILARITY = 0.9
+# ... whose retrieval shares at least this fraction of documents with the cached one
+ANSWER_CACHE_MIN_OVERLAP = 0.6
+ANSWER_CACHE_MAX_ENTRIES = 1000
+ANSWER_CACHE_TTL = 7 * 24 * 3600  # seconds
+# bumped when entries change shape, older cache files are then ignored
+ANSWER_CACHE_VERSION = 2
+
+
+def retrieval_overlap(doc_ids: list[int], cached_doc_ids: list[int]) -> float:
+    """Fraction of the larger of the two retrieved sets found in both"""
+    size = max(len(doc_ids), len(cached_doc_ids))
+    if size == 0:
+        return 1.0
+    return len(set(doc_ids) & set(cached_doc_ids)) / size
+
+
+class AnswerCache:
+    """Generated answers keyed by query embedding instead of query text
+
+    Paraphrases ("movies like paddington", "films like paddington") retrieve the same
+    documents and would get the same answer, so a new query reuses a cached answer when its
+    embedding is close to the cached query's and its retrieval overlaps enough. Embeddings
+    are kept as one unit-normalized matrix, so a lookup is one matrix-vector product.
+    """
+
+    def __init__(
+        self,
+        max_entries: int = ANSWER_CACHE_MAX_ENTRIES,
+        ttl: float = ANSWER_CACHE_TTL,
+        path: str = ANSWER_CACHE_PATH,
+    ):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.path = path
+        self.generation = index_generation()
+        self.embeddings = np.zeros((0, 0), dtype=np.float32)  # entry -> unit query embedding
+        self.namespaces = np.zeros(0, dtype=object)  # entry -> command and parameters
+        self.created = np.zeros(0, dtype=np.float64)
+        self.used = np.zeros(0, dtype=np.float64)  # last hit, for LRU eviction
+        # entry -> {"query", "doc_ids", "answer", "results"}
+        self.entries: list[dict] = []
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+        self.unsaved_lookups = 0
+
+    def keep(self, mask: np.ndarray) -> None:
+        self.embeddings = self.embeddings[mask]
+        self.namespaces = self.namespaces[mask]
+        self.created = self.created[mask]
+        self.used = self.used[mask]
+        self.entries = [entry for entry, kept in zip(self.entries, mask) if kept]
+
+    def expire(self, now: float) -> None:
+        expired = now - self.created > self.ttl
+        if expired.any():
+            self.expirations += int(expired.sum())
+            self.keep(~expired)
+
+    def lookup(
+        self,
+        namespace: str,
+        embedding: np.ndarray,
+        doc_ids: list[int],
+        similarity: float = ANSWER_CACHE_SIMILARITY,
+        min_overlap: float = ANSWER_CACHE_MIN_OVERLAP,
+    ) -> tuple[dict | None, dict]:
+        """The most similar cached entry passing both thresholds, and how close it was
+
+        Returns:
+            The entry or None, and the similarity and overlap of the entry for a hit
+        """
+        now = time.time()
+        self.expire(now)
+        query = embedding / max(float(np.linalg.norm(embedding)), 1e-12)
+        if len(self.entries) and self.embeddings.shape[1] == len(query):
+            similarities = self.embeddings @ query.astype(np.float32)
+            similarities[self.namespaces != namespace] = -np.inf
+            for i in np.argsort(-similarities, kind="stable"):
+                if similarities[i] < similarity:
+                    break
+                overlap = retrieval_overlap(doc_ids, self.entries[i]["doc_ids"])
+                if overlap >= min_overlap:
+                    self.used[i] = now
+                    self.hits += 1
+                    return self.entries[i], {
+                        "similarity": round(float(similarities[i]), 4),
+                        "overlap": round(overlap, 4),
+                    }
+        self.misses += 1
+        return None, {}
+
+    def put(
+        self,
+        namespace: str,
+        embedding: np.ndarray,
+        query: str,
+        results: list[dict],
+        answer,
+    ) -> None:
+        """Cache an answer with the results it was generated from
+
+        The results are served with the answer on a hit: citation markers and summaries
+        refer to these documents in this order, not to the new query's retrieval.
+        """
+        now = time.time()
+        row = (embedding / max(float(np.linalg.norm(embedding)), 1e-12)).astype(np.float32)
+        if len(self.entries) == 0 or self.embeddings.shape[1] != len(row):
+            # first entry, or the embedding model changed since the cache was written
+            self.keep(np.zeros(len(self.entries), dtype=bool))
+            self.embeddings = np.zeros((0, len(row)), dtype=np.float32)
+        self.embeddings = np.vstack([self.embeddings, row])
+        self.namespaces = np.append(self.namespaces, np.array([namespace], dtype=object))
+        self.created = np.append(self.created, now)
+        self.used = np.append(self.used, now)
+        self.entries.append(
+            {
+                "query": query,
+                "doc_ids": [result["doc_id"] for result in results],
+                "answer": answer,
+                "results": results,
+            }
+        )
+        self.evict()
+
+    def evict(self) -> None:
+        # least recently used entries go first until the entry budget holds again
+        excess = len(self.entries) - self.max_entries
+        if excess <= 0:
+            return
+        mask = np.ones(len(self.entries), dtype=bool)
+        mask[np.argsort(self.used, kind="stable")[:excess]] = False
+        self.keep(mask)
+        self.evictions += excess
+
+    def stats(self, hit: bool | None = None, **closeness: float) -> dict:
+        lookups = self.hits + self.misses
+        stats = {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / lookups, 3) if lookups else 0.0,
+            "evictions": self.evictions,
+            "expirations": self.expirations,
+            "entries": len(self.entries),
+        }
+        if hit is not None:
+            stats["hit"] = hit
+        return {**stats, **closeness}
+
+    def load(self) -> None:
+        saved = read_pickle(self.path)
+        if saved is None:
+            return
+        self.hits = saved["hits"]
+        self.misses = saved["misses"]
+        self.evictions = saved["evictions"]
+        self.expirations = saved["expirations"]
+        if (
+            saved["generation"] != self.generation
+            or saved.get("version") != ANSWER_CACHE_VERSION
+        ):
+            # the index was rebuilt since these answers were generated, or they predate
+            # the current entry format
+            return
+        self.embeddings = saved["embeddings"]
+        self.namespaces = saved["namespaces"]
+        self.created = saved["created"]
+        self.used = saved["used"]
+        self.entries = saved["entries"]
+        self.evict()
+
+    def save(self) -> None:
+        write_pickle_atomic(
+            self.path,
+            {
+                "version": ANSWER_CACHE_VERSION,
+                "generation": self.generation,
+                "embeddings": self.embeddings,
+                "namespaces": self.namespaces,
+                "created": self.created,
+                "used": self.used,
+                "entries": self.entries,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "expirations": self.expirations,
+            },
+        )
+        self.unsaved_lookups = 0
+
+    def save_lookup(self, stored: bool) -> None:
+        # as ResultCache: new answers are written at once, hits in batches
+        self.unsaved_lookups += 1
+        if stored or self.unsaved_lookups >= RESULT_CACHE_SAVE_EVERY:
+            self.save()
+
+
+@lru_cache(maxsize=1)
+def get_answer_cache() -> AnswerCache:
+    answer_cache = AnswerCache()
+    answer_cache.load()
+    return answer_cache
+
+
+@lru_cache(maxsize=1)
+def get_query_encoder():
+    # only the bi-encoder is needed, not the document embeddings
+    from .semantic_search import SemanticSearch
+
+    return SemanticSearch()
+
+
+def format_answer_cache_stats(stats: dict) -> str:
+    closeness = ""
+    if stats.get("hit"):
+        closeness = f", similarity {stats['similarity']:.3f}, overlap {stats['overlap']:.0%}"
+    # a result cache hit returns the whole response without consulting the answer cache
+    status = {True: "hit", False: "miss"}.get(stats.get("hit"), "not consulted")
+    return (
+        f"Answer cache: {status} "
+        f"(hit rate {stats['hit_rate']:.1%}, {stats['entries']} entries{closeness})"
+    )
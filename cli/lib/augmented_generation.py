@@ -0,0 +1,157 @@
+from .answer_cache import (
+    ANSWER_CACHE_MIN_OVERLAP,
+    ANSWER_CACHE_SIMILARITY,
+    get_answer_cache,
+    get_query_encoder,
+)
+from .hybrid_search import rrf_search
+from .llm_gateway import generate_text, get_llm_gateway
+from .result_cache import cached_result
+
+
+def rag_prompt(query: str, results: list[dict], titles_documents_text: str) -> str:
+    return f"""Answer the question or provide information based on the provided documents. This should be tailored to Hoopla users. Hoopla is a movie streaming service.
+
+Query: {query}
+
+Documents:
+{titles_documents_text}
+
+Provide a comprehensive answer that addresses the query:"""
+
+
+def summarize_prompt(query: str, results: list[dict], titles_documents_text: str) -> str:
+    return f"""
+Provide information useful to this query by synthesizing information from multiple search results in detail.
+The goal is to provide comprehensive information so that users know what their options are.
+Your response should be information-dense and concise, with several key pieces of information about the genre, plot, etc. of each movie.
+This should be tailored to Hoopla users. Hoopla is a movie streaming service.
+Query: {query}
+Search Results:
+{results}
+Provide a comprehensive 3–4 sentence answer that combines information from multiple sources:
+"""
+
+
+def citations_prompt(query: str, results: list[dict], titles_documents_text: str) -> str:
+    return f"""Answer the question or provide information based on the provided documents.
+
+This should be tailored to Hoopla users. Hoopla is a movie streaming service.
+
+If not enough information is available to give a good answer, say so but give as good of an answer as you can while citing the sources you have.
+
+Query: {query}
+
+Documents:
+{titles_documents_text}
+
+Instructions:
+- Provide a comprehensive answer that addresses the query
+- Cite sources using [1], [2], etc. format when referencing information
+- If sources disagree, mention the different viewpoints
+- If the answer isn't in the documents, say "I don't have enough information"
+- Be direct and informative
+
+Answer:"""
+
+
+def question_prompt(query: str, results: list[dict], titles_documents_text: str) -> str:
+    return f"""Answer the user's question based on the provided movies that are available on Hoopla.
+
+This should be tailored to Hoopla users. Hoopla is a movie streaming service.
+
+Question: {query}
+
+Documents:
+{titles_documents_text}
+
+Instructions:
+- Answer questions directly and concisely
+- Be casual and conversational
+- Don't be cringe or hype-y
+- Talk like a normal person would in a chat conversation
+
+Answer:"""
+
+
+PROMPTS = {
+    "rag": rag_prompt,
+    "summarize": summarize_prompt,
+    "citations": citations_prompt,
+    "question": question_prompt,
+}
+
+
+def generate_answer(
+    command: str,
+    query: str,
+    limit: int = 5,
+    similarity: float = ANSWER_CACHE_SIMILARITY,
+    min_overlap: float = ANSWER_CACHE_MIN_OVERLAP,
+    answer_lookup: dict | None = None,
+) -> dict:
+    """Retrieve and answer, reusing the answer of a close enough paraphrase
+
+    answer_lookup, when given, receives whether the answer cache hit and how close the
+    cached query was; it is kept out of the returned dict, which the result cache stores.
+    """
+    rrf_search_result = rrf_search(query, limit=limit, evaluate=False)
+    results = rrf_search_result["results"]
+    doc_ids = [result["doc_id"] for result in results]
+    # a paraphrase of an answered query that retrieves the same documents gets its answer
+    namespace = f"{command}:{limit}"
+    embedding = get_query_encoder().generate_embedding(query)
+    answer_cache = get_answer_cache()
+    cached, closeness = answer_cache.lookup(
+        namespace, embedding, doc_ids, similarity, min_overlap
+    )
+    if cached is not None:
+        answer = cached["answer"]
+        # the answer's citations and summary refer to the documents it was generated from
+        results = cached["results"]
+        closeness["cached_query"] = cached["query"]
+    else:
+        titles_documents = []
+        for result in results:
+            titles_documents.append(f"{result['title']}\n{result['document']}")
+        titles_documents_text = "\n".join(titles_documents)
+        prompt = PROMPTS[command](query, results, titles_documents_text)
+        answer = generate_text(prompt)
+        answer_cache.put(namespace, embedding, query, results, answer)
+    answer_cache.save_lookup(stored=cached is None)
+    if answer_lookup is not None:
+        answer_lookup.update(hit=cached is not None, **closeness)
+    return {
+        "query": query,
+        "command": command,
+        "results": results,
+        "answer": answer,
+        "search_cache": rrf_search_result["metadata"]["cache"],
+    }
+
+
+def rag_command(
+    command: str,
+    query: str,
+    limit: int = 5,
+    similarity: float = ANSWER_CACHE_SIMILARITY,
+    min_overlap: float = ANSWER_CACHE_MIN_OVERLAP,
+) -> dict:
+    answer_lookup: dict = {}
+    result, cache_stats = cached_result(
+        f"rag:{command}",
+        query,
+        lambda: generate_answer(
+            command, query, limit, similarity, min_overlap, answer_lookup
+        ),
+        limit=limit,
+        similarity=similarity,
+        min_overlap=min_overlap,
+    )
+    # like the result cache stats, outside cached_result so a hit never replays old numbers
+    result["metadata"] = {
+        "cache": cache_stats,
+        "answer_cache": get_answer_cache().stats(**answer_lookup),
+        "llm": get_llm_gateway().stats(),
+    }
+    return result
@@ -0,0 +1,174 @@
+import contextlib
+import itertools
+import json
+import os
+import sys
+import time
+from typing import Callable, Iterable, Iterator
+
+# queries read, searched and written together; memory is bounded by one batch
+DEFAULT_BATCH_SIZE = 64
+
+
+def parse_record(line: str, line_number: int) -> dict:
+    """A query record from a JSONL line: {"query": ..., optional "id" and overrides}
+
+    A bare JSON string is taken as the query. Malformed lines become records carrying an
+    error, so they are reported in the output rather than stopping the batch.
+    """
+    record = {"line": line_number}
+    try:
+        value = json.loads(line)
+    except json.JSONDecodeError as e:
+        return {**record, "error": f"Invalid JSON: {e}"}
+    if isinstance(value, str):
+        value = {"query": value}
+    if not isinstance(value, dict) or not isinstance(value.get("query"), str):
+        return {**record, "error": "Expected a query string or an object with a 'query' string"}
+    return {**value, **record}
+
+
+def timed(search: Callable[[], list[dict]], shared_ms: float = 0.0) -> dict:
+    """Run one query's search, timing it and capturing its error instead of raising
+
+    shared_ms is this query's part of work done once for the whole batch, such as encoding
+    every query of the batch together.
+    """
+    start = time.perf_counter()
+    try:
+        results = search()
+    except Exception as e:
+        return {"error": f"{type(e).__name__}: {e}"}
+    return {
+        "results": results,
+        "elapsed_ms": round((time.perf_counter() - start) * 1000 + shared_ms, 3),
+    }
+
+
+def read_checkpoint(checkpoint_path: str | None, input_path: str) -> dict | None:
+    if checkpoint_path is None or not os.path.exists(checkpoint_path):
+        return None
+    with open(checkpoint_path, "r") as f:
+        checkpoint = json.load(f)
+    if checkpoint["input"] != input_path:
+        raise ValueError(
+            f"Checkpoint {checkpoint_path} belongs to input {checkpoint['input']}, "
+            f"not {input_path}"
+        )
+    return checkpoint
+
+
+def write_checkpoint(checkpoint_path: str, checkpoint: dict) -> None:
+    temp_path = f"{checkpoint_path}.tmp"
+    with open(temp_path, "w") as f:
+        json.dump(checkpoint, f)
+    os.replace(temp_path, checkpoint_path)
+
+
+def batched(records: Iterable[dict], batch_size: int) -> Iterator[list[dict]]:
+    iterator = iter(records)
+    while batch := list(itertools.islice(iterator, batch_size)):
+        yield batch
+
+
+def run_batch(
+    search_batch: Callable[[list[dict]], list[dict]],
+    input_path: str = "-",
+    output_path: str = "-",
+    batch_size: int = DEFAULT_BATCH_SIZE,
+    checkpoint_path: str | None = None,
+) -> dict:
+    """Stream JSONL query records through search_batch and write one JSONL result per line
+
+    search_batch gets the valid records of a batch and returns one {"results", "elapsed_ms"}
+    or {"error"} dict per record, in order. After every batch the output is flushed and the
+    checkpoint records how many input lines are done and how long the output was, so a rerun
+    after a crash skips those lines and drops any partial output written after them; an
+    output missing or shorter than that discards the checkpoint and the run starts over.
+    "-" reads stdin / writes stdout; a checkpoint defaults to <output>.checkpoint.json for
+    file outputs.
+
+    Returns:
+        Totals of the run: queries, errors, seconds and the line it resumed from
+    """
+    if checkpoint_path is None and output_path != "-":
+        checkpoint_path = f"{output_path}.checkpoint.json"
+    checkpoint = read_checkpoint(checkpoint_path, input_path)
+    if checkpoint and output_path != "-" and (
+        not os.path.exists(output_path)
+        or os.path.getsize(output_path) < checkpoint["output_bytes"]
+    ):
+        # truncating up to output_bytes would pad the missing part with NULs
+        print(
+            f"Output {output_path} is shorter than checkpoint {checkpoint_path} records, "
+            "starting over",
+            file=sys.stderr,
+        )
+        checkpoint = None
+    offset = checkpoint["offset"] if checkpoint else 0
+    totals = {
+        "queries": checkpoint["queries"] if checkpoint else 0,
+        "errors": checkpoint["errors"] if checkpoint else 0,
+    }
+
+    input_file = sys.stdin if input_path == "-" else open(input_path, "r")
+    if output_path == "-":
+        output_file = sys.stdout
+    else:
+        output_file = open(output_path, "a" if checkpoint else "w")
+        if checkpoint:
+            output_file.truncate(checkpoint["output_bytes"])
+    start = time.perf_counter()
+    try:
+        # anything the engines print goes to stderr so the JSONL stream stays parseable
+        with contextlib.redirect_stdout(sys.stderr):
+            lines = itertools.islice(input_file, offset, None)
+            records = (
+                parse_record(line, line_number)
+                for line_number, line in enumerate(lines, offset)
+                if line.strip()
+            )
+            for batch in batched(records, batch_size):
+                valid = [record for record in batch if "error" not in record]
+                responses = iter(search_batch(valid) if valid else [])
+                for record in batch:
+                    response = record if "error" in record else next(responses)
+                    output = {
+                        "id": record.get("id", record["line"]),
+                        "query": record.get("query"),
+                        **{key: response[key] for key in ("results", "elapsed_ms", "error") if key in response},
+                    }
+                    output_file.write(json.dumps(output) + "\n")
+                    totals["queries"] += 1
+                    totals["errors"] += "error" in output
+                output_file.flush()
+                if checkpoint_path is not None:
+                    write_checkpoint(
+                        checkpoint_path,
+                        {
+                            "input": input_path,
+                            "offset": batch[-1]["line"] + 1,
+                            "output_bytes": output_file.tell() if output_path != "-" else 0,
+                            **totals,
+                        },
+                    )
+    finally:
+        if input_file is not sys.stdin:
+            input_file.close()
+        if output_file is not sys.stdout:
+            output_file.close()
+
+    if checkpoint_path is not None and os.path.exists(checkpoint_path):
+        # the run finished, a new run over the same output starts from scratch
+        os.remove(checkpoint_path)
+    seconds = time.perf_counter() - start
+    return {**totals, "seconds": seconds, "resumed_from": offset}
+
+
+def format_batch_summary(summary: dict) -> str:
+    rate = summary["queries"] / summary["seconds"] if summary["seconds"] else 0.0
+    resumed = f", resumed from line {summary['resumed_from']}" if summary["resumed_from"] else ""
+    return (
+        f"Processed {summary['queries']} queries ({summary['errors']} errors) in "
+        f"{summary['seconds']:.1f}s, {rate:.1f} queries/sec{resumed}"
+    )
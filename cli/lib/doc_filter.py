@@ -0,0 +1,95 @@
+import json
+import os
+from functools import lru_cache
+
+import numpy as np
+
+from .result_cache import invalidate_result_cache
+from .search_utils import CACHE_PATH
+
+FILTERS_PATH = os.path.join(CACHE_PATH, "filters")
+
+
+class DocFilter:
+    """Allowlist of doc ids as a packed bitmap, one bit per id
+
+    Engines turn it into a boolean mask over their own doc ordinals (or chunk rows) once per
+    query and apply it before scoring or top-k, so no result outside the filter is ever
+    fetched and then thrown away.
+    """
+
+    def __init__(self, bits: np.ndarray, size: int, name: str | None = None):
+        self.bits = bits  # np.packbits of the allowed ids, bit i is doc id i
+        self.size = size  # ids >= size are never allowed
+        self.name = name
+
+    @classmethod
+    def from_doc_ids(cls, doc_ids, name: str | None = None) -> "DocFilter":
+        doc_ids = np.asarray(list(doc_ids), dtype=np.int64)
+        size = int(doc_ids.max()) + 1 if len(doc_ids) else 0
+        allowed = np.zeros(size, dtype=bool)
+        allowed[doc_ids] = True
+        return cls(np.packbits(allowed), size, name)
+
+    def contains(self, doc_ids: np.ndarray) -> np.ndarray:
+        """Boolean mask of which doc_ids pass the filter"""
+        doc_ids = np.asarray(doc_ids, dtype=np.int64)
+        inside = (doc_ids >= 0) & (doc_ids < self.size)
+        mask = np.zeros(len(doc_ids), dtype=bool)
+        ids = doc_ids[inside]
+        mask[inside] = ((self.bits[ids >> 3] >> (7 - (ids & 7))) & 1).astype(bool)
+        return mask
+
+    def __and__(self, other: "DocFilter") -> "DocFilter":
+        size = min(self.size, other.size)
+        length = (size + 7) // 8
+        # the smaller filter's padding bits are zero, so no id >= size survives
+        bits = self.bits[:length] & other.bits[:length]
+        name = None
+        if self.name and other.name:
+            name = f"{self.name}+{other.name}"
+        return DocFilter(bits, size, name)
+
+    def __len__(self) -> int:
+        return int(np.unpackbits(self.bits).sum())
+
+    def save(self, path: str) -> None:
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        np.savez(path, bits=self.bits, size=np.int64(self.size))
+
+
+def filter_path(name: str) -> str:
+    return os.path.join(FILTERS_PATH, f"{name}.npz")
+
+
+def build_named_filter(name: str, doc_ids_path: str) -> DocFilter:
+    """Store the doc ids of a JSON list (or a {"doc_ids": [...]} object) as a named filter"""
+    with open(doc_ids_path, "r") as f:
+        doc_ids = json.load(f)
+    if isinstance(doc_ids, dict):
+        doc_ids = doc_ids["doc_ids"]
+    doc_filter = DocFilter.from_doc_ids(doc_ids, name)
+    doc_filter.save(filter_path(name))
+    load_named_filter.cache_clear()
+    # cached results are keyed by filter name, not by its contents
+    invalidate_result_cache()
+    return doc_filter
+
+
+@lru_cache(maxsize=32)
+def load_named_filter(name: str) -> DocFilter:
+    path = filter_path(name)
+    if not os.path.exists(path):
+        raise FileNotFoundError(f"Filter '{name}' not found at {path}")
+    with np.load(path) as arrays:
+        return DocFilter(arrays["bits"], int(arrays["size"]), name)
+
+
+def resolve_filters(names: list[str] | None) -> DocFilter | None:
+    """The intersection of the named filters, or None when no filter is requested"""
+    if not names:
+        return None
+    doc_filter = load_named_filter(names[0])
+    for name in names[1:]:
+        doc_filter = doc_filter & load_named_filter(name)
+    return doc_filter
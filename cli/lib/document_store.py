@@ -0,0 +1,177 @@
+import json
+import os
+from functools import lru_cache
+from typing import Iterator
+
+import numpy as np
+
+from lib.generations import GENERATIONS_PATH, index_dir
+from lib.search_utils import DATA_PATH_MOVIES, load_movies
+
+FIELDS = ("title", "description")
+
+
+class DocumentStore:
+    """Columnar, memory-mapped view of the movie catalog.
+
+    Rows are stored in catalog order. `ids` holds the movie id of every row, the
+    title and description of every row live back to back in one UTF-8 blob, and
+    `offsets[row * 2 + field]` / `offsets[row * 2 + field + 1]` delimit each field.
+    `row_of_id` maps a movie id straight to its row (-1 when the id is unknown).
+
+    Indexing the store by movie id returns the same {id, title, description} dict
+    that `load_movies()` yields, so it can stand in for the old docmaps.
+    """
+
+    def __init__(self, store_dir: str | None = None):
+        store_dir = store_dir or index_dir()
+        # the index directory every engine searching this catalog should load from
+        self.store_dir = store_dir
+        self.ids = None
+        self.offsets = None
+        self.row_of_id = None
+        self.blob = None
+
+        self.ids_path = os.path.join(store_dir, "docstore_ids.npy")
+        self.offsets_path = os.path.join(store_dir, "docstore_offsets.npy")
+        self.row_of_id_path = os.path.join(store_dir, "docstore_row_of_id.npy")
+        self.blob_path = os.path.join(store_dir, "docstore_text.bin")
+        self.meta_path = os.path.join(store_dir, "docstore_meta.json")
+
+    def build(self, movies: list[dict] | None = None) -> None:
+        if movies is None:
+            movies = load_movies()
+        ids = np.fromiter((movie["id"] for movie in movies), dtype=np.int64)
+        offsets = np.zeros(len(movies) * len(FIELDS) + 1, dtype=np.int64)
+        chunks: list[bytes] = []
+        position = 0
+        for row, movie in enumerate(movies):
+            for field_idx, field in enumerate(FIELDS):
+                data = (movie.get(field) or "").encode("utf-8")
+                chunks.append(data)
+                position += len(data)
+                offsets[row * len(FIELDS) + field_idx + 1] = position
+
+        row_of_id = np.full(int(ids.max()) + 1 if len(ids) else 0, -1, dtype=np.int64)
+        row_of_id[ids] = np.arange(len(ids), dtype=np.int64)
+
+        self.ids = ids
+        self.offsets = offsets
+        self.row_of_id = row_of_id
+        self.blob = np.frombuffer(b"".join(chunks), dtype=np.uint8)
+
+    def save(self) -> None:
+        os.makedirs(os.path.dirname(self.ids_path), exist_ok=True)
+        np.save(self.ids_path, self.ids)
+        np.save(self.offsets_path, self.offsets)
+        np.save(self.row_of_id_path, self.row_of_id)
+        with open(self.blob_path, "wb") as f:
+            f.write(self.blob.tobytes())
+        with open(self.meta_path, "w") as f:
+            json.dump({"count": len(self.ids), "source": source_signature()}, f)
+        print(f"Document store with {len(self.ids)} documents saved to {self.blob_path}")
+
+    def load(self) -> None:
+        for path in (self.ids_path, self.offsets_path, self.row_of_id_path):
+            if not os.path.exists(path):
+                raise FileNotFoundError(f"Document store file {path} not found")
+        self.ids = np.load(self.ids_path, mmap_mode="r")
+        self.offsets = np.load(self.offsets_path, mmap_mode="r")
+        self.row_of_id = np.load(self.row_of_id_path, mmap_mode="r")
+        if os.path.getsize(self.blob_path) > 0:
+            self.blob = np.memmap(self.blob_path, dtype=np.uint8, mode="r")
+        else:
+            self.blob = np.zeros(0, dtype=np.uint8)
+
+    def is_stale(self) -> bool:
+        if not os.path.exists(self.meta_path):
+            return True
+        with open(self.meta_path, "r") as f:
+            meta = json.load(f)
+        source = source_signature()
+        # serving nodes may only ship the cache, in which case the store is authoritative
+        return source is not None and meta.get("source") != source
+
+    def load_or_build(self) -> None:
+        try:
+            if not self.is_stale():
+                self.load()
+                return
+        except FileNotFoundError:
+            pass
+        self.build()
+        self.save()
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+    def __contains__(self, doc_id) -> bool:
+        return self.get_row(doc_id) >= 0
+
+    def __iter__(self) -> Iterator[int]:
+        # iterate movie ids in catalog order, like the dict docmaps this replaces
+        for doc_id in self.ids:
+            yield int(doc_id)
+
+    def __getitem__(self, doc_id: int) -> dict:
+        row = self.get_row(doc_id)
+        if row < 0:
+            raise KeyError(doc_id)
+        return self.document_at(row)
+
+    def keys(self) -> Iterator[int]:
+        return iter(self)
+
+    def get_row(self, doc_id: int) -> int:
+        if not isinstance(doc_id, (int, np.integer)):
+            return -1
+        if doc_id < 0 or doc_id >= len(self.row_of_id):
+            return -1
+        return int(self.row_of_id[doc_id])
+
+    def field(self, row: int, field: str) -> str:
+        position = row * len(FIELDS) + FIELDS.index(field)
+        start = self.offsets[position]
+        end = self.offsets[position + 1]
+        return self.blob[start:end].tobytes().decode("utf-8")
+
+    def title(self, row: int) -> str:
+        return self.field(row, "title")
+
+    def description(self, row: int) -> str:
+        return self.field(row, "description")
+
+    def document_at(self, row: int) -> dict:
+        return {
+            "id": int(self.ids[row]),
+            "title": self.title(row),
+            "description": self.description(row),
+        }
+
+    def documents(self) -> Iterator[dict]:
+        for row in range(len(self)):
+            yield self.document_at(row)
+
+
+def source_signature() -> list | None:
+    if not os.path.exists(DATA_PATH_MOVIES):
+        return None
+    stat = os.stat(DATA_PATH_MOVIES)
+    return [stat.st_size, stat.st_mtime_ns]
+
+
+def get_document_store(store_dir: str | None = None) -> DocumentStore:
+    """Return the process-wide document store of an index directory, the current one by
+    default, building it from movies.json if needed."""
+    return load_document_store(store_dir or index_dir())
+
+
+@lru_cache(maxsize=4)
+def load_document_store(store_dir: str) -> DocumentStore:
+    store = DocumentStore(store_dir)
+    if os.path.dirname(store_dir) == GENERATIONS_PATH:
+        # published generations are never written to, only a build creates a new one
+        store.load()
+    else:
+        store.load_or_build()
+    return store
@@ -1,8 +1,11 @@
+import math
+import time
+
+from .document_store import get_document_store
 from .hybrid_search import HybridSearch
-from .search_utils import (
-    load_golden_dataset,
-    load_movies,
-)
+from .query_enhancment import llm_rerank
+from .query_routing import RERANK_DEPTH_FACTOR, QueryRouter
+from .search_utils import load_golden_dataset
 from .semantic_search import SemanticSearch
 
 
@@ -28,12 +31,23 @@ def recall_at_k(
     return relevant_count / len(relevant_docs)
 
 
+def ndcg_at_k(retrieved_docs: list[str], relevant_docs: set[str], k: int = 5) -> float:
+    # binary relevance: every golden title counts as 1
+    dcg = sum(
+        1 / math.log2(rank + 1)
+        for rank, doc in enumerate(retrieved_docs[:k], 1)
+        if doc in relevant_docs
+    )
+    ideal = sum(1 / math.log2(rank + 1) for rank in range(1, min(len(relevant_docs), k) + 1))
+    return dcg / ideal if ideal else 0.0
+
+
 def evaluate_command(limit: int = 5) -> dict:
-    movies = load_movies()
+    movies = get_document_store()
     golden_data = load_golden_dataset()
     test_cases = golden_data["test_cases"]
 
-    semantic_search = SemanticSearch()
+    semantic_search = SemanticSearch(cache_dir=movies.store_dir)
     semantic_search.load_or_create_embeddings(movies)
     hybrid_search = HybridSearch(movies)
 
@@ -45,7 +59,7 @@ def evaluate_command(limit: int = 5) -> dict:
         search_results = hybrid_search.rrf_search(query, k=60, limit=limit)
         retrieved_docs = []
         for result in search_results:
-            title = result[1]["doc"]["title"]
+            title = result["title"]
             if title:
                 retrieved_docs.append(title)
 
@@ -66,3 +80,55 @@ def evaluate_command(limit: int = 5) -> dict:
         "limit": limit,
         "results": results_by_query,
     }
+
+
+def routing_comparison_command(limit: int = 5, rerank_method: str | None = None) -> dict:
+    """Run the golden dataset through the fixed RRF pipeline and the adaptive router
+
+    Returns per-query nDCG@limit, latency and routing decisions for both, so the latency a
+    routing decision saves can be weighed against the nDCG it loses.
+    """
+    movies = get_document_store()
+    test_cases = load_golden_dataset()["test_cases"]
+    hybrid_search = HybridSearch(movies)
+    router = QueryRouter(hybrid_search)
+    candidates = limit * RERANK_DEPTH_FACTOR if rerank_method else limit
+
+    results_by_query = {}
+    for test_case in test_cases:
+        query = test_case["query"]
+        relevant_docs = set(test_case["relevant_docs"])
+
+        start = time.perf_counter()
+        fixed_results = hybrid_search.rrf_search(query, k=60, limit=candidates)
+        if rerank_method:
+            fixed_results = llm_rerank(query, fixed_results, rerank_method)
+        fixed_ms = (time.perf_counter() - start) * 1000
+
+        start = time.perf_counter()
+        routed_results, routing = router.search(query, 60, limit, rerank_method)
+        routed_ms = (time.perf_counter() - start) * 1000
+
+        results_by_query[query] = {
+            "fixed_ndcg": ndcg_at_k(
+                [r["title"] for r in fixed_results], relevant_docs, limit
+            ),
+            "routed_ndcg": ndcg_at_k(
+                [r["title"] for r in routed_results], relevant_docs, limit
+            ),
+            "fixed_ms": fixed_ms,
+            "routed_ms": routed_ms,
+            "decisions": routing["decisions"],
+        }
+
+    count = max(len(results_by_query), 1)
+    return {
+        "test_cases_count": len(test_cases),
+        "limit": limit,
+        "rerank_method": rerank_method,
+        "results": results_by_query,
+        "fixed_ndcg": sum(r["fixed_ndcg"] for r in results_by_query.values()) / count,
+        "routed_ndcg": sum(r["routed_ndcg"] for r in results_by_query.values()) / count,
+        "fixed_ms": sum(r["fixed_ms"] for r in results_by_query.values()) / count,
+        "routed_ms": sum(r["routed_ms"] for r in results_by_query.values()) / count,
+    }
@@ -0,0 +1,274 @@
+import fnmatch
+import hashlib
+import json
+import os
+import shutil
+import threading
+import time
+from typing import Callable, Generic, Iterable, TypeVar
+
+from .search_utils import CACHE_PATH
+
+GENERATIONS_PATH = os.path.join(CACHE_PATH, "generations")
+CURRENT_PATH = os.path.join(GENERATIONS_PATH, "CURRENT")
+MANIFEST_NAME = "manifest.json"
+# published generations kept on disk, the current one included
+GENERATIONS_KEPT = 2
+STAGING_PREFIX = ".staging-"
+# every file a build writes into an index directory; a build publishes the files it owns and
+# carries the others over from the current generation
+INDEX_FILE_PATTERNS = (
+    "docstore_*",
+    "vocabulary.pkl",
+    "postings_*",
+    "doc_ids.npy",
+    "doc_lengths.npy",
+    "stem_cache.pkl",
+    "positions.pkl",
+    "impact_*",
+    "typeahead.npz",
+    "spell_index.pkl",
+    "term_neighbors.npz",
+    "movie_embeddings.npy",
+    "chunk_embeddings.npy",
+    "chunk_metadata.json",
+    "*_embeddings_reduced.npz",
+)
+
+T = TypeVar("T")
+
+
+def current_generation() -> str | None:
+    if not os.path.exists(CURRENT_PATH):
+        return None
+    with open(CURRENT_PATH, "r") as f:
+        return f.read().strip() or None
+
+
+def generation_dir(generation: str) -> str:
+    return os.path.join(GENERATIONS_PATH, generation)
+
+
+def generation_index_dir(generation: str | None) -> str:
+    """Index directory of a generation, the flat cache directory of trees built before
+    generations existed for None"""
+    if generation is None:
+        return CACHE_PATH
+    return generation_dir(generation)
+
+
+def index_dir() -> str:
+    """Directory readers load the index from: the current generation, or the flat cache
+    directory of trees built before generations existed
+
+    CURRENT can move between two calls, so a reader calls this once and opens every index
+    file it needs from the returned directory.
+    """
+    return generation_index_dir(current_generation())
+
+
+def is_published(directory: str) -> bool:
+    """Whether directory is a published generation, which is never written to again"""
+    return os.path.dirname(os.path.abspath(directory)) == os.path.abspath(
+        GENERATIONS_PATH
+    ) and not os.path.basename(directory).startswith(STAGING_PREFIX)
+
+
+def start_generation(build: str, resume: bool = False) -> str:
+    """Staging directory a build writes into; resume keeps what an interrupted build left"""
+    staging = os.path.join(GENERATIONS_PATH, f"{STAGING_PREFIX}{build}")
+    if not resume and os.path.exists(staging):
+        shutil.rmtree(staging)
+    os.makedirs(staging, exist_ok=True)
+    return staging
+
+
+def is_index_file(name: str, patterns: Iterable[str] = INDEX_FILE_PATTERNS) -> bool:
+    return any(fnmatch.fnmatch(name, pattern) for pattern in patterns)
+
+
+def file_sha256(path: str) -> str:
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def fsync_path(path: str) -> None:
+    fd = os.open(path, os.O_RDONLY)
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+
+
+def publish_generation(staging: str, owned: Iterable[str]) -> str:
+    """Turn a staging directory into the current generation
+
+    Index files the build does not own (matching none of the owned patterns) are hard linked
+    from the current generation, a manifest with every file's size and checksum is written,
+    the directory is renamed into place and CURRENT is switched with an atomic rename. A
+    reader therefore sees either the old generation or the new one, never a mix.
+
+    Returns:
+        The new generation's name
+    """
+    owned = tuple(owned)
+    parent = current_generation()
+    source = index_dir()
+    if os.path.isdir(source):
+        for name in os.listdir(source):
+            path = os.path.join(source, name)
+            target = os.path.join(staging, name)
+            if (
+                os.path.isfile(path)
+                and is_index_file(name)
+                and not is_index_file(name, owned)
+                and not os.path.exists(target)
+            ):
+                os.link(path, target)
+
+    files = {}
+    for name in sorted(os.listdir(staging)):
+        path = os.path.join(staging, name)
+        if name == MANIFEST_NAME or not os.path.isfile(path) or not is_index_file(name):
+            continue
+        fsync_path(path)
+        files[name] = {"bytes": os.path.getsize(path), "sha256": file_sha256(path)}
+    generation = time.strftime("%Y%m%dT%H%M%S") + f"-{time.time_ns() % 1_000_000_000:09d}"
+    manifest = {
+        "generation": generation,
+        "parent": parent,
+        "created": time.time(),
+        "files": files,
+    }
+    with open(os.path.join(staging, MANIFEST_NAME), "w") as f:
+        json.dump(manifest, f, indent=2)
+        f.flush()
+        os.fsync(f.fileno())
+    # leftovers of the build (checkpoints, partial files) are not part of the generation
+    for name in os.listdir(staging):
+        if name != MANIFEST_NAME and name not in files:
+            path = os.path.join(staging, name)
+            if os.path.isdir(path):
+                shutil.rmtree(path)
+            else:
+                os.remove(path)
+
+    os.rename(staging, generation_dir(generation))
+    temp_path = f"{CURRENT_PATH}.tmp"
+    with open(temp_path, "w") as f:
+        f.write(generation)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(temp_path, CURRENT_PATH)
+    fsync_path(GENERATIONS_PATH)
+    print(f"Published index generation {generation} ({len(files)} files)")
+    gc_generations()
+    return generation
+
+
+def read_manifest(generation: str) -> dict:
+    with open(os.path.join(generation_dir(generation), MANIFEST_NAME), "r") as f:
+        return json.load(f)
+
+
+def list_generations() -> list[str]:
+    if not os.path.isdir(GENERATIONS_PATH):
+        return []
+    # names start with their creation time, so they sort oldest first
+    return sorted(
+        name
+        for name in os.listdir(GENERATIONS_PATH)
+        if not name.startswith(STAGING_PREFIX)
+        and os.path.exists(os.path.join(generation_dir(name), MANIFEST_NAME))
+    )
+
+
+def verify_generation(generation: str) -> list[str]:
+    """Files of a generation whose size or checksum no longer match its manifest"""
+    directory = generation_dir(generation)
+    mismatched = []
+    for name, expected in read_manifest(generation)["files"].items():
+        path = os.path.join(directory, name)
+        if (
+            not os.path.exists(path)
+            or os.path.getsize(path) != expected["bytes"]
+            or file_sha256(path) != expected["sha256"]
+        ):
+            mismatched.append(name)
+    return mismatched
+
+
+def gc_generations(keep: int = GENERATIONS_KEPT) -> list[str]:
+    """Remove all but the newest `keep` generations, never the current one
+
+    Processes still serving a removed generation keep working: files they opened or memory
+    mapped stay readable until they are closed.
+    """
+    current = current_generation()
+    generations = list_generations()
+    kept = set(generations[-keep:]) if keep > 0 else set()
+    removed = []
+    for generation in generations:
+        if generation in kept or generation == current:
+            continue
+        shutil.rmtree(generation_dir(generation))
+        removed.append(generation)
+    return removed
+
+
+class ResidentIndex(Generic[T]):
+    """Index loaded by a long-running process, swapped to new generations without downtime
+
+    load builds the index object from a generation directory. reload() loads the current
+    generation on a background thread and replaces the reference once it is ready; queries
+    take the reference once and finish on whichever index they started with.
+    """
+
+    def __init__(self, load: Callable[[str], T]):
+        self.load = load
+        self.lock = threading.Lock()
+        self.loading: threading.Thread | None = None
+        # CURRENT is read once, so the generation reported is the one loaded
+        self.generation = current_generation()
+        self.index = load(generation_index_dir(self.generation))
+        self.last_error: str | None = None
+
+    def reload(self) -> threading.Thread | None:
+        """Start loading the current generation if it is not the one being served"""
+        with self.lock:
+            generation = current_generation()
+            if generation == self.generation or (
+                self.loading is not None and self.loading.is_alive()
+            ):
+                return None
+            self.loading = threading.Thread(
+                target=self.swap, args=(generation,), daemon=True
+            )
+            self.loading.start()
+            return self.loading
+
+    def swap(self, generation: str | None) -> None:
+        try:
+            index = self.load(generation_index_dir(generation))
+        except Exception as e:
+            # keep serving the old generation
+            self.last_error = f"{type(e).__name__}: {e}"
+            return
+        with self.lock:
+            self.index, self.generation = index, generation
+            self.last_error = None
+
+    def watch(self, interval: float) -> threading.Thread:
+        """Poll CURRENT every interval seconds and reload when it moves"""
+
+        def poll():
+            while True:
+                time.sleep(interval)
+                self.reload()
+
+        thread = threading.Thread(target=poll, daemon=True)
+        thread.start()
+        return thread
@@ -1,89 +1,82 @@
 import os
+import threading
+import time
+from concurrent.futures import Future
+from typing import Any, Callable
 
-from .keyword_search import InvertedIndex
+import numpy as np
+
+from .batch_search import DEFAULT_BATCH_SIZE, run_batch, timed
+from .doc_filter import DocFilter, resolve_filters
+from .keyword_search import InvertedIndex, build_command
+from .document_store import get_document_store
 from .semantic_search import ChunkedSemanticSearch
 from .search_utils import (
-    load_movies,
     DEFAULT_ALPHA,
     format_search_result,
-    load_llm_client,
-    GEMINI_FLASH_MODEL,
 )
 from .query_enhancment import enhance_query, llm_rerank
+from .query_routing import QueryRouter
+from .result_cache import cached_result
+
+# seconds from the start of a speculative search within which results for the enhanced query
+# must be ready; past it the results for the original query are returned
+SPECULATIVE_DEADLINE = 2.0
 
 
 class HybridSearch:
     def __init__(self, documents):
+        if not os.path.exists(os.path.join(documents.store_dir, "vocabulary.pkl")):
+            build_command()
+            documents = get_document_store()
+        # both engines load from the documents' directory, so a generation published while
+        # they load never pairs this catalog with another generation's postings or vectors
         self.documents = documents
-        self.semantic_search = ChunkedSemanticSearch()
+        self.semantic_search = ChunkedSemanticSearch(cache_dir=documents.store_dir)
         self.semantic_search.load_or_create_chunk_embeddings(documents)
 
-        self.idx = InvertedIndex()
-        if not os.path.exists(self.idx.index_path):
-            self.idx.build()
-            self.idx.save()
-
-    def _bm25_search(self, query, limit):
+        self.idx = InvertedIndex(cache_dir=documents.store_dir, docmap=documents)
+        # loaded here, before any search thread starts: load() sets the vocabulary before the
+        # postings, so a lazy load would let a concurrent search read a half-loaded index
         self.idx.load()
-        return self.idx.bm25_search(query, limit)
 
-    def weighted_search(self, query, alpha, limit=5) -> list[dict]:
-        bm25_results = self._bm25_search(query, limit * 500)
-        semantic_results = self.semantic_search.search_chunks(query, limit * 500)
+    def _bm25_search(self, query, limit, doc_filter: DocFilter | None = None):
+        return self.idx.bm25_search(query, limit, doc_filter)
+
+    def weighted_search(
+        self,
+        query,
+        alpha,
+        limit=5,
+        doc_filter: DocFilter | None = None,
+        query_embedding: np.ndarray | None = None,
+    ) -> list[dict]:
+        bm25_results = self._bm25_search(query, limit * 500, doc_filter)
+        semantic_results = self.semantic_search.search_chunks(
+            query, limit * 500, doc_filter, query_embedding
+        )
         combined_results = combine_search_results(bm25_results, semantic_results, alpha)
         return combined_results[:limit]
 
-    def rrf_search(self, query, k=60, limit=5):
-        bm25_results = self._bm25_search(query, limit * 500)
+    def rrf_search(
+        self,
+        query,
+        k=60,
+        limit=5,
+        doc_filter: DocFilter | None = None,
+        query_embedding: np.ndarray | None = None,
+    ):
+        # the filter is applied inside both engines, so the limit * 500 candidates are all
+        # allowed documents rather than an over-fetch to post-filter
+        bm25_results = self._bm25_search(query, limit * 500, doc_filter)
         # for result in bm25_results[:25]:
         #     print(f"BM25 --- Title: {result['title']}, Score: {result['score']:.4f}")
-        semantic_results = self.semantic_search.search_chunks(query, limit * 500)
+        semantic_results = self.semantic_search.search_chunks(
+            query, limit * 500, doc_filter, query_embedding
+        )
         # for result in semantic_results[:25]:
         #     print(f"Semantic --- Title: {result['title']}, Score: {result['score']:.4f}")
-        doc_id_to_scores = {}
-        for rank, result in enumerate(bm25_results, start=1):
-            doc_id = result["doc_id"]
-
-            if doc_id not in doc_id_to_scores:
-                doc_id_to_scores[doc_id] = {
-                    "title": result["title"],
-                    "document": result["document"],
-                    "rrf_score": 0.0,
-                    "bm25_rank": None,
-                    "semantic_rank": None,
-                }
-            if doc_id_to_scores[doc_id]["bm25_rank"] is None:
-                doc_id_to_scores[doc_id]["bm25_rank"] = rank
-                doc_id_to_scores[doc_id]["rrf_score"] += rrf_score(rank, k)
-
-        for rank, result in enumerate(semantic_results, start=1):
-            doc_id = result["doc_id"]
-
-            if doc_id not in doc_id_to_scores:
-                doc_id_to_scores[doc_id] = {
-                    "title": result["title"],
-                    "document": result["document"],
-                    "rrf_score": 0.0,
-                    "bm25_rank": None,
-                    "semantic_rank": None,
-                }
-            if doc_id_to_scores[doc_id]["semantic_rank"] is None:
-                doc_id_to_scores[doc_id]["semantic_rank"] = rank
-                doc_id_to_scores[doc_id]["rrf_score"] += rrf_score(rank, k)
-
-        rrf_results = []
-        for doc_id, data in doc_id_to_scores.items():
-            result = format_search_result(
-                doc_id=doc_id,
-                title=data["title"],
-                document=data["document"],
-                score=data["rrf_score"],
-                rrf_score=data["rrf_score"],
-                bm25_rank=data["bm25_rank"],
-                semantic_rank=data["semantic_rank"],
-            )
-            rrf_results.append(result)
-        sorted_results = sorted(rrf_results, key=lambda x: x["score"], reverse=True)
+        sorted_results = rrf_fuse(bm25_results, semantic_results, k)
         # print(sorted_results[:25])
         # for result in sorted_results[:25]:
         #     print(f"RRF --- Title: {result['title']}, RRF Score: {result["score"]:.4f} BM25 Rank: {result["metadata"]['bm25_rank']}, Semantic Rank: {result["metadata"]['semantic_rank']}")
@@ -170,44 +163,293 @@ def rrf_score(rank: int, k: int = 60) -> float:
     return 1 / (k + rank)
 
 
-def weighted_search(query, alpha, limit=5):
-    movies = load_movies()
-    hybrid_search = HybridSearch(movies)
-    results = hybrid_search.weighted_search(query, alpha, limit)
+def rrf_fuse(
+    bm25_results: list[dict], semantic_results: list[dict], k: int = 60
+) -> list[dict]:
+    doc_id_to_scores = {}
+    for rank, result in enumerate(bm25_results, start=1):
+        doc_id = result["doc_id"]
+
+        if doc_id not in doc_id_to_scores:
+            doc_id_to_scores[doc_id] = {
+                "title": result["title"],
+                "document": result["document"],
+                "rrf_score": 0.0,
+                "bm25_rank": None,
+                "semantic_rank": None,
+            }
+        if doc_id_to_scores[doc_id]["bm25_rank"] is None:
+            doc_id_to_scores[doc_id]["bm25_rank"] = rank
+            doc_id_to_scores[doc_id]["rrf_score"] += rrf_score(rank, k)
+
+    for rank, result in enumerate(semantic_results, start=1):
+        doc_id = result["doc_id"]
+
+        if doc_id not in doc_id_to_scores:
+            doc_id_to_scores[doc_id] = {
+                "title": result["title"],
+                "document": result["document"],
+                "rrf_score": 0.0,
+                "bm25_rank": None,
+                "semantic_rank": None,
+            }
+        if doc_id_to_scores[doc_id]["semantic_rank"] is None:
+            doc_id_to_scores[doc_id]["semantic_rank"] = rank
+            doc_id_to_scores[doc_id]["rrf_score"] += rrf_score(rank, k)
+
+    rrf_results = []
+    for doc_id, data in doc_id_to_scores.items():
+        result = format_search_result(
+            doc_id=doc_id,
+            title=data["title"],
+            document=data["document"],
+            score=data["rrf_score"],
+            rrf_score=data["rrf_score"],
+            bm25_rank=data["bm25_rank"],
+            semantic_rank=data["semantic_rank"],
+        )
+        rrf_results.append(result)
+    return sorted(rrf_results, key=lambda x: x["score"], reverse=True)
+
+
+def weighted_search(query, alpha, limit=5, filters: list[str] | None = None):
+    def compute():
+        movies = get_document_store()
+        hybrid_search = HybridSearch(movies)
+        return hybrid_search.weighted_search(
+            query, alpha, limit, resolve_filters(filters)
+        )
+
+    results, cache_stats = cached_result(
+        "weighted_search", query, compute, alpha=alpha, limit=limit, filters=filters
+    )
 
     return {
         "query": query,
         "alpha": alpha,
         "limit": limit,
+        "filters": filters,
         "results": results,
+        "metadata": {"cache": cache_stats},
     }
 
 
-def rrf_search(query, k=60, limit=5, method=None, rerank_method=None, evaluate=False):
-    movies = load_movies()
+def run_in_background(function: Callable, *args: Any) -> Future:
+    """Call function on a daemon thread, so a result nobody waits for never delays exit"""
+    future: Future = Future()
+    future.set_running_or_notify_cancel()
+
+    def run():
+        try:
+            future.set_result(function(*args))
+        except BaseException as e:
+            future.set_exception(e)
+
+    threading.Thread(target=run, daemon=True).start()
+    return future
+
+
+def speculative_search(
+    query: str,
+    enhance: Callable[[str], str],
+    search: Callable[[str], Any],
+    deadline: float = SPECULATIVE_DEADLINE,
+) -> tuple[Any, str | None, dict]:
+    """Search the original query while it is being enhanced instead of after
+
+    The enhancement and the original query's search start together, and the enhanced query
+    is searched the moment it arrives. Its results win if they are ready within deadline
+    seconds of the start; otherwise, or if the enhancement fails, the original query's
+    results are returned and the enhanced path is left to finish unobserved.
+
+    Returns:
+        The search result used, the enhanced query if its result was used, and the speculation
+        metadata: which path was used and the duration of every stage that finished in time
+    """
+    start = time.perf_counter()
+    timings_ms: dict[str, float] = {}
+
+    def timed_stage(stage: str, function: Callable, *args: Any) -> Any:
+        stage_start = time.perf_counter()
+        result = function(*args)
+        timings_ms[stage] = round((time.perf_counter() - stage_start) * 1000, 3)
+        return result
+
+    def enhanced_path() -> tuple[str, Any]:
+        enhanced_query = timed_stage("enhancement", enhance, query)
+        return enhanced_query, timed_stage("enhanced_search", search, enhanced_query)
+
+    enhanced = run_in_background(enhanced_path)
+    original = run_in_background(timed_stage, "original_search", search, query)
+    speculation: dict[str, Any] = {"deadline_ms": round(deadline * 1000, 3)}
+    enhanced_query = None
+    try:
+        remaining = max(deadline - (time.perf_counter() - start), 0.0)
+        enhanced_query, result = enhanced.result(timeout=remaining)
+        speculation["used"] = "enhanced"
+    except TimeoutError:
+        speculation["used"] = "original"
+    except Exception as e:
+        speculation["used"] = "original"
+        speculation["enhancement_error"] = f"{type(e).__name__}: {e}"
+    if speculation["used"] == "original":
+        enhanced_query = None
+        result = original.result()
+    speculation["elapsed_ms"] = round((time.perf_counter() - start) * 1000, 3)
+    # the stages still running keep writing to timings_ms, report what finished by now
+    speculation["timings_ms"] = dict(timings_ms)
+    return result, enhanced_query, speculation
+
+
+def rrf_search(
+    query,
+    k=60,
+    limit=5,
+    method=None,
+    rerank_method=None,
+    evaluate=False,
+    adaptive=False,
+    filters: list[str] | None = None,
+    speculative: bool = False,
+    deadline: float = SPECULATIVE_DEADLINE,
+):
     original_query = query
     print(f"Original query: {original_query}")
-    enhanced_query = None
-    new_limit = limit
-    if rerank_method:
-        new_limit = limit * 5
-    if method:
-        enhanced_query = enhance_query(query, method)
-        query = enhanced_query
-    print(f"Enhanced query: {query}")
-
-    hybrid_search = HybridSearch(movies)
-    results = hybrid_search.rrf_search(query, k, new_limit)[:limit]
-    if rerank_method:
-        results = llm_rerank(query, results, rerank_method)
-    results = results[:limit]
+
+    def compute():
+        movies = get_document_store()
+        query = original_query
+        enhanced_query = None
+        new_limit = limit
+        if rerank_method:
+            new_limit = limit * 5
+        # the adaptive router reranks inside its search, which would run for both paths
+        speculate = speculative and bool(method) and not adaptive
+        if method and not speculate:
+            enhanced_query = enhance_query(query, method)
+            query = enhanced_query
+
+        hybrid_search = HybridSearch(movies)
+        doc_filter = resolve_filters(filters)
+        routing = None
+        speculation = None
+        if adaptive:
+            results, routing = QueryRouter(hybrid_search).search(
+                query, k, limit, rerank_method, doc_filter
+            )
+        else:
+            if speculate:
+                results, enhanced_query, speculation = speculative_search(
+                    query,
+                    lambda text: enhance_query(text, method),
+                    lambda text: hybrid_search.rrf_search(text, k, new_limit, doc_filter),
+                    deadline,
+                )
+                query = enhanced_query or query
+            else:
+                results = hybrid_search.rrf_search(query, k, new_limit, doc_filter)
+            if rerank_method:
+                results = llm_rerank(query, results, rerank_method)
+        return {
+            "query": query,
+            "enhanced_query": enhanced_query,
+            "results": results[:limit],
+            "routing": routing,
+            "speculation": speculation,
+        }
+
+    # the enhancement and rerank LLM calls are part of the cached work
+    cached, cache_stats = cached_result(
+        "rrf_search",
+        original_query,
+        compute,
+        k=k,
+        limit=limit,
+        method=method,
+        rerank_method=rerank_method,
+        adaptive=adaptive,
+        filters=filters,
+        # a fallback to the original query's results is not what the key asks for
+        store=lambda cached: (cached.get("speculation") or {}).get("used") != "original",
+    )
+    print(f"Enhanced query: {cached['query']}")
     return {
-        "query": query,
+        "query": cached["query"],
         "k": k,
         "limit": limit,
         "original_query": original_query,
-        "enhanced_query": enhanced_query,
+        "enhanced_query": cached["enhanced_query"],
         "enhance_method": method,
-        "results": results,
+        "filters": filters,
+        "results": cached["results"],
         "evaluate": evaluate,
+        "metadata": {
+            "cache": cache_stats,
+            "routing": cached["routing"],
+            "speculation": cached.get("speculation"),
+        },
     }
+
+
+def batch_command(
+    input_path: str = "-",
+    output_path: str = "-",
+    mode: str = "rrf",
+    k: int = 60,
+    alpha: float = DEFAULT_ALPHA,
+    limit: int = 5,
+    adaptive: bool = False,
+    batch_size: int = DEFAULT_BATCH_SIZE,
+    checkpoint_path: str | None = None,
+) -> dict:
+    """Hybrid search for every query of a JSONL file with one loaded index and model
+
+    Each batch's queries are embedded in a single encode call and its cost is split evenly
+    over their timings. Records may override "mode", "k", "alpha", "limit" and "filters".
+    Results skip the result cache, a bulk run would only churn it. Adaptive routing embeds
+    the queries it does not skip the semantic leg for on its own instead.
+    """
+    hybrid_search = HybridSearch(get_document_store())
+    router = QueryRouter(hybrid_search) if adaptive else None
+
+    def search(record: dict, query_embedding: np.ndarray | None) -> list[dict]:
+        record_mode = record.get("mode", mode)
+        record_limit = record.get("limit", limit)
+        doc_filter = resolve_filters(record.get("filters"))
+        if record_mode == "weighted":
+            return hybrid_search.weighted_search(
+                record["query"],
+                record.get("alpha", alpha),
+                record_limit,
+                doc_filter,
+                query_embedding,
+            )
+        if record_mode != "rrf":
+            raise ValueError(f"Unknown mode '{record_mode}', expected rrf or weighted")
+        if router is not None:
+            results, _ = router.search(
+                record["query"], record.get("k", k), record_limit, None, doc_filter
+            )
+            return results
+        return hybrid_search.rrf_search(
+            record["query"], record.get("k", k), record_limit, doc_filter, query_embedding
+        )
+
+    def search_batch(records: list[dict]) -> list[dict]:
+        if router is not None:
+            return [timed(lambda: search(record, None)) for record in records]
+        # empty queries are left to fail on their own instead of failing the whole batch
+        queries = [record["query"] for record in records if record["query"].strip()]
+        start = time.perf_counter()
+        embeddings = iter(hybrid_search.semantic_search.encode(queries) if queries else [])
+        shared_ms = (time.perf_counter() - start) * 1000 / max(len(queries), 1)
+        responses = []
+        for record in records:
+            if record["query"].strip():
+                embedding = next(embeddings)
+                responses.append(timed(lambda: search(record, embedding), shared_ms))
+            else:
+                responses.append(timed(lambda: search(record, None)))
+        return responses
+
+    return run_batch(search_batch, input_path, output_path, batch_size, checkpoint_path)
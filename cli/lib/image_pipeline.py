@@ -0,0 +1,158 @@
+import hashlib
+import io
+import mimetypes
+import os
+import pickle
+import time
+from typing import Any
+
+from .search_utils import CACHE_PATH
+
+IMAGE_CACHE_PATH = os.path.join(CACHE_PATH, "images")
+# CLIP resizes the shorter side to 224 then center crops; resizing to exactly that first
+# (with the same bicubic filter) leaves its own resize a no-op on a far smaller image
+CLIP_IMAGE_SIZE = 224
+# Gemini tiles images into 768x768 crops, larger uploads only cost bytes and tokens
+UPLOAD_MAX_SIDE = 768
+UPLOAD_JPEG_QUALITY = 85
+# assumed uplink for the upload time a smaller payload saves
+UPLOAD_BANDWIDTH_MBPS = float(os.environ.get("HOOPLA_UPLOAD_MBPS", "20"))
+
+
+class ImageSource:
+    """An image file read once, hashed for the cache and decoded at most once"""
+
+    def __init__(self, path: str):
+        self.path = path
+        with open(path, "rb") as f:
+            self.data = f.read()
+        self.sha256 = hashlib.sha256(self.data).hexdigest()
+        mime_type, _ = mimetypes.guess_type(path)
+        self.mime_type = mime_type or "image/jpeg"
+        self._image = None
+        self._decoded_side = 0
+
+    def decode(self, min_side: int | None = None):
+        """RGB image in display orientation, at least min_side on its shorter side
+
+        JPEGs are decoded at the smallest DCT scale that still covers min_side, which skips
+        most of the decode work for photos far larger than the model or API needs.
+        """
+        from PIL import Image, ImageOps
+
+        wanted = min_side or 0
+        if self._image is not None and (
+            self._decoded_side == 0 or self._decoded_side >= wanted
+        ):
+            return self._image
+        image = Image.open(io.BytesIO(self.data))
+        if min_side:
+            image.draft("RGB", (min_side, min_side))
+        self._image = ImageOps.exif_transpose(image).convert("RGB")
+        self._decoded_side = wanted
+        return self._image
+
+
+def downscale(image, size: int, shorter_side: bool = False):
+    """Resize so the shorter (or longer) side is size, never upscaling"""
+    from PIL import Image
+
+    side = min(image.size) if shorter_side else max(image.size)
+    if side <= size:
+        return image
+    scale = size / side
+    width = max(1, round(image.width * scale))
+    height = max(1, round(image.height * scale))
+    return image.resize((width, height), Image.Resampling.BICUBIC)
+
+
+class ImageCache:
+    """Pipeline outputs by source content hash and variant, with what they cost to make"""
+
+    def __init__(self, path: str = IMAGE_CACHE_PATH):
+        self.path = path
+
+    def entry_path(self, sha256: str, variant: str) -> str:
+        return os.path.join(self.path, f"{sha256}-{variant}.pkl")
+
+    def get(self, sha256: str, variant: str) -> dict | None:
+        path = self.entry_path(sha256, variant)
+        if not os.path.exists(path):
+            return None
+        with open(path, "rb") as f:
+            return pickle.load(f)
+
+    def put(self, sha256: str, variant: str, entry: dict[str, Any]) -> None:
+        os.makedirs(self.path, exist_ok=True)
+        path = self.entry_path(sha256, variant)
+        temp_path = f"{path}.tmp"
+        with open(temp_path, "wb") as f:
+            pickle.dump(entry, f)
+        os.replace(temp_path, path)
+
+
+def upload_ms(num_bytes: int) -> float:
+    return num_bytes * 8 / (UPLOAD_BANDWIDTH_MBPS * 1e6) * 1000
+
+
+def prepare_upload(
+    path: str,
+    max_side: int = UPLOAD_MAX_SIDE,
+    quality: int = UPLOAD_JPEG_QUALITY,
+    image_cache: ImageCache | None = None,
+) -> tuple[bytes, str, dict]:
+    """Image bytes to send to the LLM: downscaled to max_side and re-encoded as JPEG
+
+    The original is sent unchanged when it is already small enough and no bigger than the
+    re-encoded copy.
+
+    Returns:
+        The payload, its mime type, and a report of the bytes and time it saved
+    """
+    image_cache = image_cache or ImageCache()
+    source = ImageSource(path)
+    variant = f"upload-{max_side}-q{quality}"
+    cached = image_cache.get(source.sha256, variant)
+    start = time.perf_counter()
+    if cached is None:
+        image = source.decode(max_side)
+        payload, mime_type = source.data, source.mime_type
+        if max(image.size) > max_side or source.mime_type not in ("image/jpeg", "image/png"):
+            image = downscale(image, max_side)
+            buffer = io.BytesIO()
+            image.save(buffer, format="JPEG", quality=quality, optimize=True)
+            if buffer.tell() < len(source.data):
+                payload, mime_type = buffer.getvalue(), "image/jpeg"
+        prepare_ms = (time.perf_counter() - start) * 1000
+        cached = {
+            "data": payload,
+            "mime_type": mime_type,
+            "size": list(image.size),
+            "prepare_ms": prepare_ms,
+        }
+        image_cache.put(source.sha256, variant, cached)
+        cache_hit = False
+    else:
+        cache_hit = True
+    saved_bytes = len(source.data) - len(cached["data"])
+    report = {
+        "original_bytes": len(source.data),
+        "uploaded_bytes": len(cached["data"]),
+        "size": cached["size"],
+        "cache_hit": cache_hit,
+        "prepare_ms": round((time.perf_counter() - start) * 1000, 3),
+        # a hit skips the decode and re-encode; smaller payloads upload faster
+        "saved_ms": round(
+            (cached["prepare_ms"] if cache_hit else 0.0) + upload_ms(saved_bytes), 3
+        ),
+    }
+    return cached["data"], cached["mime_type"], report
+
+
+def format_image_report(report: dict) -> str:
+    hit = ", cached" if report.get("cache_hit") else ""
+    return (
+        f"Image: {report['original_bytes'] / 1024:.1f} KiB -> "
+        f"{report['uploaded_bytes'] / 1024:.1f} KiB uploaded{hit}, "
+        f"prepared in {report['prepare_ms']:.1f} ms, ~{report['saved_ms']:.0f} ms saved"
+    )
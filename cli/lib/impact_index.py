@@ -0,0 +1,182 @@
+import json
+import os
+from collections import Counter
+
+import numpy as np
+
+from .generations import index_dir
+from .search_utils import BM25_B, BM25_K1
+
+# Each posting stores its BM25 contribution (idf * saturated tf) quantized to 8 bits against a
+# per-term scale. Query time scoring multiplies the impacts by an integer fixed point weight
+# per term and accumulates integers, so k1/b/doc lengths are never touched after the build.
+IMPACT_LEVELS = 255
+IMPACT_FIXED_POINT = 1 << 20
+# impact-ordered postings are scored in segments, highest possible contribution first
+IMPACT_SEGMENT_SIZE = 128
+# starting accumulator of filtered out documents, no sum of impacts gets it back above zero
+IMPACT_EXCLUDED = -(1 << 62)
+
+
+class ImpactIndex:
+    def __init__(self, cache_dir: str | None = None):
+        cache_dir = cache_dir or index_dir()
+        self.offsets = np.zeros(1, dtype=np.int64)  # term id -> start of its postings
+        self.ordinals = np.zeros(0, dtype=np.int32)  # doc ordinals, highest impact first
+        self.impacts = np.zeros(0, dtype=np.uint8)
+        self.scales = np.zeros(0, dtype=np.float64)  # term id -> score of one impact level
+        self.weights = np.zeros(0, dtype=np.int64)  # term id -> scale in fixed point
+        self.doc_count = 0
+        self.k1 = BM25_K1
+        self.b = BM25_B
+
+        self.cache_dir = cache_dir
+        self.prefix = os.path.join(cache_dir, "impact")
+        self.meta_path = os.path.join(cache_dir, "impact_meta.json")
+
+    def build(self, inverted_index, k1: float = BM25_K1, b: float = BM25_B) -> None:
+        """Precompute quantized BM25 impacts from a built or loaded InvertedIndex"""
+        self.k1 = k1
+        self.b = b
+        self.doc_count = len(inverted_index.doc_ids)
+        num_terms = len(inverted_index.vocabulary)
+        dfs = inverted_index.postings.dfs
+        self.offsets = np.zeros(num_terms + 1, dtype=np.int64)
+        self.offsets[1:] = np.cumsum(dfs)
+        self.ordinals = np.empty(self.offsets[-1], dtype=np.int32)
+        self.impacts = np.empty(self.offsets[-1], dtype=np.uint8)
+        self.scales = np.zeros(num_terms, dtype=np.float64)
+
+        length_norms = 1 - b + b * (
+            inverted_index.doc_lengths / inverted_index.avg_doc_length
+        )
+        for term_id in inverted_index.vocabulary.values():
+            ordinals, tfs = inverted_index.postings.get(term_id)
+            df = len(ordinals)
+            idf = np.log((self.doc_count - df + 0.5) / (df + 0.5) + 1)
+            contributions = idf * (tfs * (k1 + 1)) / (tfs + k1 * length_norms[ordinals])
+            scale = contributions.max() / IMPACT_LEVELS
+            # every posting keeps at least one level so no matching document drops out
+            impacts = np.clip(np.rint(contributions / scale), 1, IMPACT_LEVELS)
+            order = np.lexsort((ordinals, -impacts))
+            start, end = self.offsets[term_id], self.offsets[term_id + 1]
+            self.ordinals[start:end] = ordinals[order]
+            self.impacts[start:end] = impacts[order]
+            self.scales[term_id] = scale
+        self.weights = np.rint(self.scales * IMPACT_FIXED_POINT).astype(np.int64)
+
+    def save(self) -> None:
+        os.makedirs(self.cache_dir, exist_ok=True)
+        np.save(f"{self.prefix}_offsets.npy", self.offsets)
+        np.save(f"{self.prefix}_ordinals.npy", self.ordinals)
+        np.save(f"{self.prefix}_impacts.npy", self.impacts)
+        np.save(f"{self.prefix}_scales.npy", self.scales)
+        with open(self.meta_path, "w") as f:
+            json.dump({"k1": self.k1, "b": self.b, "doc_count": self.doc_count}, f)
+
+    def load(self) -> None:
+        if not os.path.exists(self.meta_path):
+            raise FileNotFoundError(f"Impact index not found in {self.cache_dir}")
+        with open(self.meta_path, "r") as f:
+            meta = json.load(f)
+        self.k1 = meta["k1"]
+        self.b = meta["b"]
+        self.doc_count = meta["doc_count"]
+        self.offsets = np.load(f"{self.prefix}_offsets.npy")
+        self.ordinals = np.load(f"{self.prefix}_ordinals.npy", mmap_mode="r")
+        self.impacts = np.load(f"{self.prefix}_impacts.npy", mmap_mode="r")
+        self.scales = np.load(f"{self.prefix}_scales.npy")
+        self.weights = np.rint(self.scales * IMPACT_FIXED_POINT).astype(np.int64)
+
+    def matches(self, k1: float = BM25_K1, b: float = BM25_B) -> bool:
+        return self.k1 == k1 and self.b == b
+
+    def get(self, term_id: int) -> tuple[np.ndarray, np.ndarray]:
+        start, end = self.offsets[term_id], self.offsets[term_id + 1]
+        return self.ordinals[start:end], self.impacts[start:end]
+
+    def scores(self, term_ids: list[int]) -> np.ndarray:
+        """Exhaustive integer accumulation, doc ordinal -> quantized BM25 score"""
+        accumulator = np.zeros(self.doc_count, dtype=np.int64)
+        for term_id, count in Counter(term_ids).items():
+            ordinals, impacts = self.get(term_id)
+            accumulator[ordinals] += impacts.astype(np.int64) * self.weights[term_id] * count
+        return accumulator / IMPACT_FIXED_POINT
+
+    def top_k(
+        self, term_ids: list[int], limit: int, allowed: np.ndarray | None = None
+    ) -> tuple[np.ndarray, np.ndarray, int]:
+        """Score-at-a-time top-k over impact-ordered segments with safe early termination
+
+        Segments of every query term are visited by their highest possible contribution.
+        Scoring stops once the k-th best accumulator beats the (k+1)-th by more than all
+        unvisited segments could still add; the remaining postings are then only used to
+        complete the scores of the k survivors.
+
+        Documents outside allowed (a boolean mask over doc ordinals) start far below any
+        reachable score, so they never enter the top-k nor delay the termination test.
+
+        Returns:
+            Doc ordinals and scores, best first (ties in ordinal order), and the number of
+            postings accumulated before terminating
+        """
+        accumulator = np.zeros(self.doc_count, dtype=np.int64)
+        limit = min(limit, self.doc_count)
+        if allowed is not None:
+            accumulator[~allowed] = IMPACT_EXCLUDED
+            limit = min(limit, int(allowed.sum()))
+        if limit == 0:
+            return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.float64), 0
+
+        # a term repeated in the query counts once per occurrence, as in exact scoring
+        weights = {
+            term_id: int(self.weights[term_id]) * count
+            for term_id, count in Counter(term_ids).items()
+        }
+        segments = []  # (upper bound, term id, start, end)
+        next_bound = {}  # term id -> most an unvisited posting of the term can still add
+        for term_id, weight in weights.items():
+            start, end = int(self.offsets[term_id]), int(self.offsets[term_id + 1])
+            for segment_start in range(start, end, IMPACT_SEGMENT_SIZE):
+                segment_end = min(segment_start + IMPACT_SEGMENT_SIZE, end)
+                bound = int(self.impacts[segment_start]) * weight
+                segments.append((bound, term_id, segment_start, segment_end))
+            next_bound[term_id] = int(self.impacts[start]) * weight if end > start else 0
+        # bounds never increase within a term, so the stable sort keeps each term's segments
+        # in posting order
+        segments.sort(key=lambda segment: -segment[0])
+
+        visited_upto = {term_id: int(self.offsets[term_id]) for term_id in weights}
+        accumulated = 0
+        for _, term_id, start, end in segments:
+            accumulator[self.ordinals[start:end]] += (
+                self.impacts[start:end].astype(np.int64) * weights[term_id]
+            )
+            accumulated += end - start
+            visited_upto[term_id] = end
+            next_bound[term_id] = 0
+            if end < self.offsets[term_id + 1]:
+                next_bound[term_id] = int(self.impacts[end]) * weights[term_id]
+            remaining = sum(next_bound.values())
+            if remaining == 0 or limit == self.doc_count:
+                continue
+            # the last limit + 1 entries are the k best accumulators and the runner-up
+            best = np.partition(accumulator, self.doc_count - limit - 1)[
+                self.doc_count - limit - 1 :
+            ]
+            if best[1:].min() > best[0] + remaining:
+                break
+
+        top = np.argpartition(-accumulator, limit - 1)[:limit]
+        # finish the scores of the survivors from the postings that were skipped
+        for term_id, weight in weights.items():
+            start, end = visited_upto[term_id], int(self.offsets[term_id + 1])
+            if start == end:
+                continue
+            tail = np.asarray(self.ordinals[start:end])
+            hits = np.isin(tail, top)
+            accumulator[tail[hits]] += (
+                np.asarray(self.impacts[start:end])[hits].astype(np.int64) * weight
+            )
+        top = top[np.lexsort((top, -accumulator[top]))]
+        return top, accumulator[top] / IMPACT_FIXED_POINT, accumulated
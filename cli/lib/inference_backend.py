@@ -0,0 +1,135 @@
+import os
+import time
+from functools import lru_cache
+
+import numpy as np
+
+from .search_utils import CACHE_PATH, INFERENCE_BACKEND
+
+INFERENCE_BACKENDS = ("torch", "onnx", "onnx-int8")
+BI_ENCODER_MODEL = "all-MiniLM-L6-v2"
+CROSS_ENCODER_MODEL = "cross-encoder/ms-marco-TinyBERT-L2-v2"
+ONNX_PATH = os.path.join(CACHE_PATH, "onnx")
+# dynamic int8 quantization preset; avx2 runs on every x86-64 serving node we have
+ONNX_QUANTIZATION_CONFIG = "avx2"
+ONNX_INT8_FILE = f"onnx/model_qint8_{ONNX_QUANTIZATION_CONFIG}.onnx"
+
+
+def check_backend(backend: str) -> None:
+    if backend not in INFERENCE_BACKENDS:
+        raise ValueError(
+            f"Unknown inference backend '{backend}', expected one of {INFERENCE_BACKENDS}"
+        )
+
+
+def onnx_model_dir(model_name: str) -> str:
+    return os.path.join(ONNX_PATH, model_name.replace("/", "__"))
+
+
+def load_model(model_class, model_name: str, backend: str = INFERENCE_BACKEND):
+    """Load a SentenceTransformer or CrossEncoder on the given inference backend
+
+    The ONNX backends export the model once into cache/onnx/<model> (with an int8 dynamically
+    quantized copy for onnx-int8) and load that export from then on.
+    """
+    check_backend(backend)
+    if backend == "torch":
+        return model_class(model_name)
+
+    try:
+        from sentence_transformers import export_dynamic_quantized_onnx_model
+        import onnxruntime  # noqa: F401
+    except ImportError as e:
+        raise ImportError(
+            "The onnx backends need onnxruntime and optimum, "
+            "install them with `pip install sentence-transformers[onnx]`"
+        ) from e
+
+    model_dir = onnx_model_dir(model_name)
+    if not os.path.exists(os.path.join(model_dir, "onnx", "model.onnx")):
+        model = model_class(model_name, backend="onnx")
+        model.save_pretrained(model_dir)
+    if backend == "onnx":
+        return model_class(model_dir, backend="onnx")
+
+    if not os.path.exists(os.path.join(model_dir, ONNX_INT8_FILE)):
+        export_dynamic_quantized_onnx_model(
+            model_class(model_dir, backend="onnx"),
+            quantization_config=ONNX_QUANTIZATION_CONFIG,
+            model_name_or_path=model_dir,
+        )
+    return model_class(
+        model_dir, backend="onnx", model_kwargs={"file_name": ONNX_INT8_FILE}
+    )
+
+
+def load_bi_encoder(model_name: str = BI_ENCODER_MODEL, backend: str = INFERENCE_BACKEND):
+    from sentence_transformers import SentenceTransformer
+
+    return load_model(SentenceTransformer, model_name, backend)
+
+
+@lru_cache(maxsize=None)
+def load_cross_encoder(
+    model_name: str = CROSS_ENCODER_MODEL, backend: str = INFERENCE_BACKEND
+):
+    from sentence_transformers import CrossEncoder
+
+    return load_model(CrossEncoder, model_name, backend)
+
+
+def time_per_call(function, inputs: list, repeats: int) -> float:
+    function(inputs[0])  # warm up sessions and allocators outside the timing
+    start = time.perf_counter()
+    for _ in range(repeats):
+        for item in inputs:
+            function(item)
+    return (time.perf_counter() - start) * 1000 / (repeats * len(inputs))
+
+
+def backend_report_command(
+    queries: list[str], documents: list[str], backend: str, repeats: int = 5
+) -> dict:
+    """Compare a backend against the PyTorch path on the same queries and documents
+
+    The bi-encoder is compared by the cosine between both embeddings of every query, the
+    cross-encoder by its scores over every (query, document) pair and whether each query
+    keeps the same best document.
+    """
+    check_backend(backend)
+    reference_encoder = load_bi_encoder(backend="torch")
+    candidate_encoder = load_bi_encoder(backend=backend)
+    reference = reference_encoder.encode(queries, normalize_embeddings=True)
+    candidate = candidate_encoder.encode(queries, normalize_embeddings=True)
+    cosines = np.sum(reference * candidate, axis=1)
+
+    reference_reranker = load_cross_encoder(backend="torch")
+    candidate_reranker = load_cross_encoder(backend=backend)
+    pairs = [[query, document] for query in queries for document in documents]
+    reference_scores = np.asarray(reference_reranker.predict(pairs)).reshape(
+        len(queries), len(documents)
+    )
+    candidate_scores = np.asarray(candidate_reranker.predict(pairs)).reshape(
+        len(queries), len(documents)
+    )
+    query_pairs = [[[query, document] for document in documents] for query in queries]
+
+    return {
+        "backend": backend,
+        "queries": len(queries),
+        "documents": len(documents),
+        "min_cosine": float(cosines.min()),
+        "mean_cosine": float(cosines.mean()),
+        "max_score_diff": float(np.abs(reference_scores - candidate_scores).max()),
+        "top1_agreement": float(
+            np.mean(reference_scores.argmax(axis=1) == candidate_scores.argmax(axis=1))
+        ),
+        "encode_ms": {
+            "torch": time_per_call(reference_encoder.encode, queries, repeats),
+            backend: time_per_call(candidate_encoder.encode, queries, repeats),
+        },
+        "rerank_ms": {
+            "torch": time_per_call(reference_reranker.predict, query_pairs, repeats),
+            backend: time_per_call(candidate_reranker.predict, query_pairs, repeats),
+        },
+    }
@@ -1,29 +1,73 @@
+import heapq
+import re
 import string
+from lib.batch_search import DEFAULT_BATCH_SIZE, run_batch, timed
+from lib.doc_filter import DocFilter, resolve_filters
+from lib.document_store import DocumentStore, get_document_store, load_document_store
+from lib.generations import index_dir, publish_generation, start_generation
 from lib.search_utils import (
     DEFAULT_SEARCH_LIMIT,
-    load_movies,
     load_stopwords,
     CACHE_PATH,
     BM25_K1,
     BM25_B,
     format_search_result,
 )
-from nltk.stem import PorterStemmer
+from lib.impact_index import ImpactIndex
+from lib.result_cache import invalidate_result_cache
+from lib.spell import SpellCorrector, get_spell_corrector
+from lib.typeahead import TYPEAHEAD_TOP_K, TypeaheadIndex
+from lib.postings import (
+    ArrayPostings,
+    CompressedPostings,
+    encode_positions,
+    decode_positions,
+)
 from collections import defaultdict, Counter
+from functools import lru_cache
+from typing import Iterable
+import numpy as np
 import pickle
+import time
 import os
 import sys
 import math
 
+# proximity is only scored for the best BM25 candidates so phrase queries stay cheap
+PROXIMITY_CANDIDATES = 50
+PROXIMITY_BOOST = 0.5
+# index files written by build_command, see lib/generations.py
+KEYWORD_INDEX_FILES = (
+    "docstore_*",
+    "vocabulary.pkl",
+    "postings_*",
+    "doc_ids.npy",
+    "doc_lengths.npy",
+    "stem_cache.pkl",
+    "positions.pkl",
+    "impact_*",
+    "typeahead.npz",
+    "spell_index.pkl",
+)
+
 
 def search_command(query: str, limit: int = DEFAULT_SEARCH_LIMIT) -> list[dict]:
     inverted_index = InvertedIndex()
     try:
         inverted_index.load()
     except FileNotFoundError:
-        print(f"Index and docmap files not found in {CACHE_PATH}")
+        print(f"Index files not found in {CACHE_PATH}")
         sys.exit(1)
 
+    phrases, _ = parse_phrase_query(query)
+    if phrases:
+        if inverted_index.positional:
+            return inverted_index.phrase_search(query, limit)
+        print(
+            "Phrase queries need a positional index, run `build --positional`; "
+            "phrases matched as separate words"
+        )
+
     query_tokens = tokenize_text(query)
     results = []
     doc_ids = set()
@@ -36,7 +80,14 @@ def search_command(query: str, limit: int = DEFAULT_SEARCH_LIMIT) -> list[dict]:
             doc = inverted_index.docmap[doc_id]
             if not doc:
                 continue
-            results.append(doc)
+            results.append(
+                format_search_result(
+                    doc_id=doc["id"],
+                    title=doc["title"],
+                    document=doc["description"],
+                    score=0.0,
+                )
+            )
             if len(results) >= limit:
                 break
 
@@ -49,6 +100,34 @@ def preprocess_text(text: str) -> str:
     return text
 
 
+@lru_cache(maxsize=1)
+def get_stopwords() -> frozenset[str]:
+    return frozenset(load_stopwords())
+
+
+@lru_cache(maxsize=1)
+def get_stemmer():
+    # nltk takes ~0.5s to import, so it is only loaded for words missing from the stem cache
+    from nltk.stem import PorterStemmer
+
+    return PorterStemmer()
+
+
+# word (str) -> stem (str), persisted with the index so queries over known words skip nltk
+stem_cache: dict[str, str] = {}
+
+
+def stem_word(word: str) -> str:
+    stem = stem_cache.get(word)
+    if stem is None:
+        stem = get_stemmer().stem(word)
+        stem_cache[word] = stem
+        # the index helpers re-tokenize terms that are already stemmed
+        if stem not in stem_cache:
+            stem_cache[stem] = get_stemmer().stem(stem)
+    return stem
+
+
 def tokenize_text(text: str) -> list[str]:
     text = preprocess_text(text)
     tokens = text.split()
@@ -56,24 +135,56 @@ def tokenize_text(text: str) -> list[str]:
     for token in tokens:
         if token:
             valid_tokens.append(token)
-    stopwords = load_stopwords()
+    stopwords = get_stopwords()
     filtered_words = []
     for word in valid_tokens:
         if word not in stopwords:
             filtered_words.append(word)
-    stemmer = PorterStemmer()
     stemmed_words = []
     for word in filtered_words:
-        stemmed_words.append(stemmer.stem(word))
+        stemmed_words.append(stem_word(word))
     return stemmed_words
 
 
+def parse_phrase_query(query: str) -> tuple[list[list[str]], list[str]]:
+    """Split a query into its quoted phrases and the tokens of the whole query
+
+    Args:
+        query: Raw query, phrases are wrapped in double quotes
+
+    Returns:
+        Tokenized phrases with more than one token, and every query token
+    """
+    phrases = []
+    for phrase in re.findall(r'"([^"]*)"', query):
+        phrase_tokens = tokenize_text(phrase)
+        if len(phrase_tokens) > 1:
+            phrases.append(phrase_tokens)
+    return phrases, tokenize_text(query.replace('"', " "))
+
+
+def min_window(position_lists: list[list[int]]) -> int:
+    # smallest span of token positions that contains one position from every list
+    heap = [(positions[0], i, 0) for i, positions in enumerate(position_lists)]
+    heapq.heapify(heap)
+    current_max = max(positions[0] for positions in position_lists)
+    best = current_max - heap[0][0] + 1
+    while True:
+        position, i, j = heapq.heappop(heap)
+        best = min(best, current_max - position + 1)
+        if j + 1 == len(position_lists[i]):
+            return best
+        next_position = position_lists[i][j + 1]
+        current_max = max(current_max, next_position)
+        heapq.heappush(heap, (next_position, i, j + 1))
+
+
 def tf_command(doc_id: int, term: str) -> int:
     inverted_index = InvertedIndex()
     try:
         inverted_index.load()
     except FileNotFoundError:
-        print(f"Index and docmap files not found in {CACHE_PATH}")
+        print(f"Index files not found in {CACHE_PATH}")
         sys.exit(1)
     return inverted_index.get_tf(doc_id, term)
 
@@ -83,7 +194,7 @@ def idf_command(term: str) -> float:
     try:
         inverted_index.load()
     except FileNotFoundError:
-        print(f"Index and docmap files not found in {CACHE_PATH}")
+        print(f"Index files not found in {CACHE_PATH}")
         sys.exit(1)
     return inverted_index.get_idf(term)
 
@@ -93,7 +204,7 @@ def bm25_idf_command(term: str) -> float:
     try:
         inverted_index.load()
     except FileNotFoundError:
-        print(f"Index and docmap files not found in {CACHE_PATH}")
+        print(f"Index files not found in {CACHE_PATH}")
         sys.exit(1)
     return inverted_index.get_bm25_idf(term)
 
@@ -105,19 +216,77 @@ def bm25_tf_command(
     try:
         inverted_index.load()
     except FileNotFoundError:
-        print(f"Index and docmap files not found in {CACHE_PATH}")
+        print(f"Index files not found in {CACHE_PATH}")
         sys.exit(1)
     return inverted_index.get_bm25_tf(doc_id, term, k1, b)
 
 
-def bm25search_command(query: str, limit: int = DEFAULT_SEARCH_LIMIT) -> list[dict]:
+def bm25search_command(
+    query: str,
+    limit: int = DEFAULT_SEARCH_LIMIT,
+    exact: bool = False,
+    filters: list[str] | None = None,
+) -> list[dict]:
+    inverted_index = InvertedIndex()
+    try:
+        inverted_index.load()
+    except FileNotFoundError:
+        print(f"Index files not found in {CACHE_PATH}")
+        sys.exit(1)
+    doc_filter = resolve_filters(filters)
+    if not exact:
+        impact_index = ImpactIndex(inverted_index.cache_dir)
+        try:
+            impact_index.load()
+        except FileNotFoundError:
+            impact_index = None
+        # impacts are baked for one k1/b, exact scoring covers any other setting
+        if impact_index is not None and impact_index.matches(BM25_K1, BM25_B):
+            return inverted_index.impact_search(query, impact_index, limit, doc_filter)
+    return inverted_index.bm25_search(query, limit, doc_filter)
+
+
+def batch_command(
+    input_path: str = "-",
+    output_path: str = "-",
+    limit: int = DEFAULT_SEARCH_LIMIT,
+    exact: bool = False,
+    batch_size: int = DEFAULT_BATCH_SIZE,
+    checkpoint_path: str | None = None,
+) -> dict:
+    """BM25 search for every query of a JSONL file, loading the index once
+
+    Records may override "limit" and "filters" per query, see lib/batch_search.py.
+    """
     inverted_index = InvertedIndex()
     try:
         inverted_index.load()
     except FileNotFoundError:
-        print(f"Index and docmap files not found in {CACHE_PATH}")
+        print(f"Index files not found in {CACHE_PATH}", file=sys.stderr)
         sys.exit(1)
-    return inverted_index.bm25_search(query, limit)
+    impact_index = None
+    if not exact:
+        impact_index = ImpactIndex(inverted_index.cache_dir)
+        try:
+            impact_index.load()
+        except FileNotFoundError:
+            impact_index = None
+        if impact_index is not None and not impact_index.matches(BM25_K1, BM25_B):
+            impact_index = None
+
+    def search(record: dict) -> list[dict]:
+        record_limit = record.get("limit", limit)
+        doc_filter = resolve_filters(record.get("filters"))
+        if impact_index is not None:
+            return inverted_index.impact_search(
+                record["query"], impact_index, record_limit, doc_filter
+            )
+        return inverted_index.bm25_search(record["query"], record_limit, doc_filter)
+
+    def search_batch(records: list[dict]) -> list[dict]:
+        return [timed(lambda: search(record)) for record in records]
+
+    return run_batch(search_batch, input_path, output_path, batch_size, checkpoint_path)
 
 
 def tfidf_command(doc_id: int, term: str) -> float:
@@ -125,61 +294,126 @@ def tfidf_command(doc_id: int, term: str) -> float:
     try:
         inverted_index.load()
     except FileNotFoundError:
-        print(f"Index and docmap files not found in {CACHE_PATH}")
+        print(f"Index files not found in {CACHE_PATH}")
         sys.exit(1)
     return inverted_index.get_tf_idf(doc_id, term)
 
 
 class InvertedIndex:
-    def __init__(self):
-        self.index = defaultdict(set)  # term (str) -> list of doc_ids[int]
-        self.docmap: dict[
-            int, dict
-        ] = {}  # doc_id (int) -> {id: int, title: str, description: str}
-        self.term_frequncies = defaultdict(
-            Counter
-        )  # doc_id (int) -> counter objects (term (str) -> frequency (int))
-        self.doc_lengths = {}
-
-        self.index_path = os.path.join(CACHE_PATH, "index.pkl")
-        self.docmap_path = os.path.join(CACHE_PATH, "docmap.pkl")
-        self.term_frequncies_path = os.path.join(CACHE_PATH, "term_frequncies.pkl")
-        self.doc_lengths_path = os.path.join(CACHE_PATH, "doc_lengths.pkl")
+    def __init__(
+        self,
+        positional: bool = False,
+        cache_dir: str | None = None,
+        docmap: DocumentStore | None = None,
+    ):
+        cache_dir = cache_dir or index_dir()
+        # doc_id (int) -> {id: int, title: str, description: str}, shared with the other engines
+        # the docstore of the same directory, never one read from a newer CURRENT
+        self.docmap = docmap if docmap is not None else get_document_store(cache_dir)
+        self.vocabulary: dict[str, int] = {}  # term (str) -> term id (int)
+        # term id -> block bit-packed (doc ordinals, term frequencies)
+        self.postings = CompressedPostings()
+        self.doc_ids = np.zeros(0, dtype=np.int64)  # doc ordinal -> doc_id
+        self.doc_lengths = np.zeros(0, dtype=np.int64)  # doc ordinal -> token count
+        self.ordinal_of_id = np.zeros(0, dtype=np.int64)  # doc_id -> doc ordinal or -1
+        self.avg_doc_length = 0.0
+        self.positional = positional
+        self.positions = defaultdict(
+            dict
+        )  # term (str) -> doc_id (int) -> delta + varint encoded token positions (bytes)
+
+        self.cache_dir = cache_dir
+        self.vocabulary_path = os.path.join(cache_dir, "vocabulary.pkl")
+        self.postings_prefix = os.path.join(cache_dir, "postings")
+        self.doc_ids_path = os.path.join(cache_dir, "doc_ids.npy")
+        self.doc_lengths_path = os.path.join(cache_dir, "doc_lengths.npy")
+        self.stem_cache_path = os.path.join(cache_dir, "stem_cache.pkl")
+        self.positions_path = os.path.join(cache_dir, "positions.pkl")
 
     def build(
-        self,
-    ) -> None:  # It should iterate over all the movies and add them to both the index and the docmap.
-        movies = load_movies()
-        for movie in movies:
-            doc_id = movie["id"]
+        self, documents: Iterable[dict] | None = None
+    ) -> None:  # It should iterate over all the movies in the document store and add them to the index.
+        if documents is None:
+            documents = self.docmap.documents()
+        term_postings = defaultdict(list)  # term (str) -> [(doc ordinal, tf)]
+        doc_ids = []
+        doc_lengths = []
+        for ordinal, movie in enumerate(documents):
             doc_description = f"{movie['title']} {movie['description']}"
-            self.docmap[doc_id] = movie
-            self.__add_document(doc_id, doc_description)
-
-    def save(self) -> None:  # It should save the index and the docmap to a file.
+            tokens = tokenize_text(doc_description)
+            doc_ids.append(movie["id"])
+            doc_lengths.append(len(tokens))
+            self.__add_document(ordinal, movie["id"], tokens, term_postings)
+
+        self.vocabulary = {term: term_id for term_id, term in enumerate(term_postings)}
+        self.postings = CompressedPostings.from_lists(
+            [
+                (
+                    np.array([ordinal for ordinal, _ in entries], dtype=np.int64),
+                    np.array([tf for _, tf in entries], dtype=np.int64),
+                )
+                for entries in term_postings.values()
+            ]
+        )
+        self.__set_docs(np.array(doc_ids, dtype=np.int64), np.array(doc_lengths))
+
+    def __set_docs(self, doc_ids: np.ndarray, doc_lengths: np.ndarray) -> None:
+        self.doc_ids = doc_ids
+        self.doc_lengths = doc_lengths
+        self.ordinal_of_id = np.full(
+            int(doc_ids.max()) + 1 if len(doc_ids) else 0, -1, dtype=np.int64
+        )
+        self.ordinal_of_id[doc_ids] = np.arange(len(doc_ids))
+        self.avg_doc_length = float(doc_lengths.mean()) if len(doc_lengths) else 0.0
+
+    def save(self) -> None:  # It should save the index to a file, the docmap lives in the document store.
         # create a folder called cache
-        os.makedirs(CACHE_PATH, exist_ok=True)
-        with open(self.index_path, "wb") as f:
-            pickle.dump(self.index, f)
-        with open(self.docmap_path, "wb") as f:
-            pickle.dump(self.docmap, f)
-        with open(self.term_frequncies_path, "wb") as f:
-            pickle.dump(self.term_frequncies, f)
-        with open(self.doc_lengths_path, "wb") as f:
-            pickle.dump(self.doc_lengths, f)
-        print(f"Index, docmap, tf & doclengths saved to {CACHE_PATH}")
+        os.makedirs(self.cache_dir, exist_ok=True)
+        with open(self.vocabulary_path, "wb") as f:
+            pickle.dump(self.vocabulary, f)
+        self.postings.save(self.postings_prefix)
+        np.save(self.doc_ids_path, self.doc_ids)
+        np.save(self.doc_lengths_path, self.doc_lengths)
+        with open(self.stem_cache_path, "wb") as f:
+            pickle.dump(stem_cache, f)
+        if self.positional:
+            with open(self.positions_path, "wb") as f:
+                pickle.dump(self.positions, f)
+        elif os.path.exists(self.positions_path):
+            os.remove(self.positions_path)
+        print(f"Index, postings & doclengths saved to {self.cache_dir}")
 
     def load(self) -> None:
-        if not os.path.exists(self.index_path) or not os.path.exists(self.docmap_path):
-            raise FileNotFoundError(f"Index and docmap files not found in {CACHE_PATH}")
-        with open(self.index_path, "rb") as f:
-            self.index = pickle.load(f)
-        with open(self.docmap_path, "rb") as f:
-            self.docmap = pickle.load(f)
-        with open(self.term_frequncies_path, "rb") as f:
-            self.term_frequncies = pickle.load(f)
-        with open(self.doc_lengths_path, "rb") as f:
-            self.doc_lengths = pickle.load(f)
+        if not os.path.exists(self.vocabulary_path):
+            raise FileNotFoundError(f"Index files not found in {self.cache_dir}")
+        with open(self.vocabulary_path, "rb") as f:
+            self.vocabulary = pickle.load(f)
+        self.postings.load(self.postings_prefix)
+        self.__set_docs(np.load(self.doc_ids_path), np.load(self.doc_lengths_path))
+        if os.path.exists(self.stem_cache_path):
+            with open(self.stem_cache_path, "rb") as f:
+                stem_cache.update(pickle.load(f))
+        self.positional = os.path.exists(self.positions_path)
+        if self.positional:
+            with open(self.positions_path, "rb") as f:
+                self.positions = pickle.load(f)
+
+    def get_postings(self, token: str, postings=None) -> tuple[np.ndarray, np.ndarray]:
+        # (doc ordinals, term frequencies) of an already tokenized term
+        term_id = self.vocabulary.get(token)
+        if term_id is None:
+            return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.int64)
+        return (postings or self.postings).get(term_id)
+
+    def get_df(self, token: str) -> int:
+        term_id = self.vocabulary.get(token)
+        if term_id is None:
+            return 0
+        return int(self.postings.dfs[term_id])
+
+    def get_doc_id_set(self, token: str) -> set[int]:
+        ordinals, _ = self.get_postings(token)
+        return set(self.doc_ids[ordinals].tolist())
 
     def get_documents(
         self, term: str
@@ -190,48 +424,148 @@ class InvertedIndex:
         if len(tokens) != 1:
             raise ValueError("Term has multiple tokens")
         token = tokens[0]
-        doc_ids = self.index.get(token, set())
-        return sorted(list(doc_ids))
-
-    def __add_document(self, doc_id: int, text: str) -> None:
-        tokens = tokenize_text(text)
-        self.doc_lengths[doc_id] = len(tokens)
-        for token in set(tokens):
-            self.index[token].add(doc_id)
-        self.term_frequncies[doc_id].update(tokens)
-
-    def __get_avg_doc_length(self) -> float:
-        total_length = sum(self.doc_lengths.values())
-        total_docs = len(self.doc_lengths)
-        if total_docs == 0:
+        return sorted(self.get_doc_id_set(token))
+
+    def __add_document(
+        self,
+        ordinal: int,
+        doc_id: int,
+        tokens: list[str],
+        term_postings: dict[str, list[tuple[int, int]]],
+    ) -> None:
+        for token, tf in Counter(tokens).items():
+            term_postings[token].append((ordinal, tf))
+        if self.positional:
+            token_positions = defaultdict(list)
+            for position, token in enumerate(tokens):
+                token_positions[token].append(position)
+            for token, positions in token_positions.items():
+                self.positions[token][doc_id] = encode_positions(positions)
+
+    def get_positions(self, doc_id: int, token: str) -> list[int]:
+        data = self.positions.get(token, {}).get(doc_id)
+        if data is None:
+            return []
+        return decode_positions(data)
+
+    def contains_phrase(self, doc_id: int, phrase_tokens: list[str]) -> bool:
+        starts = set(self.get_positions(doc_id, phrase_tokens[0]))
+        for offset, token in enumerate(phrase_tokens[1:], 1):
+            if not starts:
+                return False
+            positions = set(self.get_positions(doc_id, token))
+            starts = {start for start in starts if start + offset in positions}
+        return bool(starts)
+
+    def proximity_boost(self, doc_id: int, query_tokens: list[str]) -> float:
+        position_lists = []
+        for token in set(query_tokens):
+            positions = self.get_positions(doc_id, token)
+            if positions:
+                position_lists.append(positions)
+        if len(position_lists) < 2:
             return 0.0
-        return total_length / total_docs
+        window = min_window(position_lists)
+        return PROXIMITY_BOOST * len(position_lists) / window
+
+    def phrase_search(
+        self, query: str, limit: int = DEFAULT_SEARCH_LIMIT
+    ) -> list[dict]:
+        if not self.positional:
+            raise ValueError("Phrase search needs an index built with positions")
+        phrases, query_tokens = parse_phrase_query(query)
+
+        if phrases:
+            # every phrase is required, so candidates must contain all of its tokens
+            phrase_tokens = {token for phrase in phrases for token in phrase}
+            candidates = set.intersection(
+                *(self.get_doc_id_set(token) for token in phrase_tokens)
+            )
+            candidates = {
+                doc_id
+                for doc_id in candidates
+                if all(self.contains_phrase(doc_id, phrase) for phrase in phrases)
+            }
+        else:
+            candidates = set()
+            for token in query_tokens:
+                candidates |= self.get_doc_id_set(token)
+
+        bm25_scores = self.bm25_scores(query_tokens)
+        scores = {
+            doc_id: float(bm25_scores[self.ordinal_of_id[doc_id]])
+            for doc_id in candidates
+        }
+        ranked = sorted(scores.items(), key=lambda x: x[1], reverse=True)
+
+        # boosts only raise scores, so re-ranking the head never lets the tail overtake it
+        head = ranked[: max(limit, PROXIMITY_CANDIDATES)]
+        boosted = []
+        for doc_id, score in head:
+            boost = self.proximity_boost(doc_id, query_tokens)
+            boosted.append((doc_id, score * (1 + boost), boost))
+        boosted.sort(key=lambda x: x[1], reverse=True)
+
+        results = []
+        for doc_id, score, boost in boosted[:limit]:
+            doc = self.docmap[doc_id]
+            results.append(
+                format_search_result(
+                    doc_id=doc["id"],
+                    title=doc["title"],
+                    document=doc["description"],
+                    score=score,
+                    proximity_boost=round(boost, 3),
+                )
+            )
+        return results
 
     def get_tf(self, doc_id: int, term: str) -> int:
         tokens = tokenize_text(term)
         if len(tokens) != 1:
             raise ValueError("Term has multiple tokens")
         token = tokens[0]
-        return self.term_frequncies[doc_id][token]
+        if doc_id < 0 or doc_id >= len(self.ordinal_of_id):
+            return 0
+        term_id = self.vocabulary.get(token)
+        if term_id is None:
+            return 0
+        return self.postings.lookup(term_id, int(self.ordinal_of_id[doc_id]))
 
     def get_idf(self, term: str) -> float:
         tokens = tokenize_text(term)
         if len(tokens) != 1:
             raise ValueError("Term has multiple tokens")
         token = tokens[0]
-        doc_count = len(self.docmap)
-        term_count = len(self.index[token])
+        doc_count = len(self.doc_ids)
+        term_count = self.get_df(token)
         return math.log((doc_count + 1) / (term_count + 1))
 
     def get_bm25_idf(self, term: str) -> float:
         tokens = tokenize_text(term)
         if len(tokens) != 1:
             raise ValueError("Term has multiple tokens")
-        token = tokens[0]
-        doc_count = len(self.docmap)
-        term_count = len(self.index[token])
+        return self.__bm25_idf(tokens[0])
+
+    def __bm25_idf(self, token: str, global_stats: dict | None = None) -> float:
+        doc_count = len(self.doc_ids)
+        term_count = self.get_df(token)
+        if global_stats is not None:
+            doc_count = global_stats["doc_count"]
+            term_count = global_stats["dfs"].get(token, 0)
         return math.log((doc_count - term_count + 0.5) / (term_count + 0.5) + 1)
 
+    def get_stats(self) -> dict:
+        # corpus statistics that shards sum up to score BM25 like the unsharded index
+        return {
+            "doc_count": len(self.doc_ids),
+            "total_length": int(self.doc_lengths.sum()),
+            "dfs": {
+                term: int(self.postings.dfs[term_id])
+                for term, term_id in self.vocabulary.items()
+            },
+        }
+
     def get_bm25_tf(
         self, doc_id: int, term: str, k1: float = BM25_K1, b: float = BM25_B
     ) -> float:
@@ -240,9 +574,8 @@ class InvertedIndex:
             raise ValueError("Term has multiple tokens")
         token = tokens[0]
         tf = self.get_tf(doc_id, token)
-        avg_doc_length = self.__get_avg_doc_length()
-        doc_length = self.doc_lengths[doc_id]
-        length_norm = 1 - b + b * (doc_length / avg_doc_length)
+        doc_length = self.doc_lengths[self.ordinal_of_id[doc_id]]
+        length_norm = 1 - b + b * (doc_length / self.avg_doc_length)
         bm25_tf_saturation = (tf * (k1 + 1)) / (tf + k1 * length_norm)
         return bm25_tf_saturation
 
@@ -251,25 +584,95 @@ class InvertedIndex:
         bm25_tf = self.get_bm25_tf(doc_id, term)
         return bm25_idf * bm25_tf
 
-    def bm25_search(self, query: str, limit: int = DEFAULT_SEARCH_LIMIT) -> list[dict]:
+    def bm25_scores(
+        self,
+        query_tokens: list[str],
+        k1: float = BM25_K1,
+        b: float = BM25_B,
+        postings=None,
+        global_stats: dict | None = None,
+        allowed: np.ndarray | None = None,
+    ) -> np.ndarray:
+        # doc ordinal -> BM25 score, accumulated only over the postings of the query tokens.
+        # global_stats (doc_count, avg_doc_length, dfs) replaces the local corpus statistics
+        # when this index is one shard of a larger corpus. allowed (a boolean mask over doc
+        # ordinals) drops the postings of filtered out documents before they are scored.
+        avg_doc_length = self.avg_doc_length
+        if global_stats is not None:
+            avg_doc_length = global_stats["avg_doc_length"]
+        scores = np.zeros(len(self.doc_ids), dtype=np.float64)
+        for token in query_tokens:
+            ordinals, tfs = self.get_postings(token, postings)
+            if allowed is not None:
+                keep = allowed[ordinals]
+                ordinals, tfs = ordinals[keep], tfs[keep]
+            if len(ordinals) == 0:
+                continue
+            length_norm = 1 - b + b * (self.doc_lengths[ordinals] / avg_doc_length)
+            bm25_tf_saturation = (tfs * (k1 + 1)) / (tfs + k1 * length_norm)
+            scores[ordinals] += self.__bm25_idf(token, global_stats) * bm25_tf_saturation
+        return scores
+
+    def allowed_ordinals(self, doc_filter: DocFilter | None) -> np.ndarray | None:
+        # boolean mask over doc ordinals, None when every document is allowed
+        if doc_filter is None:
+            return None
+        return doc_filter.contains(self.doc_ids)
+
+    def ranked_ordinals(self, scores: np.ndarray, allowed: np.ndarray | None) -> np.ndarray:
+        # stable sort keeps ties in catalog order, as the dict based scoring did
+        if allowed is None:
+            return np.argsort(-scores, kind="stable")
+        candidates = np.flatnonzero(allowed)
+        return candidates[np.argsort(-scores[candidates], kind="stable")]
+
+    def bm25_search(
+        self,
+        query: str,
+        limit: int = DEFAULT_SEARCH_LIMIT,
+        doc_filter: DocFilter | None = None,
+    ) -> list[dict]:
         query_tokens = tokenize_text(query)
-        scores = defaultdict(float)
-        for doc_id in self.docmap:
-            score = 0.0
-            for token in query_tokens:
-                score += self.bm25(doc_id, token)
-            scores[doc_id] = score
-        sorted_scores = sorted(scores.items(), key=lambda x: x[1], reverse=True)
-        sorted_scores = sorted_scores[:limit]
+        allowed = self.allowed_ordinals(doc_filter)
+        scores = self.bm25_scores(query_tokens, allowed=allowed)
+        top_ordinals = self.ranked_ordinals(scores, allowed)[:limit]
+        return self.format_ordinals(top_ordinals, scores[top_ordinals])
+
+    def impact_search(
+        self,
+        query: str,
+        impact_index: ImpactIndex,
+        limit: int = DEFAULT_SEARCH_LIMIT,
+        doc_filter: DocFilter | None = None,
+    ) -> list[dict]:
+        term_ids = [
+            self.vocabulary[token]
+            for token in tokenize_text(query)
+            if token in self.vocabulary
+        ]
+        allowed = self.allowed_ordinals(doc_filter)
+        top_ordinals, scores, _ = impact_index.top_k(term_ids, limit, allowed)
+        matched = scores > 0
+        top_ordinals, scores = top_ordinals[matched], scores[matched]
+        if len(top_ordinals) < limit:
+            # exact scoring ranks every allowed document, those matching no query term last
+            # at 0 in catalog order; the same fill keeps both paths' results identical
+            unmatched = np.arange(len(self.doc_ids)) if allowed is None else np.flatnonzero(allowed)
+            unmatched = unmatched[~np.isin(unmatched, top_ordinals)][: limit - len(top_ordinals)]
+            top_ordinals = np.concatenate([top_ordinals, unmatched])
+            scores = np.concatenate([scores, np.zeros(len(unmatched))])
+        return self.format_ordinals(top_ordinals, scores)
+
+    def format_ordinals(self, ordinals: np.ndarray, scores: np.ndarray) -> list[dict]:
         results = []
-        for doc_id, score in sorted_scores:
-            doc = self.docmap[doc_id]
+        for ordinal, score in zip(ordinals, scores):
+            doc = self.docmap[int(self.doc_ids[ordinal])]
             results.append(
                 format_search_result(
                     doc_id=doc["id"],
                     title=doc["title"],
                     document=doc["description"],
-                    score=score,
+                    score=float(score),
                 )
             )
         return results
@@ -280,7 +683,199 @@ class InvertedIndex:
         return tf * idf
 
 
-def build_command() -> None:
-    inverted_index = InvertedIndex()
+def build_command(positional: bool = False) -> None:
+    # the build is the one place the catalog JSON is parsed. Everything is written to a
+    # staging generation that only becomes current once complete, so a process loading the
+    # index meanwhile keeps reading the previous generation in full.
+    staging = start_generation("keyword")
+    document_store = DocumentStore(staging)
+    document_store.build()
+    document_store.save()
+    inverted_index = InvertedIndex(positional, staging, document_store)
     inverted_index.build()
     inverted_index.save()
+    impact_index = ImpactIndex(staging)
+    impact_index.build(inverted_index)
+    impact_index.save()
+    typeahead_index = build_typeahead(inverted_index)
+    typeahead_index.save()
+    spell_corrector = build_spell_corrector(inverted_index)
+    spell_corrector.save()
+    publish_generation(staging, KEYWORD_INDEX_FILES)
+    load_document_store.cache_clear()
+    get_spell_corrector.cache_clear()
+    invalidate_result_cache()
+
+
+def build_typeahead(inverted_index: InvertedIndex) -> TypeaheadIndex:
+    """Typeahead over titles weighted by their document's BM25 score for the title itself,
+    and over catalog words weighted by the document frequency of their indexed stem"""
+    titles = []
+    word_counts = Counter()
+    for ordinal, doc in enumerate(inverted_index.docmap.documents()):
+        title_tokens = tokenize_text(doc["title"])
+        weight = 0.0
+        if title_tokens:
+            weight = float(inverted_index.bm25_scores(title_tokens)[ordinal])
+        titles.append((doc["id"], doc["title"], weight))
+        word_counts.update(preprocess_text(f"{doc['title']} {doc['description']}").split())
+
+    stopwords = get_stopwords()
+    terms = []
+    for word, count in word_counts.items():
+        if word in stopwords:
+            continue
+        df = inverted_index.get_df(stem_word(word))
+        if df:
+            terms.append((word, df, count))
+    # the more common surface form of a stem wins ties
+    terms.sort(key=lambda term: (-term[1], -term[2], term[0]))
+
+    typeahead_index = TypeaheadIndex(inverted_index.cache_dir)
+    typeahead_index.build(titles, [(word, float(df)) for word, df, _ in terms])
+    return typeahead_index
+
+
+def catalog_word_counts(inverted_index: InvertedIndex) -> Counter:
+    word_counts = Counter()
+    for doc in inverted_index.docmap.documents():
+        word_counts.update(preprocess_text(f"{doc['title']} {doc['description']}").split())
+    return word_counts
+
+
+def surface_forms(inverted_index: InvertedIndex) -> dict[str, str]:
+    """Indexed stem -> its most common surface word in the catalog"""
+    stopwords = get_stopwords()
+    best: dict[str, tuple[int, str]] = {}
+    for word, count in catalog_word_counts(inverted_index).items():
+        if word in stopwords:
+            continue
+        stem = stem_word(word)
+        if stem in inverted_index.vocabulary and (-count, word) < best.get(stem, (1, "")):
+            best[stem] = (-count, word)
+    return {stem: word for stem, (_, word) in best.items()}
+
+
+def build_spell_corrector(inverted_index: InvertedIndex) -> SpellCorrector:
+    """Spell dictionary of the catalog's title and description words whose stem is indexed,
+    counted by occurrences; stopwords and inflections of indexed stems are known words but
+    never correction targets"""
+    word_counts = catalog_word_counts(inverted_index)
+    stopwords = get_stopwords()
+    dictionary = {
+        word: count
+        for word, count in word_counts.items()
+        if word not in stopwords and stem_word(word) in inverted_index.vocabulary
+    }
+    spell_corrector = SpellCorrector(inverted_index.cache_dir)
+    spell_corrector.build(
+        dictionary, skip_words=stopwords, known_stems=inverted_index.vocabulary
+    )
+    return spell_corrector
+
+
+def suggest_command(prefix: str, limit: int = TYPEAHEAD_TOP_K) -> dict:
+    typeahead_index = TypeaheadIndex()
+    try:
+        typeahead_index.load()
+    except FileNotFoundError:
+        print(f"Typeahead index not found in {CACHE_PATH}, run `build` first")
+        sys.exit(1)
+    start = time.perf_counter()
+    suggestions = typeahead_index.suggest(prefix, limit)
+    suggestions["elapsed_ms"] = (time.perf_counter() - start) * 1000
+    return suggestions
+
+
+def postings_report_command(queries: list[str], repeats: int = 20) -> dict:
+    inverted_index = InvertedIndex()
+    try:
+        inverted_index.load()
+    except FileNotFoundError:
+        print(f"Index files not found in {CACHE_PATH}")
+        sys.exit(1)
+    compressed = inverted_index.postings
+    arrays = ArrayPostings(compressed)
+
+    latencies = {}
+    for name, postings in (("compressed", compressed), ("uncompressed", arrays)):
+        start = time.perf_counter()
+        for _ in range(repeats):
+            for query in queries:
+                inverted_index.bm25_scores(tokenize_text(query), postings=postings)
+        elapsed = time.perf_counter() - start
+        latencies[name] = elapsed * 1000 / (repeats * len(queries))
+
+    return {
+        "terms": len(inverted_index.vocabulary),
+        "postings": int(compressed.dfs.sum()),
+        "compressed_bytes": compressed.nbytes,
+        "uncompressed_bytes": arrays.nbytes,
+        "queries": len(queries),
+        "compressed_ms": latencies["compressed"],
+        "uncompressed_ms": latencies["uncompressed"],
+    }
+
+
+def impact_report_command(
+    queries: list[str], limit: int = DEFAULT_SEARCH_LIMIT, repeats: int = 20
+) -> dict:
+    inverted_index = InvertedIndex()
+    impact_index = ImpactIndex(inverted_index.cache_dir)
+    try:
+        inverted_index.load()
+        impact_index.load()
+    except FileNotFoundError:
+        print(f"Index files not found in {CACHE_PATH}")
+        sys.exit(1)
+
+    query_tokens = [tokenize_text(query) for query in queries]
+    query_term_ids = [
+        [inverted_index.vocabulary[t] for t in tokens if t in inverted_index.vocabulary]
+        for tokens in query_tokens
+    ]
+
+    start = time.perf_counter()
+    for _ in range(repeats):
+        for tokens in query_tokens:
+            scores = inverted_index.bm25_scores(tokens)
+            np.argsort(-scores, kind="stable")[:limit]
+    exact_ms = (time.perf_counter() - start) * 1000 / (repeats * len(queries))
+
+    start = time.perf_counter()
+    for _ in range(repeats):
+        for term_ids in query_term_ids:
+            impact_index.top_k(term_ids, limit)
+    impact_ms = (time.perf_counter() - start) * 1000 / (repeats * len(queries))
+
+    total_postings = 0
+    accumulated = 0
+    overlap = 0
+    max_error = 0.0
+    for tokens, term_ids in zip(query_tokens, query_term_ids):
+        exact_scores = inverted_index.bm25_scores(tokens)
+        exact_top = np.argsort(-exact_scores, kind="stable")[:limit]
+        impact_top, _, visited = impact_index.top_k(term_ids, limit)
+        total_postings += sum(int(inverted_index.postings.dfs[t]) for t in term_ids)
+        accumulated += visited
+        overlap += len(set(exact_top.tolist()) & set(impact_top.tolist()))
+        quantized = impact_index.scores(term_ids)
+        if len(exact_scores):
+            max_error = max(max_error, float(np.abs(quantized - exact_scores).max()))
+
+    return {
+        "queries": len(queries),
+        "limit": limit,
+        "impact_bytes": int(
+            impact_index.offsets.nbytes
+            + impact_index.ordinals.nbytes
+            + impact_index.impacts.nbytes
+            + impact_index.scales.nbytes
+        ),
+        "exact_ms": exact_ms,
+        "impact_ms": impact_ms,
+        "postings": total_postings,
+        "accumulated": accumulated,
+        "overlap": overlap / (limit * len(queries)) if queries else 0.0,
+        "max_error": max_error,
+    }
@@ -0,0 +1,279 @@
+import asyncio
+import hashlib
+import importlib
+import json
+import re
+import threading
+import time
+from collections import deque
+from dataclasses import dataclass
+from functools import lru_cache
+from typing import Any, Awaitable, Callable, Iterable
+
+from .search_utils import (
+    FAKE_LLM_RESPONDER,
+    GEMINI_FLASH_MODEL,
+    LLM_BACKEND,
+    LLM_CONCURRENCY,
+    LLM_RPM,
+    load_llm_client,
+)
+
+# latencies kept for the percentiles of stats()
+LLM_LATENCY_WINDOW = 1000
+# simulated round trip of the fake backend
+FAKE_LLM_LATENCY = 0.05
+
+
+@dataclass
+class LLMResponse:
+    text: str
+    input_tokens: int = 0
+    output_tokens: int = 0
+
+    @property
+    def total_tokens(self) -> int:
+        return self.input_tokens + self.output_tokens
+
+
+class GeminiBackend:
+    """Gemini through one client for the whole process, so its HTTP connections are reused"""
+
+    def __init__(self):
+        from dotenv import load_dotenv
+
+        load_dotenv()
+        self.client = load_llm_client()
+
+    async def generate(self, model: str, contents: Any) -> LLMResponse:
+        response = await self.client.aio.models.generate_content(
+            model=model, contents=contents
+        )
+        usage = response.usage_metadata
+        if usage is None:
+            return LLMResponse(response.text or "")
+        # thinking tokens are billed as output
+        return LLMResponse(
+            text=response.text or "",
+            input_tokens=usage.prompt_token_count or 0,
+            output_tokens=(usage.candidates_token_count or 0)
+            + (usage.thoughts_token_count or 0),
+        )
+
+
+def echo_query(prompt: str) -> str:
+    """The quoted query of a prompt (`Query: "..."` or `Original: "..."`), else nothing"""
+    match = re.search(r'(?:Query|Original): "([^"]*)"', prompt)
+    return match.group(1) if match else ""
+
+
+def fake_response(prompt: str) -> str:
+    """A well-formed answer to each kind of prompt the app sends
+
+    Reranking gets a score from the words the movie shares with the query, batch reranking
+    the prompt's ids in the given order, evaluation a 0 per result; spell correction,
+    rewrites and expansions get the query back unchanged.
+    """
+    query = echo_query(prompt)
+    if prompt.startswith("Rate how well this movie matches"):
+        movie = re.search(r"^Movie: (.*)$", prompt, re.MULTILINE)
+        movie_words = set(movie.group(1).lower().split()) if movie else set()
+        return str(min(10, 2 * len(set(query.lower().split()) & movie_words)))
+    if prompt.startswith("Rank these movies by relevance"):
+        ids = re.findall(r"^id: (\d+),", prompt, re.MULTILINE)
+        return json.dumps([int(doc_id) for doc_id in ids])
+    if prompt.startswith("Rate how relevant each result is"):
+        return json.dumps([0] * len(re.findall(r"^\d+\. ", prompt, re.MULTILINE)))
+    return query
+
+
+def load_responder(spec: str) -> Callable[[str], str]:
+    """The function a `module:function` spec names"""
+    module_name, _, function_name = spec.partition(":")
+    if not function_name:
+        raise ValueError(
+            f"Expected module:function for the fake LLM responder, not '{spec}'"
+        )
+    return getattr(importlib.import_module(module_name), function_name)
+
+
+class FakeBackend:
+    """Local stand-in for the LLM: respond(prompt) -> text after a simulated latency
+
+    The default responder is fake_response, or the function HOOPLA_FAKE_LLM_RESPONDER names;
+    benchmarks pass their own.
+    """
+
+    def __init__(
+        self,
+        respond: Callable[[str], str] | None = None,
+        latency: float = FAKE_LLM_LATENCY,
+    ):
+        if respond is None and FAKE_LLM_RESPONDER:
+            respond = load_responder(FAKE_LLM_RESPONDER)
+        self.respond = respond or fake_response
+        self.latency = latency
+        self.prompts: list[str] = []
+
+    async def generate(self, model: str, contents: Any) -> LLMResponse:
+        prompt = contents if isinstance(contents, str) else " ".join(
+            part for part in contents if isinstance(part, str)
+        )
+        self.prompts.append(prompt)
+        await asyncio.sleep(self.latency)
+        text = self.respond(prompt)
+        return LLMResponse(text, len(prompt.split()), len(text.split()))
+
+
+LLM_BACKENDS: dict[str, Callable[[], Any]] = {
+    "gemini": GeminiBackend,
+    "fake": FakeBackend,
+}
+
+
+def prompt_key(model: str, contents: Any) -> str | None:
+    """Key identical requests share while in flight, None for contents that are not text"""
+    if isinstance(contents, str):
+        parts = [contents]
+    elif isinstance(contents, (list, tuple)) and all(isinstance(p, str) for p in contents):
+        parts = list(contents)
+    else:
+        return None
+    return hashlib.sha256(json.dumps([model, parts]).encode()).hexdigest()
+
+
+class LLMGateway:
+    """Every LLM call of the process goes through here
+
+    Requests run on one event loop owned by a daemon thread, so the backend's client, the
+    requests-per-minute window, the concurrency semaphore and the in-flight table are shared
+    by every caller whatever thread it runs on. Identical text prompts in flight at the same
+    time are sent once and all callers get the same response.
+    """
+
+    def __init__(
+        self,
+        backend: Any = None,
+        rpm: int = LLM_RPM,
+        concurrency: int = LLM_CONCURRENCY,
+    ):
+        self.backend = backend
+        self.rpm = rpm
+        self.concurrency = concurrency
+        self.loop = asyncio.new_event_loop()
+        threading.Thread(target=self.loop.run_forever, daemon=True).start()
+        self.semaphore = asyncio.Semaphore(concurrency)
+        self.started: deque[float] = deque()  # start times of the last minute's requests
+        self.in_flight: dict[str, asyncio.Future] = {}
+        self.latencies_ms: deque[float] = deque(maxlen=LLM_LATENCY_WINDOW)
+        self.counters = {
+            "calls": 0,
+            "coalesced": 0,
+            "errors": 0,
+            "input_tokens": 0,
+            "output_tokens": 0,
+            "throttled_ms": 0.0,
+        }
+
+    def get_backend(self) -> Any:
+        # created on first use, so importing the gateway never imports google.genai
+        if self.backend is None:
+            self.backend = LLM_BACKENDS[LLM_BACKEND]()
+        return self.backend
+
+    async def throttle(self) -> None:
+        while self.rpm > 0:
+            now = time.monotonic()
+            while self.started and now - self.started[0] >= 60:
+                self.started.popleft()
+            if len(self.started) < self.rpm:
+                self.started.append(now)
+                return
+            wait = 60 - (now - self.started[0])
+            self.counters["throttled_ms"] += wait * 1000
+            await asyncio.sleep(wait)
+
+    async def call(self, model: str, contents: Any) -> LLMResponse:
+        async with self.semaphore:
+            await self.throttle()
+            start = time.perf_counter()
+            try:
+                response = await self.get_backend().generate(model, contents)
+            except Exception:
+                self.counters["errors"] += 1
+                raise
+            self.latencies_ms.append((time.perf_counter() - start) * 1000)
+        self.counters["calls"] += 1
+        self.counters["input_tokens"] += response.input_tokens
+        self.counters["output_tokens"] += response.output_tokens
+        return response
+
+    async def request(self, contents: Any, model: str) -> LLMResponse:
+        key = prompt_key(model, contents)
+        if key is None:
+            return await self.call(model, contents)
+        if key in self.in_flight:
+            self.counters["coalesced"] += 1
+            return await asyncio.shield(self.in_flight[key])
+        task = asyncio.ensure_future(self.call(model, contents))
+        self.in_flight[key] = task
+        task.add_done_callback(lambda _: self.in_flight.pop(key, None))
+        return await asyncio.shield(task)
+
+    def submit(self, contents: Any, model: str = GEMINI_FLASH_MODEL):
+        return asyncio.run_coroutine_threadsafe(self.request(contents, model), self.loop)
+
+    def generate(self, contents: Any, model: str = GEMINI_FLASH_MODEL) -> LLMResponse:
+        """Blocking call, safe from any thread"""
+        return self.submit(contents, model).result()
+
+    def generate_many(
+        self, prompts: Iterable[Any], model: str = GEMINI_FLASH_MODEL
+    ) -> list[LLMResponse]:
+        """Send all prompts at once, within the concurrency and rate limits; in order"""
+        futures = [self.submit(contents, model) for contents in prompts]
+        return [future.result() for future in futures]
+
+    def agenerate(
+        self, contents: Any, model: str = GEMINI_FLASH_MODEL
+    ) -> Awaitable[LLMResponse]:
+        """Awaitable from any other event loop"""
+        return asyncio.wrap_future(self.submit(contents, model))
+
+    def stats(self) -> dict:
+        # read on the loop's thread, so no request updates the counters meanwhile
+        return asyncio.run_coroutine_threadsafe(self.snapshot(), self.loop).result()
+
+    async def snapshot(self) -> dict:
+        latencies = sorted(self.latencies_ms)
+
+        def percentile(p: float) -> float:
+            if not latencies:
+                return 0.0
+            return round(latencies[min(int(p * len(latencies)), len(latencies) - 1)], 3)
+
+        return {
+            **self.counters,
+            "throttled_ms": round(self.counters["throttled_ms"], 3),
+            "p50_ms": percentile(0.5),
+            "p95_ms": percentile(0.95),
+            "max_ms": round(latencies[-1], 3) if latencies else 0.0,
+        }
+
+
+@lru_cache(maxsize=1)
+def get_llm_gateway() -> LLMGateway:
+    return LLMGateway()
+
+
+def generate_text(contents: Any, model: str = GEMINI_FLASH_MODEL) -> str:
+    return get_llm_gateway().generate(contents, model).text
+
+
+def format_llm_stats(stats: dict) -> str:
+    return (
+        f"LLM: {stats['calls']} calls ({stats['coalesced']} coalesced, "
+        f"{stats['errors']} errors), p50 {stats['p50_ms']:.0f} ms, "
+        f"p95 {stats['p95_ms']:.0f} ms, {stats['input_tokens']} input / "
+        f"{stats['output_tokens']} output tokens, throttled {stats['throttled_ms']:.0f} ms"
+    )
@@ -1,37 +1,179 @@
-from PIL import Image
-from sentence_transformers import SentenceTransformer
-from lib.semantic_search import cosine_similarity
-from lib.search_utils import load_movies
+import hashlib
+import json
+import os
+import time
+
+import numpy as np
+
+from lib.document_store import DocumentStore, get_document_store
+from lib.image_pipeline import CLIP_IMAGE_SIZE, ImageCache, ImageSource, downscale
+from lib.search_utils import CACHE_PATH, DEFAULT_SEARCH_LIMIT
+
+IMAGE_EXTENSIONS = (".jpg", ".jpeg", ".png", ".webp", ".gif", ".bmp")
+
 
 class MultimodalSearch:
-    def __init__(self, model_name="clip-ViT-B-32", documents: list[dict] = None):
-        self.model = SentenceTransformer(model_name)
+    def __init__(self, model_name="clip-ViT-B-32", documents: DocumentStore = None):
+        self.model_name = model_name
+        self._model = None
         self.documents = documents
-        self.texts = [f"{doc['title']}: {doc['description']}" for doc in documents]
-        self.embeddings = self.model.encode(self.texts, show_progress_bar=True)
-    
+        self.embeddings = None  # L2-normalized CLIP text embeddings, one row per document
+        self.image_cache = ImageCache()
+        self.image_report: dict = {}  # what the last embed_images call cost and saved
+
+        self.embeddings_path = os.path.join(CACHE_PATH, "clip_text_embeddings.npy")
+        self.fingerprint_path = os.path.join(CACHE_PATH, "clip_text_embeddings.json")
+
+    @property
+    def model(self):
+        if self._model is None:
+            from sentence_transformers import SentenceTransformer
+
+            self._model = SentenceTransformer(self.model_name)
+        return self._model
+
+    def document_texts(self) -> list[str]:
+        if self.documents is None:
+            raise ValueError("No documents provided to MultimodalSearch")
+        return [
+            f"{doc['title']}: {doc['description']}" for doc in self.documents.documents()
+        ]
+
+    def fingerprint(self, texts: list[str]) -> str:
+        digest = hashlib.sha256(self.model_name.encode())
+        for text in texts:
+            digest.update(b"\0")
+            digest.update(text.encode())
+        return digest.hexdigest()
+
+    def build_embeddings(self, texts: list[str], fingerprint: str) -> np.ndarray:
+        embeddings = self.model.encode(texts, show_progress_bar=True)
+        self.embeddings = normalize_rows(np.asarray(embeddings, dtype=np.float32))
+        os.makedirs(CACHE_PATH, exist_ok=True)
+        np.save(self.embeddings_path, self.embeddings)
+        with open(self.fingerprint_path, "w") as f:
+            json.dump(
+                {
+                    "model": self.model_name,
+                    "fingerprint": fingerprint,
+                    "count": len(texts),
+                },
+                f,
+                indent=2,
+            )
+        print(f"CLIP text embeddings saved to {self.embeddings_path}")
+        return self.embeddings
+
+    def load_or_create_embeddings(self) -> np.ndarray:
+        if self.embeddings is not None:
+            return self.embeddings
+        texts = self.document_texts()
+        fingerprint = self.fingerprint(texts)
+        if os.path.exists(self.embeddings_path) and os.path.exists(
+            self.fingerprint_path
+        ):
+            with open(self.fingerprint_path, "r") as f:
+                saved = json.load(f)
+            if saved.get("fingerprint") == fingerprint:
+                self.embeddings = np.load(self.embeddings_path)
+                return self.embeddings
+        return self.build_embeddings(texts, fingerprint)
+
     def embed_image(self, image_path: str):
-        image = Image.open(image_path)
-        embedding = self.model.encode([image])
-        return embedding[0]
-    
-    def search_with_image(self, image_path: str):
-        image = Image.open(image_path)
+        return self.embed_images([image_path])[0]
+
+    def embed_images(self, image_paths: list[str]) -> np.ndarray:
+        """CLIP embeddings of the images, cached by image content
+
+        Each file is read and decoded once, straight at CLIP's input resolution, and only the
+        images missing from the cache are encoded, in one batch.
+        """
+        variant = f"clip-{self.model_name.replace('/', '__')}"
+        sources = [ImageSource(image_path) for image_path in image_paths]
+        embeddings: list[np.ndarray | None] = []
+        saved_ms = 0.0
+        for source in sources:
+            cached = self.image_cache.get(source.sha256, variant)
+            embeddings.append(None if cached is None else cached["data"])
+            saved_ms += 0.0 if cached is None else cached["encode_ms"]
+        missing = [i for i, embedding in enumerate(embeddings) if embedding is None]
+
+        start = time.perf_counter()
+        images = [
+            downscale(
+                sources[i].decode(CLIP_IMAGE_SIZE), CLIP_IMAGE_SIZE, shorter_side=True
+            )
+            for i in missing
+        ]
+        prepare_ms = (time.perf_counter() - start) * 1000
+        encode_ms = 0.0
+        if images:
+            start = time.perf_counter()
+            encoded = np.asarray(
+                self.model.encode(images, batch_size=len(images)), dtype=np.float32
+            )
+            encode_ms = (time.perf_counter() - start) * 1000
+            for i, embedding in zip(missing, encoded):
+                embeddings[i] = embedding
+                self.image_cache.put(
+                    sources[i].sha256,
+                    variant,
+                    {
+                        "data": embedding,
+                        # this image's part of the batch, what a later hit saves
+                        "encode_ms": (prepare_ms + encode_ms) / len(images),
+                    },
+                )
+        self.image_report = {
+            "images": len(sources),
+            "cache_hits": len(sources) - len(missing),
+            "original_bytes": sum(len(source.data) for source in sources),
+            "prepare_ms": round(prepare_ms, 3),
+            "encode_ms": round(encode_ms, 3),
+            "saved_ms": round(saved_ms, 3),
+        }
+        return np.stack(embeddings).astype(np.float32)
+
+    def search_with_embeddings(
+        self, query_embeddings: np.ndarray, limit: int = DEFAULT_SEARCH_LIMIT
+    ) -> list[list[dict]]:
+        embeddings = self.load_or_create_embeddings()
+        similarities = normalize_rows(query_embeddings) @ embeddings.T
+        limit = min(limit, similarities.shape[1])
+        all_results = []
+        for row in similarities:
+            top = np.argpartition(-row, limit - 1)[:limit]
+            top = top[np.argsort(-row[top])]
+            results = []
+            for i in top:
+                doc = self.documents.document_at(int(i))
+                results.append(
+                    {
+                        "title": doc["title"],
+                        "description": doc["description"],
+                        "similarity": float(row[i]),
+                        "doc_id": doc["id"],
+                    }
+                )
+            all_results.append(results)
+        return all_results
+
+    def search_with_image(self, image_path: str, limit: int = DEFAULT_SEARCH_LIMIT):
         image_embedding = self.embed_image(image_path)
-        results = []
-        for i, embedding in enumerate(self.embeddings,):
-            similarity = cosine_similarity(image_embedding, embedding)
-            results.append({
-                "title": self.documents[i]["title"],
-                "description": self.documents[i]["description"],
-                "similarity": similarity,
-                "doc_id": self.documents[i]["id"],
-            })
-        results = sorted(results, key=lambda x: x["similarity"], reverse=True)
-        results = results[:5]
-        return results
-        
-        
+        return self.search_with_embeddings(image_embedding[np.newaxis, :], limit)[0]
+
+    def search_with_images(
+        self, image_paths: list[str], limit: int = DEFAULT_SEARCH_LIMIT
+    ) -> list[list[dict]]:
+        image_embeddings = self.embed_images(image_paths)
+        return self.search_with_embeddings(image_embeddings, limit)
+
+
+def normalize_rows(matrix: np.ndarray) -> np.ndarray:
+    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return matrix / norms
+
 
 def verify_image_embedding(image_path: str):
     multimodal_search = MultimodalSearch()
@@ -39,12 +181,45 @@ def verify_image_embedding(image_path: str):
     print(f"Image: {image_path}")
     print(f"First 5 dimensions: {embedding[:5]}")
     print(f"Embedding shape: {embedding.shape[0]} dimensions")
-    
+
+
 def search_with_image(image_path: str):
-    movies = load_movies()
+    movies = get_document_store()
     multimodal_search = MultimodalSearch(documents=movies)
     results = multimodal_search.search_with_image(image_path)
+    print_image_results(results)
+    print(format_embedding_report(multimodal_search.image_report))
+
+
+def search_with_image_directory(directory: str, limit: int = DEFAULT_SEARCH_LIMIT):
+    image_paths = sorted(
+        os.path.join(directory, name)
+        for name in os.listdir(directory)
+        if name.lower().endswith(IMAGE_EXTENSIONS)
+    )
+    if not image_paths:
+        print(f"No images found in {directory}")
+        return
+    movies = get_document_store()
+    multimodal_search = MultimodalSearch(documents=movies)
+    all_results = multimodal_search.search_with_images(image_paths, limit)
+    for image_path, results in zip(image_paths, all_results):
+        print(f"Image: {image_path}")
+        print_image_results(results)
+        print()
+    print(format_embedding_report(multimodal_search.image_report))
+
+
+def print_image_results(results: list[dict]):
     for i, result in enumerate(results, 1):
         print(f"{i}. {result['title']} (similarity: {result['similarity']:.3f})")
         print(f"   {result['description'][:100]}...")
-    
\ No newline at end of file
+
+
+def format_embedding_report(report: dict) -> str:
+    return (
+        f"Images: {report['images']} ({report['cache_hits']} cached), "
+        f"{report['original_bytes'] / 1024:.1f} KiB read, "
+        f"prepared in {report['prepare_ms']:.1f} ms, encoded in {report['encode_ms']:.1f} ms, "
+        f"~{report['saved_ms']:.0f} ms saved by the cache"
+    )
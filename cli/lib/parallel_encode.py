@@ -0,0 +1,124 @@
+import multiprocessing
+import os
+import time
+from collections import deque
+from typing import Callable, Iterable, Iterator
+
+import numpy as np
+
+from .search_utils import INFERENCE_BACKEND
+
+# batches in flight per worker; bounds memory while keeping every worker busy
+BATCHES_PER_WORKER = 2
+
+worker_model = None
+
+
+def worker_threads(workers: int) -> int:
+    return max(1, (os.cpu_count() or 1) // workers)
+
+
+def init_encode_worker(model_name: str, threads: int, backend: str) -> None:
+    # thread pools are sized when torch / the BLAS libraries load, so limit them first
+    for variable in ("OMP_NUM_THREADS", "MKL_NUM_THREADS", "OPENBLAS_NUM_THREADS"):
+        os.environ[variable] = str(threads)
+    os.environ["TOKENIZERS_PARALLELISM"] = "false"
+    from .inference_backend import load_bi_encoder
+
+    try:
+        import torch
+
+        torch.set_num_threads(threads)
+    except ImportError:
+        pass
+
+    global worker_model
+    worker_model = load_bi_encoder(model_name, backend)
+
+
+def encode_in_worker(texts: list[str]) -> np.ndarray:
+    return np.asarray(worker_model.encode(texts), dtype=np.float32)
+
+
+class ParallelEncoder:
+    """Encode batches of sentences across a pool of worker processes, in input order
+
+    With a single worker the batches are encoded in this process by encode, so the
+    model that is already loaded gets reused.
+    """
+
+    def __init__(
+        self,
+        model_name: str,
+        workers: int = 1,
+        encode: Callable[[list[str]], np.ndarray] | None = None,
+        threads_per_worker: int | None = None,
+        backend: str = INFERENCE_BACKEND,
+    ):
+        self.model_name = model_name
+        self.backend = backend
+        self.workers = max(1, workers)
+        self.encode = encode
+        self.threads_per_worker = threads_per_worker or worker_threads(self.workers)
+        self.pool = None
+        self.sentences = 0
+        self.elapsed = 0.0
+
+    def __enter__(self) -> "ParallelEncoder":
+        if self.workers > 1:
+            context = multiprocessing.get_context("spawn")
+            self.pool = context.Pool(
+                self.workers,
+                initializer=init_encode_worker,
+                initargs=(self.model_name, self.threads_per_worker, self.backend),
+            )
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        if self.pool is not None:
+            self.pool.terminate()
+            self.pool.join()
+            self.pool = None
+
+    def encode_batches(
+        self, batches: Iterable[tuple[list[str], object]]
+    ) -> Iterator[tuple[np.ndarray, object]]:
+        """Yield (embeddings, payload) for every (texts, payload) batch, in input order"""
+        start = time.perf_counter()
+        if self.pool is None:
+            for texts, payload in batches:
+                embeddings = np.asarray(self.encode(texts), dtype=np.float32)
+                self.record(len(texts), start)
+                yield embeddings, payload
+            return
+
+        pending = deque()  # (async result, texts count, payload), oldest first
+        for texts, payload in batches:
+            pending.append(
+                (self.pool.apply_async(encode_in_worker, (texts,)), len(texts), payload)
+            )
+            if len(pending) >= self.workers * BATCHES_PER_WORKER:
+                result, count, oldest_payload = pending.popleft()
+                embeddings = result.get()
+                self.record(count, start)
+                yield embeddings, oldest_payload
+        while pending:
+            result, count, payload = pending.popleft()
+            embeddings = result.get()
+            self.record(count, start)
+            yield embeddings, payload
+
+    def record(self, count: int, start: float) -> None:
+        self.sentences += count
+        self.elapsed = time.perf_counter() - start
+
+    @property
+    def sentences_per_second(self) -> float:
+        return self.sentences / self.elapsed if self.elapsed else 0.0
+
+    def report(self) -> str:
+        return (
+            f"Encoded {self.sentences} sentences in {self.elapsed:.1f}s "
+            f"({self.sentences_per_second:.1f} sentences/sec, {self.workers} workers "
+            f"x {self.threads_per_worker} threads)"
+        )
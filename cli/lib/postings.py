@@ -0,0 +1,214 @@
+import numpy as np
+
+
+def encode_varint(values: list[int]) -> bytes:
+    # 7 bits per byte, high bit set on every byte except the last one of a value
+    out = bytearray()
+    for value in values:
+        if value < 0:
+            raise ValueError("Varint values must be non-negative")
+        while value >= 0x80:
+            out.append((value & 0x7F) | 0x80)
+            value >>= 7
+        out.append(value)
+    return bytes(out)
+
+
+def decode_varint(data: bytes) -> list[int]:
+    values = []
+    value = 0
+    shift = 0
+    for byte in data:
+        value |= (byte & 0x7F) << shift
+        if byte & 0x80:
+            shift += 7
+        else:
+            values.append(value)
+            value = 0
+            shift = 0
+    return values
+
+
+def delta_encode(values: list[int]) -> list[int]:
+    gaps = []
+    previous = 0
+    for value in values:
+        gaps.append(value - previous)
+        previous = value
+    return gaps
+
+
+def delta_decode(gaps: list[int]) -> list[int]:
+    values = []
+    total = 0
+    for gap in gaps:
+        total += gap
+        values.append(total)
+    return values
+
+
+def encode_positions(positions: list[int]) -> bytes:
+    return encode_varint(delta_encode(positions))
+
+
+def decode_positions(data: bytes) -> list[int]:
+    return delta_decode(decode_varint(data))
+
+
+# Doc-level postings are stored per term as blocks of POSTINGS_BLOCK_SIZE entries. A block is
+# a 6 byte header (first doc ordinal as uint32, bit width of the ordinal gaps, bit width of
+# tf - 1) followed by the gaps and then the term frequencies, each bit-packed at that width.
+POSTINGS_BLOCK_SIZE = 128
+BLOCK_HEADER_BYTES = 6
+
+
+def bit_width(values: np.ndarray) -> int:
+    if len(values) == 0:
+        return 0
+    return int(values.max()).bit_length()
+
+
+def pack_bits(values: np.ndarray, width: int) -> bytes:
+    if width == 0:
+        return b""
+    shifts = np.arange(width - 1, -1, -1, dtype=np.uint64)
+    bits = (values.astype(np.uint64)[:, np.newaxis] >> shifts) & 1
+    return np.packbits(bits.astype(np.uint8).ravel()).tobytes()
+
+
+def unpack_bits(bits: np.ndarray, count: int, width: int) -> np.ndarray:
+    # bits is the np.unpackbits view of the packed values, most significant bit first
+    if width == 0:
+        return np.zeros(count, dtype=np.int64)
+    weights = 1 << np.arange(width - 1, -1, -1, dtype=np.int64)
+    return bits[: count * width].reshape(count, width) @ weights
+
+
+def packed_size(count: int, width: int) -> int:
+    return (count * width + 7) // 8
+
+
+def encode_postings(ordinals: np.ndarray, tfs: np.ndarray) -> bytes:
+    out = bytearray()
+    for start in range(0, len(ordinals), POSTINGS_BLOCK_SIZE):
+        block_ordinals = ordinals[start : start + POSTINGS_BLOCK_SIZE]
+        gaps = np.diff(block_ordinals, prepend=block_ordinals[0])
+        block_tfs = tfs[start : start + POSTINGS_BLOCK_SIZE] - 1
+        gap_width = bit_width(gaps)
+        tf_width = bit_width(block_tfs)
+        out += int(block_ordinals[0]).to_bytes(4, "little")
+        out += bytes((gap_width, tf_width))
+        out += pack_bits(gaps, gap_width)
+        out += pack_bits(block_tfs, tf_width)
+    return bytes(out)
+
+
+def decode_postings(data: np.ndarray, count: int) -> tuple[np.ndarray, np.ndarray]:
+    ordinals = np.empty(count, dtype=np.int64)
+    tfs = np.empty(count, dtype=np.int64)
+    bits = np.unpackbits(data)  # unpack the whole term once, blocks are byte aligned
+    data = data.tobytes()
+    position = 0
+    for start in range(0, count, POSTINGS_BLOCK_SIZE):
+        n = min(POSTINGS_BLOCK_SIZE, count - start)
+        base = int.from_bytes(data[position : position + 4], "little")
+        gap_width, tf_width = data[position + 4], data[position + 5]
+        position += BLOCK_HEADER_BYTES
+        gaps = unpack_bits(bits[position * 8 :], n, gap_width)
+        position += packed_size(n, gap_width)
+        block_tfs = unpack_bits(bits[position * 8 :], n, tf_width)
+        position += packed_size(n, tf_width)
+        ordinals[start : start + n] = base + np.cumsum(gaps)
+        tfs[start : start + n] = block_tfs + 1
+    return ordinals, tfs
+
+
+class CompressedPostings:
+    def __init__(self):
+        self.offsets = np.zeros(1, dtype=np.int64)  # term id -> start of its blocks in data
+        self.dfs = np.zeros(0, dtype=np.int64)  # term id -> number of postings
+        self.data = np.zeros(0, dtype=np.uint8)
+
+    @classmethod
+    def from_lists(
+        cls, postings: list[tuple[np.ndarray, np.ndarray]]
+    ) -> "CompressedPostings":
+        compressed = cls()
+        encoded = [encode_postings(ordinals, tfs) for ordinals, tfs in postings]
+        compressed.offsets = np.zeros(len(encoded) + 1, dtype=np.int64)
+        compressed.offsets[1:] = np.cumsum([len(data) for data in encoded])
+        compressed.dfs = np.array(
+            [len(ordinals) for ordinals, _ in postings], dtype=np.int64
+        )
+        compressed.data = np.frombuffer(b"".join(encoded), dtype=np.uint8)
+        return compressed
+
+    def save(self, prefix: str) -> None:
+        np.save(f"{prefix}_offsets.npy", self.offsets)
+        np.save(f"{prefix}_dfs.npy", self.dfs)
+        np.save(f"{prefix}_data.npy", self.data)
+
+    def load(self, prefix: str) -> None:
+        self.offsets = np.load(f"{prefix}_offsets.npy")
+        self.dfs = np.load(f"{prefix}_dfs.npy")
+        self.data = np.load(f"{prefix}_data.npy", mmap_mode="r")
+
+    def get(self, term_id: int) -> tuple[np.ndarray, np.ndarray]:
+        data = self.data[self.offsets[term_id] : self.offsets[term_id + 1]]
+        return decode_postings(data, int(self.dfs[term_id]))
+
+    def lookup(self, term_id: int, ordinal: int) -> int:
+        """Term frequency in one doc ordinal, 0 if absent
+
+        Block headers are walked to the last block starting at or before the ordinal, and
+        only that block is decoded.
+        """
+        data = self.data[self.offsets[term_id] : self.offsets[term_id + 1]]
+        count = int(self.dfs[term_id])
+        block = None
+        position = 0
+        for start in range(0, count, POSTINGS_BLOCK_SIZE):
+            n = min(POSTINGS_BLOCK_SIZE, count - start)
+            header = data[position : position + BLOCK_HEADER_BYTES].tobytes()
+            base = int.from_bytes(header[:4], "little")
+            if base > ordinal:
+                break
+            block = (position + BLOCK_HEADER_BYTES, n, base, header[4], header[5])
+            position = block[0] + packed_size(n, header[4]) + packed_size(n, header[5])
+        if block is None:
+            return 0
+        position, n, base, gap_width, tf_width = block
+        gap_bytes = packed_size(n, gap_width)
+        bits = np.unpackbits(data[position : position + gap_bytes + packed_size(n, tf_width)])
+        ordinals = base + np.cumsum(unpack_bits(bits, n, gap_width))
+        i = np.searchsorted(ordinals, ordinal)
+        if i == n or ordinals[i] != ordinal:
+            return 0
+        return int(unpack_bits(bits[gap_bytes * 8 :], n, tf_width)[i]) + 1
+
+    @property
+    def nbytes(self) -> int:
+        return self.offsets.nbytes + self.dfs.nbytes + self.data.nbytes
+
+
+class ArrayPostings:
+    """Uncompressed int32 ordinal / tf arrays, kept as the baseline for size and latency reports."""
+
+    def __init__(self, postings: CompressedPostings):
+        self.offsets = np.zeros(len(postings.dfs) + 1, dtype=np.int64)
+        self.offsets[1:] = np.cumsum(postings.dfs)
+        self.ordinals = np.empty(self.offsets[-1], dtype=np.int32)
+        self.tfs = np.empty(self.offsets[-1], dtype=np.int32)
+        for term_id in range(len(postings.dfs)):
+            ordinals, tfs = postings.get(term_id)
+            start, end = self.offsets[term_id], self.offsets[term_id + 1]
+            self.ordinals[start:end] = ordinals
+            self.tfs[start:end] = tfs
+
+    def get(self, term_id: int) -> tuple[np.ndarray, np.ndarray]:
+        start, end = self.offsets[term_id], self.offsets[term_id + 1]
+        return self.ordinals[start:end], self.tfs[start:end]
+
+    @property
+    def nbytes(self) -> int:
+        return self.offsets.nbytes + self.ordinals.nbytes + self.tfs.nbytes
@@ -1,16 +1,26 @@
 from typing import Optional
-from .search_utils import load_llm_client, GEMINI_FLASH_MODEL
-from dotenv import load_dotenv
-from sentence_transformers import CrossEncoder
-import time
+from .inference_backend import load_cross_encoder
+from .llm_gateway import generate_text, get_llm_gateway
+from .spell import SPELL_CONFIDENCE_THRESHOLD, get_spell_corrector
+from .term_neighbors import get_term_neighbors
 import json
 import re
 
 
-def spell_correct(query):
-    load_dotenv()
-    client = load_llm_client()
+def spell_correct(query, llm_fallback: bool = True):
+    # the local corrector answers in microseconds; the LLM is only asked when it has no
+    # confident candidate for some word, or when the spell index has not been built
+    spell_corrector = get_spell_corrector()
+    if spell_corrector is not None:
+        corrected_query, confidence = spell_corrector.correct(query)
+        if confidence >= SPELL_CONFIDENCE_THRESHOLD or not llm_fallback:
+            return corrected_query
+    elif not llm_fallback:
+        return query
+    return llm_spell_correct(query)
 
+
+def llm_spell_correct(query):
     content = f"""Fix any spelling errors in this movie search query.
 
 Only correct obvious typos. Don't change correctly spelled words.
@@ -20,12 +30,8 @@ Query: "{query}"
 If no errors, return the original query.
 Corrected:"""
 
-    generated_content = client.models.generate_content(
-        model=GEMINI_FLASH_MODEL, contents=content
-    )
-
     corrected_query = (
-        (generated_content.text or "")
+        generate_text(content)
         .strip()
         .strip('"')
         .replace("Corrected: ", "")
@@ -35,9 +41,6 @@ Corrected:"""
 
 
 def rewrite_query(query):
-    load_dotenv()
-    client = load_llm_client()
-
     prompt = f"""Rewrite this movie search query to be more specific and searchable.
 
 Original: "{query}"
@@ -56,11 +59,8 @@ Examples:
 - "scary movie with bear from few years ago" -> "bear horror movie 2015-2020"
 
 Rewritten query:"""
-    generated_content = client.models.generate_content(
-        model=GEMINI_FLASH_MODEL, contents=prompt
-    )
     rewritten_query = (
-        (generated_content.text or "")
+        generate_text(prompt)
         .strip()
         .strip('"')
         .replace("Rewritten query: ", "")
@@ -70,9 +70,6 @@ Rewritten query:"""
 
 
 def expand_query(query):
-    load_dotenv()
-    client = load_llm_client()
-
     prompt = f"""Expand this movie search query with related terms.
 
 Add synonyms and related concepts that might appear in movie descriptions.
@@ -87,13 +84,22 @@ Examples:
 
 Query: "{query}"
 """
-    generated_content = client.models.generate_content(
-        model=GEMINI_FLASH_MODEL, contents=prompt
-    )
-    expanded_query = (generated_content.text or "").strip().strip('"')
+    expanded_query = generate_text(prompt).strip().strip('"')
     return expanded_query if expanded_query else query
 
 
+def local_expand_query(query):
+    # precomputed embedding neighbors of the query terms, no model or network needed
+    from .keyword_search import tokenize_text
+
+    term_neighbors = get_term_neighbors()
+    if term_neighbors is None:
+        print("Term neighbors not built, run `build_term_neighbors`; query left unexpanded")
+        return query
+    expansions = term_neighbors.expand(tokenize_text(query))
+    return " ".join([query, *expansions])
+
+
 def enhance_query(query, method: Optional[str] = None):
     match method:
         case "spell":
@@ -102,23 +108,19 @@ def enhance_query(query, method: Optional[str] = None):
             return rewrite_query(query)
         case "expand":
             return expand_query(query)
+        case "local-expand":
+            return local_expand_query(query)
         case _:
             return query
 
 
 def individual_rerank(query, results):
-    load_dotenv()
-    client = load_llm_client()
-
+    prompts = []
     for result in results:
-        doc = result[1]["doc"]
-        title = doc.get("title", "")
-        bm25_rank = result[1]["bm25_rank"]
-        semantic_rank = result[1]["semantic_rank"]
-        prompt = f"""Rate how well this movie matches the search query.
+        prompts.append(f"""Rate how well this movie matches the search query.
 
 Query: "{query}"
-Movie: {doc.get("title", "")} - {doc.get("document", "")}
+Movie: {result.get("title", "")} - {result.get("document", "")}
 
 Consider:
 - Direct relevance to query
@@ -128,30 +130,28 @@ Consider:
 Rate 0-10 (10 = perfect match).
 Give me ONLY the number in your response, no other text or explanation.
 
-Score:"""
-        generated_content = client.models.generate_content(
-            model=GEMINI_FLASH_MODEL, contents=prompt
-        )
+Score:""")
+    # sent together, the gateway's rate and concurrency limits pace them
+    responses = get_llm_gateway().generate_many(prompts)
+    for result, response in zip(results, responses):
         score = (
-            (generated_content.text or "")
-            .strip()
+            response.text.strip()
             .strip('"')
             .replace("Score: ", "")
             .replace('"', "")
         )
-        result[1]["rerank_score"] = float(score)
-        time.sleep(2)
-    sorted_results = sorted(results, key=lambda x: x[1]["rerank_score"], reverse=True)
+        result["metadata"]["rerank_score"] = float(score)
+    sorted_results = sorted(
+        results, key=lambda x: x["metadata"]["rerank_score"], reverse=True
+    )
     return sorted_results
 
 
 def batch_rerank(query, results):
-    load_dotenv()
-    client = load_llm_client()
     doc_list_str = "\n".join(
         [
-            f"id: {result[0]}, title: {result[1]['doc']['title']}, description: {result[1]['doc']['description']}"
-            for i, result in enumerate(results)
+            f"id: {result['doc_id']}, title: {result['title']}, description: {result['document']}"
+            for result in results
         ]
     )
     prompt = f"""Rank these movies by relevance to the search query.
@@ -166,10 +166,7 @@ Return ONLY the IDs in order of relevance (best match first). Return a valid JSO
 [75, 12, 34, 2, 1]
 """
 
-    generated_content = client.models.generate_content(
-        model=GEMINI_FLASH_MODEL, contents=prompt
-    )
-    raw = (generated_content.text or "").strip()
+    raw = generate_text(prompt).strip()
 
     if not raw:
         raise ValueError("LLM returned empty response for reranking")
@@ -184,9 +181,8 @@ Return ONLY the IDs in order of relevance (best match first). Return a valid JSO
     except json.JSONDecodeError as e:
         raise ValueError(f"Expected JSON list of IDs from LLM, got: {raw[:200]}") from e
 
-    reranked_results = {}
-    # Map doc_id -> (doc_id, data)
-    id_to_result = {doc_id: (doc_id, data) for doc_id, data in results}
+    # Map doc_id -> result
+    id_to_result = {result["doc_id"]: result for result in results}
 
     # Build ordered list, keeping only those present
     ordered_results = [
@@ -197,16 +193,17 @@ Return ONLY the IDs in order of relevance (best match first). Return a valid JSO
 
 
 def cross_encoder_rerank(query, results):
-    docs = [result[1]["doc"] for result in results]
     pairs: list[list[str]] = []
-    for doc in docs:
-        pairs.append([query, f"{doc['title']} - {doc['description']}"])
-    cross_encoder = CrossEncoder("cross-encoder/ms-marco-TinyBERT-L2-v2")
+    for result in results:
+        pairs.append([query, f"{result['title']} - {result['document']}"])
+    cross_encoder = load_cross_encoder()
     scores = cross_encoder.predict(pairs)
     print(scores)
     for i, score in enumerate(scores):
-        results[i][1]["rerank_score"] = score
-    sorted_results = sorted(results, key=lambda x: x[1]["rerank_score"], reverse=True)
+        results[i]["metadata"]["rerank_score"] = float(score)
+    sorted_results = sorted(
+        results, key=lambda x: x["metadata"]["rerank_score"], reverse=True
+    )
     return sorted_results
 
 
@@ -223,8 +220,6 @@ def llm_rerank(query, results, rerank_method):
 
 
 def evaluate(query, results):
-    load_dotenv()
-    client = load_llm_client()
     results_text = []
     for i, res in enumerate(results, 1):
         results_text.append(f"{i}. {res['title']}")
@@ -248,10 +243,7 @@ Return ONLY the scores in the same order you were given the documents. Return a
 
 [2, 0, 3, 2, 0, 1]"""
 
-    generated_content = client.models.generate_content(
-        model=GEMINI_FLASH_MODEL, contents=prompt
-    )
-    raw = (generated_content.text or "").strip()
+    raw = generate_text(prompt).strip()
     print(raw)
     if not raw:
         raise ValueError("LLM returned empty response for evaluation")
@@ -0,0 +1,219 @@
+import json
+import os
+import time
+
+import numpy as np
+
+from .doc_filter import DocFilter
+from .keyword_search import tokenize_text
+from .query_enhancment import llm_rerank
+from .search_utils import CACHE_PATH, SCORE_PRECISION, format_search_result
+
+# Routing thresholds, measured against the fixed pipeline with `evaluation_cli.py --routing`
+BM25_DECISIVE_MARGIN = 0.35  # (top1 - top2) / top1 of the BM25 scores
+SHORT_QUERY_TOKENS = 3  # longer queries are descriptive and keep the semantic leg
+RERANK_SKIP_AGREEMENT = 0.6  # share of the top `limit` both legs agree on
+# candidates per requested result: the fixed pipeline always fuses FULL_DEPTH_FACTOR, the
+# router starts at SHALLOW_DEPTH_FACTOR and widens only when the cut could change the top
+SHALLOW_DEPTH_FACTOR = 20
+FULL_DEPTH_FACTOR = 500
+RERANK_DEPTH_FACTOR = 5
+ROUTING_LOG_PATH = os.path.join(CACHE_PATH, "routing_log.jsonl")
+
+
+def ranks_of(order: np.ndarray, size: int) -> np.ndarray:
+    # position (1-based) of every ordinal in order, 0 for ordinals not in it
+    ranks = np.zeros(size, dtype=np.int64)
+    ranks[order] = np.arange(1, len(order) + 1)
+    return ranks
+
+
+class QueryRouter:
+    """Adaptive cascade over the RRF pipeline of a HybridSearch
+
+    BM25 always runs first. Its top-1/top-2 margin, an exact title match and the query
+    length decide whether the semantic leg runs; the fused candidate depth starts shallow
+    and widens to the fixed depth only when documents beyond the cut could still reach the
+    top results; reranking is skipped when the legs already agree on the top results.
+    """
+
+    def __init__(self, hybrid_search, log_path: str | None = ROUTING_LOG_PATH):
+        self.hybrid_search = hybrid_search
+        self.idx = hybrid_search.idx
+        if not self.idx.vocabulary:
+            self.idx.load()
+        self.log_path = log_path
+
+    def signals(self, query_tokens: list[str], bm25_scores, bm25_order) -> dict:
+        top1 = float(bm25_scores[bm25_order[0]]) if len(bm25_order) else 0.0
+        top2 = float(bm25_scores[bm25_order[1]]) if len(bm25_order) > 1 else 0.0
+        title_match = False
+        if top1 > 0:
+            doc_id = int(self.idx.doc_ids[bm25_order[0]])
+            title = self.idx.docmap.title(self.idx.docmap.get_row(doc_id))
+            title_match = tokenize_text(title) == query_tokens
+        return {
+            "query_tokens": len(query_tokens),
+            "bm25_top1": top1,
+            "bm25_margin": (top1 - top2) / top1 if top1 > 0 else 0.0,
+            "title_match": title_match,
+        }
+
+    def search(
+        self,
+        query: str,
+        k: int = 60,
+        limit: int = 5,
+        rerank_method: str | None = None,
+        doc_filter: DocFilter | None = None,
+    ) -> tuple[list[dict], dict]:
+        timings = {}
+        start = time.perf_counter()
+        query_tokens = tokenize_text(query)
+        num_docs = len(self.idx.doc_ids)
+        allowed = self.idx.allowed_ordinals(doc_filter)
+        # filtered out documents are never ranked by either leg, so they are not candidates
+        num_candidates = num_docs if allowed is None else int(allowed.sum())
+        bm25_scores = self.idx.bm25_scores(query_tokens, allowed=allowed)
+        bm25_order = self.idx.ranked_ordinals(bm25_scores, allowed)
+        timings["bm25"] = time.perf_counter() - start
+
+        signals = self.signals(query_tokens, bm25_scores, bm25_order)
+        decisive = signals["title_match"] or (
+            signals["bm25_margin"] >= BM25_DECISIVE_MARGIN
+            and signals["query_tokens"] <= SHORT_QUERY_TOKENS
+        )
+        decisions = {"semantic": not decisive}
+
+        full_depth = limit * FULL_DEPTH_FACTOR
+        bm25_ranks = ranks_of(bm25_order[:full_depth], num_docs)
+        semantic_ranks = np.zeros(num_docs, dtype=np.int64)
+        if decisions["semantic"]:
+            start = time.perf_counter()
+            semantic_search = self.hybrid_search.semantic_search
+            query_embedding = semantic_search.generate_embedding(query)
+            movie_ids, movie_scores = semantic_search.movie_scores(
+                query_embedding, doc_filter
+            )
+            semantic_order = np.argsort(-movie_scores, kind="stable")[:full_depth]
+            semantic_ordinals = self.idx.ordinal_of_id[movie_ids[semantic_order]]
+            semantic_ranks = ranks_of(semantic_ordinals, num_docs)
+            timings["semantic"] = time.perf_counter() - start
+            top_bm25 = set(bm25_order[:limit].tolist())
+            signals["leg_agreement"] = len(
+                top_bm25 & set(semantic_ordinals[:limit].tolist())
+            ) / max(limit, 1)
+
+        start = time.perf_counter()
+        candidates = limit * RERANK_DEPTH_FACTOR if rerank_method else limit
+        depth = min(limit * SHALLOW_DEPTH_FACTOR, full_depth)
+        top = self.fuse(bm25_ranks, semantic_ranks, k, depth, candidates, num_candidates)
+        if top is None:
+            depth = full_depth
+            top = self.fuse(
+                bm25_ranks, semantic_ranks, k, depth, candidates, num_candidates
+            )
+        decisions["depth"] = depth
+        results = self.format_results(top, bm25_ranks, semantic_ranks, k)
+        timings["fuse"] = time.perf_counter() - start
+
+        skip_rerank = decisive or (
+            signals.get("leg_agreement", 0.0) >= RERANK_SKIP_AGREEMENT
+        )
+        decisions["rerank"] = bool(rerank_method) and not skip_rerank
+        if decisions["rerank"]:
+            start = time.perf_counter()
+            results = llm_rerank(query, results, rerank_method)
+            timings["rerank"] = time.perf_counter() - start
+        results = results[:limit]
+
+        routing = {
+            "signals": signals,
+            "decisions": decisions,
+            "timings_ms": {
+                stage: round(seconds * 1000, 3) for stage, seconds in timings.items()
+            },
+        }
+        self.log(query, routing)
+        return results, routing
+
+    def fuse(
+        self,
+        bm25_ranks: np.ndarray,
+        semantic_ranks: np.ndarray,
+        k: int,
+        depth: int,
+        limit: int,
+        num_candidates: int | None = None,
+    ) -> np.ndarray | None:
+        """Top `limit` ordinals by RRF over the documents ranked within depth by either leg
+
+        Scores are exact, since every candidate's rank in both legs is known. Returns None when
+        a document outside the candidates could still score above the limit-th candidate,
+        which is at most one 1 / (k + depth + 1) term per leg. num_candidates is the number of
+        documents either leg could rank, all of them unless a filter is applied.
+        """
+        in_bm25 = (bm25_ranks > 0) & (bm25_ranks <= depth)
+        in_semantic = (semantic_ranks > 0) & (semantic_ranks <= depth)
+        candidates = np.flatnonzero(in_bm25 | in_semantic)
+        scores = self.rrf_scores(candidates, bm25_ranks, semantic_ranks, k)
+        legs = 1 + int(semantic_ranks.any())
+        bound = legs / (k + depth + 1)
+        if num_candidates is None:
+            num_candidates = len(bm25_ranks)
+        outside = num_candidates - len(candidates)
+        if outside and len(candidates) < limit:
+            return None
+        # the fixed pipeline sorts rounded scores, ties kept in BM25-list-then-semantic order
+        rounded = np.array([round(float(score), SCORE_PRECISION) for score in scores])
+        position = np.where(
+            bm25_ranks[candidates] > 0,
+            bm25_ranks[candidates],
+            len(bm25_ranks) + semantic_ranks[candidates],
+        )
+        top = candidates[np.lexsort((position, -rounded))][:limit]
+        if len(top) == 0:
+            return top
+        last = rounded[np.searchsorted(candidates, top[-1])]
+        if outside and last <= round(bound, SCORE_PRECISION):
+            return None
+        return top
+
+    def rrf_scores(
+        self, ordinals: np.ndarray, bm25_ranks: np.ndarray, semantic_ranks: np.ndarray, k: int
+    ) -> np.ndarray:
+        scores = np.zeros(len(ordinals), dtype=np.float64)
+        bm25 = bm25_ranks[ordinals]
+        semantic = semantic_ranks[ordinals]
+        scores[bm25 > 0] += 1 / (k + bm25[bm25 > 0])
+        scores[semantic > 0] += 1 / (k + semantic[semantic > 0])
+        return scores
+
+    def format_results(
+        self, top: np.ndarray, bm25_ranks: np.ndarray, semantic_ranks: np.ndarray, k: int
+    ) -> list[dict]:
+        scores = self.rrf_scores(top, bm25_ranks, semantic_ranks, k)
+        results = []
+        for ordinal, score in zip(top, scores):
+            doc = self.idx.docmap[int(self.idx.doc_ids[ordinal])]
+            bm25_rank = int(bm25_ranks[ordinal]) or None
+            semantic_rank = int(semantic_ranks[ordinal]) or None
+            results.append(
+                format_search_result(
+                    doc_id=doc["id"],
+                    title=doc["title"],
+                    document=doc["description"],
+                    score=float(score),
+                    rrf_score=float(score),
+                    bm25_rank=bm25_rank,
+                    semantic_rank=semantic_rank,
+                )
+            )
+        return results
+
+    def log(self, query: str, routing: dict) -> None:
+        if self.log_path is None:
+            return
+        os.makedirs(os.path.dirname(self.log_path), exist_ok=True)
+        with open(self.log_path, "a") as f:
+            f.write(json.dumps({"query": query, "time": time.time(), **routing}) + "\n")
@@ -0,0 +1,127 @@
+import os
+
+import numpy as np
+
+REDUCTION_METHODS = ("pca", "truncate")
+REDUCED_DIMENSIONS = 64
+# first-pass candidates per requested result that are rescored at full dimension
+RESCORE_FACTOR = 10
+# rows the PCA is fitted on; a sample is enough to find the main directions
+PCA_SAMPLE_ROWS = 20000
+REDUCTION_BLOCK_SIZE = 4096
+
+
+def unit_rows(matrix: np.ndarray) -> np.ndarray:
+    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+    return matrix / np.maximum(norms, 1e-12)
+
+
+class ReducedVectors:
+    """Low-dimensional copy of an embedding matrix for a cheap first scoring pass
+
+    pca projects the unit-normalized embeddings on their top principal components, fitted on
+    the corpus; truncate keeps the leading dimensions, which only works for Matryoshka-trained
+    models that pack the most information there. Rows are stored unit-normalized, so a dot
+    product with a projected query approximates the full-dimension cosine.
+    """
+
+    def __init__(
+        self,
+        method: str,
+        dimensions: int,
+        mean: np.ndarray,
+        components: np.ndarray | None,
+        vectors: np.ndarray,
+    ):
+        self.method = method
+        self.dimensions = dimensions
+        self.mean = mean  # subtracted before projecting, zeros for truncate
+        self.components = components  # (dimensions, full dimensions), None for truncate
+        self.vectors = vectors  # (rows, dimensions) float32, unit rows
+
+    @classmethod
+    def fit(
+        cls, embeddings: np.ndarray, method: str = "pca", dimensions: int = REDUCED_DIMENSIONS
+    ) -> "ReducedVectors":
+        if method not in REDUCTION_METHODS:
+            raise ValueError(
+                f"Unknown reduction method '{method}', expected one of {REDUCTION_METHODS}"
+            )
+        full_dimensions = embeddings.shape[1]
+        dimensions = min(dimensions, full_dimensions)
+        mean = np.zeros(full_dimensions, dtype=np.float32)
+        components = None
+        if method == "pca":
+            rng = np.random.default_rng(0)
+            sample_rows = np.sort(
+                rng.choice(
+                    len(embeddings),
+                    min(len(embeddings), PCA_SAMPLE_ROWS),
+                    replace=False,
+                )
+            )
+            sample = unit_rows(np.asarray(embeddings[sample_rows], dtype=np.float32))
+            mean = sample.mean(axis=0)
+            _, _, vt = np.linalg.svd(sample - mean, full_matrices=False)
+            components = vt[:dimensions].astype(np.float32)
+        reduced = cls(method, dimensions, mean, components, np.zeros((0, dimensions)))
+        # projected in blocks so a memory-mapped matrix is never loaded whole
+        reduced.vectors = np.concatenate(
+            [
+                reduced.project(embeddings[start : start + REDUCTION_BLOCK_SIZE])
+                for start in range(0, len(embeddings), REDUCTION_BLOCK_SIZE)
+            ]
+            or [np.zeros((0, dimensions), dtype=np.float32)]
+        )
+        return reduced
+
+    def project(self, embeddings: np.ndarray) -> np.ndarray:
+        """Unit-normalized reduced rows of full-dimension embeddings (one or many)"""
+        single = embeddings.ndim == 1
+        rows = unit_rows(np.atleast_2d(np.asarray(embeddings, dtype=np.float32)))
+        if self.components is None:
+            reduced = rows[:, : self.dimensions]
+        else:
+            reduced = (rows - self.mean) @ self.components.T
+        reduced = unit_rows(reduced).astype(np.float32)
+        return reduced[0] if single else reduced
+
+    def scores(self, query_embedding: np.ndarray, rows=None) -> np.ndarray:
+        vectors = self.vectors if rows is None else self.vectors[rows]
+        return vectors @ self.project(query_embedding)
+
+    def save(self, path: str) -> None:
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        np.savez(
+            path,
+            method=np.array(self.method),
+            mean=self.mean,
+            components=(
+                self.components
+                if self.components is not None
+                else np.zeros((0, 0), dtype=np.float32)
+            ),
+            vectors=self.vectors,
+        )
+
+    @classmethod
+    def load(cls, path: str) -> "ReducedVectors":
+        with np.load(path) as arrays:
+            components = arrays["components"]
+            vectors = arrays["vectors"]
+            return cls(
+                str(arrays["method"]),
+                vectors.shape[1],
+                arrays["mean"],
+                components if components.size else None,
+                vectors,
+            )
+
+
+def reduced_path(embeddings_path: str) -> str:
+    """chunk_embeddings.npy -> chunk_embeddings_reduced.npz, next to the full matrix"""
+    return f"{os.path.splitext(embeddings_path)[0]}_reduced.npz"
+
+
+def rescore_depth(limit: int, factor: int = RESCORE_FACTOR) -> int:
+    return max(limit * factor, limit)
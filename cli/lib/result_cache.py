@@ -0,0 +1,224 @@
+import hashlib
+import json
+import os
+import pickle
+import tempfile
+from collections import OrderedDict
+from functools import lru_cache
+from typing import Any
+
+from .generations import current_generation
+from .search_utils import CACHE_PATH
+
+RESULT_CACHE_PATH = os.path.join(CACHE_PATH, "result_cache.pkl")
+DEFAULT_RESULT_CACHE_BYTES = 8 * 1024 * 1024
+# hits only change the LRU order and counters, so they are persisted every this many lookups
+# instead of rewriting the whole cache file on each one
+RESULT_CACHE_SAVE_EVERY = 16
+
+# files whose contents decide what a query returns in a cache directory without index
+# generations; rebuilding any of them starts a new generation, which invalidates every
+# cached result
+GENERATION_FILES = [
+    "docstore_meta.json",
+    "vocabulary.pkl",
+    "postings_data.npy",
+    "doc_lengths.npy",
+    "chunk_embeddings.npy",
+    "chunk_metadata.json",
+]
+
+
+def index_generation(cache_dir: str = CACHE_PATH) -> str:
+    generation = current_generation()
+    if generation is not None:
+        return generation
+    signature = []
+    for name in GENERATION_FILES:
+        path = os.path.join(cache_dir, name)
+        if os.path.exists(path):
+            stat = os.stat(path)
+            signature.append([name, stat.st_size, stat.st_mtime_ns])
+    return hashlib.sha256(json.dumps(signature).encode()).hexdigest()[:16]
+
+
+def read_pickle(path: str) -> Any | None:
+    """The pickled contents of path, None when it is missing or unreadable (a torn write)"""
+    try:
+        with open(path, "rb") as f:
+            return pickle.load(f)
+    except (OSError, EOFError, pickle.UnpicklingError, AttributeError, ValueError):
+        return None
+
+
+def write_pickle_atomic(path: str, data: Any) -> None:
+    # a temp file unique to this writer, so concurrent processes never interleave their
+    # bytes in one file and the rename always installs a complete pickle
+    directory = os.path.dirname(path)
+    os.makedirs(directory, exist_ok=True)
+    fd, temp_path = tempfile.mkstemp(
+        dir=directory, prefix=f".{os.path.basename(path)}-", suffix=".tmp"
+    )
+    try:
+        with os.fdopen(fd, "wb") as f:
+            pickle.dump(data, f)
+        os.replace(temp_path, path)
+    except BaseException:
+        os.remove(temp_path)
+        raise
+
+
+def normalize_query(query: str) -> str:
+    return " ".join(query.lower().split())
+
+
+class ResultCache:
+    def __init__(
+        self, max_bytes: int = DEFAULT_RESULT_CACHE_BYTES, path: str = RESULT_CACHE_PATH
+    ):
+        self.max_bytes = max_bytes
+        self.path = path
+        self.generation = index_generation()
+        self.entries: OrderedDict[str, bytes] = OrderedDict()  # key -> pickled result
+        self.total_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.unsaved_lookups = 0
+
+    def make_key(self, namespace: str, query: str, **params: Any) -> str:
+        key = json.dumps(
+            {
+                "namespace": namespace,
+                "query": normalize_query(query),
+                "params": params,
+                "generation": self.generation,
+            },
+            sort_keys=True,
+            default=str,
+        )
+        return hashlib.sha256(key.encode()).hexdigest()
+
+    def get(self, key: str) -> Any | None:
+        data = self.entries.get(key)
+        if data is None:
+            self.misses += 1
+            return None
+        self.entries.move_to_end(key)
+        self.hits += 1
+        return pickle.loads(data)
+
+    def put(self, key: str, value: Any) -> None:
+        data = pickle.dumps(value)
+        if len(data) > self.max_bytes:
+            return
+        if key in self.entries:
+            self.total_bytes -= len(self.entries.pop(key))
+        self.entries[key] = data
+        self.total_bytes += len(data)
+        self.evict()
+
+    def evict(self) -> None:
+        # least recently used entries go first until the byte budget holds again
+        while self.total_bytes > self.max_bytes:
+            _, evicted = self.entries.popitem(last=False)
+            self.total_bytes -= len(evicted)
+            self.evictions += 1
+
+    def stats(self, hit: bool | None = None) -> dict:
+        lookups = self.hits + self.misses
+        stats = {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / lookups, 3) if lookups else 0.0,
+            "evictions": self.evictions,
+            "entries": len(self.entries),
+            "bytes": self.total_bytes,
+            "generation": self.generation,
+        }
+        if hit is not None:
+            stats["hit"] = hit
+        return stats
+
+    def load(self) -> None:
+        saved = read_pickle(self.path)
+        if saved is None:
+            return
+        self.hits = saved["hits"]
+        self.misses = saved["misses"]
+        self.evictions = saved["evictions"]
+        if saved["generation"] != self.generation:
+            # the index was rebuilt since these results were cached
+            return
+        self.entries = saved["entries"]
+        self.total_bytes = sum(len(data) for data in self.entries.values())
+        self.evict()
+
+    def save(self) -> None:
+        write_pickle_atomic(
+            self.path,
+            {
+                "generation": self.generation,
+                "entries": self.entries,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+            },
+        )
+        self.unsaved_lookups = 0
+
+    def save_lookup(self, stored: bool) -> None:
+        # a new entry is written at once, hits and uncached misses in batches
+        self.unsaved_lookups += 1
+        if stored or self.unsaved_lookups >= RESULT_CACHE_SAVE_EVERY:
+            self.save()
+
+
+@lru_cache(maxsize=1)
+def get_result_cache() -> ResultCache:
+    result_cache = ResultCache()
+    result_cache.load()
+    return result_cache
+
+
+def invalidate_result_cache() -> None:
+    get_result_cache.cache_clear()
+    if os.path.exists(RESULT_CACHE_PATH):
+        os.remove(RESULT_CACHE_PATH)
+
+
+def format_cache_stats(stats: dict) -> str:
+    return (
+        f"Result cache: {'hit' if stats.get('hit') else 'miss'} "
+        f"(hit rate {stats['hit_rate']:.1%}, {stats['entries']} entries, "
+        f"{stats['bytes'] / 1024:.1f} KiB, generation {stats['generation']})"
+    )
+
+
+def cached_result(
+    namespace: str, query: str, compute, store=None, **params: Any
+) -> tuple[Any, dict]:
+    """Return a cached result for the query and parameters, computing and storing it on a miss
+
+    Args:
+        namespace: Which command the result belongs to
+        query: Query text, normalized before it becomes part of the key
+        compute: Zero argument callable producing the result on a miss
+        store: Optional predicate on a computed result, false keeps it out of the cache
+        **params: Every parameter that changes the result
+
+    Returns:
+        The result and the cache statistics for this lookup
+    """
+    result_cache = get_result_cache()
+    key = result_cache.make_key(namespace, query, **params)
+    result = result_cache.get(key)
+    if result is not None:
+        result_cache.save_lookup(stored=False)
+        return result, result_cache.stats(hit=True)
+    result = compute()
+    stored = store is None or store(result)
+    if stored:
+        result_cache.put(key, result)
+    result_cache.save_lookup(stored)
+    return result, result_cache.stats(hit=False)
@@ -1,7 +1,9 @@
 import json
 import os
-from typing import Any
-from google import genai
+from typing import Any, TYPE_CHECKING
+
+if TYPE_CHECKING:
+    from google import genai
 
 
 GEMINI_API_KEY = os.environ.get("GEMINI_API_KEY")
@@ -16,6 +18,21 @@ DATA_PATH_STOPWORDS = os.path.join(PROJECT_ROOT, "data", "stopwords.txt")
 CACHE_PATH = os.path.join(PROJECT_ROOT, "cache")
 BM25_K1 = 1.5
 BM25_B = 0.75
+# torch, onnx or onnx-int8, see lib/inference_backend.py
+INFERENCE_BACKEND = os.environ.get("HOOPLA_INFERENCE_BACKEND", "torch")
+# memory-map the chunk embeddings and score them in blocks of rows instead of loading them
+VECTOR_MMAP = os.environ.get("HOOPLA_VECTOR_MMAP", "0") == "1"
+VECTOR_BLOCK_SIZE = int(os.environ.get("HOOPLA_VECTOR_BLOCK_SIZE", "4096"))
+# score a reduced-dimension copy of the embeddings first when one has been built, and only
+# rescore the best candidates at full dimension, see lib/reduced_vectors.py
+VECTOR_REDUCED = os.environ.get("HOOPLA_VECTOR_REDUCED", "0") == "1"
+# gemini or fake, see lib/llm_gateway.py
+LLM_BACKEND = os.environ.get("HOOPLA_LLM_BACKEND", "gemini")
+# module:function answering the fake backend's prompts, its built-in responder when unset
+FAKE_LLM_RESPONDER = os.environ.get("HOOPLA_FAKE_LLM_RESPONDER", "")
+# process-wide limits on LLM requests started per minute and in flight at once
+LLM_RPM = int(os.environ.get("HOOPLA_LLM_RPM", "30"))
+LLM_CONCURRENCY = int(os.environ.get("HOOPLA_LLM_CONCURRENCY", "4"))
 
 
 def load_movies() -> list[dict]:
@@ -59,13 +76,9 @@ def format_search_result(
     }
 
 
-def load_llm_client() -> genai.Client:
-    return genai.Client(api_key=GEMINI_API_KEY)
-
+def load_llm_client() -> "genai.Client":
+    # google.genai takes ~1s to import, so only pay for it when an LLM call is made. Call
+    # sites go through lib/llm_gateway.py, which creates the one client of the process.
+    from google import genai
 
-def generate_content(prompt):
-    client = load_llm_client()
-    generated_content = client.models.generate_content(
-        model=GEMINI_FLASH_MODEL, contents=prompt
-    )
-    return generated_content.text
+    return genai.Client(api_key=GEMINI_API_KEY)
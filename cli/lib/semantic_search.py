@@ -1,18 +1,89 @@
+import itertools
 import json
-from sentence_transformers import SentenceTransformer
-from lib.search_utils import format_search_result, load_movies, CACHE_PATH
+from lib.doc_filter import DocFilter, resolve_filters
+from lib.document_store import DocumentStore, get_document_store, source_signature
+from lib.generations import index_dir, is_published, publish_generation, start_generation
+from lib.inference_backend import backend_report_command, load_bi_encoder
+from lib.parallel_encode import ParallelEncoder
+from lib.reduced_vectors import (
+    REDUCED_DIMENSIONS,
+    RESCORE_FACTOR,
+    ReducedVectors,
+    reduced_path,
+    rescore_depth,
+)
+from lib.result_cache import invalidate_result_cache
+from lib.search_utils import (
+    CACHE_PATH,
+    format_search_result,
+    INFERENCE_BACKEND,
+    VECTOR_BLOCK_SIZE,
+    VECTOR_MMAP,
+    VECTOR_REDUCED,
+)
+from lib.term_neighbors import TERM_NEIGHBORS, TermNeighbors, get_term_neighbors
 import numpy as np
 import os
 import re
+import threading
+import time
+
+# sentences per chunk and sentences shared with the previous chunk for the chunk embeddings
+CHUNK_SENTENCES = 4
+CHUNK_OVERLAP = 1
+# chunks encoded and checkpointed together while building chunk embeddings
+CHUNK_BATCH_SIZE = 256
+SENTENCE_BOUNDARY = re.compile(r"(?<=[.!?])\s+")
+# index files written by the embedding builds, see lib/generations.py; rebuilding the full
+# embeddings drops their reduced copy rather than carrying a stale one over
+MOVIE_EMBEDDING_FILES = ("movie_embeddings.npy", "movie_embeddings_reduced.npz")
+CHUNK_EMBEDDING_FILES = (
+    "chunk_embeddings.npy",
+    "chunk_metadata.json",
+    "chunk_embeddings_reduced.npz",
+)
+REDUCED_EMBEDDING_FILES = ("movie_embeddings_reduced.npz", "chunk_embeddings_reduced.npz")
+TERM_NEIGHBOR_FILES = ("term_neighbors.npz",)
 
 
 class SemanticSearch:
-    def __init__(self, model_name="all-MiniLM-L6-v2"):
-        self.model = SentenceTransformer(model_name)
+    def __init__(
+        self,
+        model_name="all-MiniLM-L6-v2",
+        cache_dir: str | None = None,
+        backend: str = INFERENCE_BACKEND,
+        reduced: bool = VECTOR_REDUCED,
+        rescore_factor: int = RESCORE_FACTOR,
+    ):
+        self.model_name = model_name
+        self.backend = backend
+        self._model = None
+        # speculative search encodes from two threads, the first loads the model and the
+        # other waits for it instead of loading a second copy
+        self._model_lock = threading.Lock()
         self.embeddings = None
-        self.documents = None
-        self.documents_map = {}
-        self.embeddings_path = os.path.join(CACHE_PATH, "movie_embeddings.npy")
+        # with reduced, a first pass over the reduced copy picks limit * rescore_factor
+        # candidates and only those are scored at full dimension
+        self.reduced = reduced
+        self.rescore_factor = rescore_factor
+        self.reduced_embeddings: ReducedVectors | None = None
+        self.documents: DocumentStore | None = None
+        # doc_id (int) -> document, the shared document store once documents are loaded
+        self.documents_map: DocumentStore | None = None
+        self.use_cache_dir(cache_dir or index_dir())
+
+    def use_cache_dir(self, cache_dir: str) -> None:
+        self.cache_dir = cache_dir
+        self.embeddings_path = os.path.join(cache_dir, "movie_embeddings.npy")
+
+    @property
+    def model(self):
+        # sentence_transformers pulls in torch, so defer it until a model is needed
+        if self._model is None:
+            with self._model_lock:
+                if self._model is None:
+                    self._model = load_bi_encoder(self.model_name, self.backend)
+        return self._model
 
     def generate_embedding(self, text):
         if not text or not text.strip():
@@ -20,43 +91,84 @@ class SemanticSearch:
         embedding = self.model.encode([text])
         return embedding[0]
 
-    def build_embeddings(self, documents: list[dict]):
+    def build_embeddings(self, documents: DocumentStore, workers: int = 1):
         self.documents = documents
-        m_descriptions = []
-        for doc in documents:
-            self.documents_map[doc["id"]] = doc
-            m_descriptions.append(f"{doc['title']} {doc['description']}")
-        self.embeddings = self.model.encode(m_descriptions, show_progress_bar=True)
+        self.documents_map = documents
+        m_descriptions = (
+            (f"{doc['title']} {doc['description']}", None)
+            for doc in documents.documents()
+        )
+        with ParallelEncoder(self.model_name, workers, self.encode, backend=self.backend) as encoder:
+            self.embeddings = np.concatenate(
+                [
+                    batch_embeddings
+                    for batch_embeddings, _ in encoder.encode_batches(
+                        batched_chunks(m_descriptions, CHUNK_BATCH_SIZE)
+                    )
+                ]
+            )
+        print(encoder.report())
         np.save(self.embeddings_path, self.embeddings)
         print(f"Embeddings saved to {self.embeddings_path}")
         return self.embeddings
 
-    def load_or_create_embeddings(self, documents: list[dict]):
+    def encode(self, texts: list[str]) -> np.ndarray:
+        return self.model.encode(texts)
+
+    def load_reduced(self, embeddings_path: str, rows: int) -> ReducedVectors | None:
+        path = reduced_path(embeddings_path)
+        if not self.reduced or not os.path.exists(path):
+            return None
+        reduced = ReducedVectors.load(path)
+        return reduced if len(reduced.vectors) == rows else None
+
+    def load_or_create_embeddings(
+        self, documents: DocumentStore, workers: int = 1, rebuild: bool = False
+    ):
         self.documents = documents
-        for doc in documents:
-            self.documents_map[doc["id"]] = doc
-        if os.path.exists(self.embeddings_path):
+        self.documents_map = documents
+        if not rebuild and os.path.exists(self.embeddings_path):
             self.embeddings = np.load(self.embeddings_path)
             if len(self.embeddings) == len(self.documents):
+                self.reduced_embeddings = self.load_reduced(
+                    self.embeddings_path, len(self.embeddings)
+                )
                 return self.embeddings
-        else:
-            return self.build_embeddings(documents)
+        if self.cache_dir != CACHE_PATH and not is_published(self.cache_dir):
+            # an explicit directory (a shard, a staging generation) is built in place
+            return self.build_embeddings(documents, workers)
+        staging = start_generation("movie-embeddings")
+        SemanticSearch(self.model_name, staging, self.backend).build_embeddings(
+            documents, workers
+        )
+        publish_generation(staging, MOVIE_EMBEDDING_FILES)
+        invalidate_result_cache()
+        self.use_cache_dir(index_dir())
+        self.embeddings = np.load(self.embeddings_path)
+        return self.embeddings
 
-    def search(self, query: str, limit: int = 5):
+    def search(self, query: str, limit: int = 5, doc_filter: DocFilter | None = None):
         if self.embeddings is None:
             raise ValueError(
                 "No embeddings loaded. Call `load_or_create_embeddings` first."
             )
         query_embedding = self.generate_embedding(query)
-        similarities = []
-        for i, embedding in enumerate(self.embeddings):
-            similarity = cosine_similarity(query_embedding, embedding)
-            doc_id = list(self.documents_map.keys())[i]
-            similarities.append([similarity, self.documents_map[doc_id]])
-        similarities.sort(key=lambda x: x[0], reverse=True)
+        rows = range(len(self.embeddings))
+        if doc_filter is not None:
+            rows = np.flatnonzero(doc_filter.contains(self.documents.ids))
+        if self.reduced_embeddings is not None:
+            similarities = self.rescored_top_k(query_embedding, np.asarray(rows), limit)
+        else:
+            similarities = []
+            for i in rows:
+                embedding = self.embeddings[i]
+                similarity = cosine_similarity(query_embedding, embedding)
+                similarities.append([similarity, i])
+            similarities.sort(key=lambda x: x[0], reverse=True)
         similarities = similarities[:limit]
         results = []
-        for similarity, doc in similarities:
+        for similarity, row in similarities:
+            doc = self.documents.document_at(row)
             m = {
                 "score": similarity,
                 "title": doc["title"],
@@ -65,88 +177,363 @@ class SemanticSearch:
             results.append(m)
         return results
 
+    def rescored_top_k(
+        self, query_embedding, rows: np.ndarray, limit: int
+    ) -> list[list]:
+        """[similarity, row] of the best rows: reduced scores pick the candidates, full
+        dimension cosine ranks them, ties by row as in the exhaustive scan"""
+        first_pass = self.reduced_embeddings.scores(query_embedding, rows)
+        depth = rescore_depth(limit, self.rescore_factor)
+        if len(rows) > depth:
+            rows = rows[np.argpartition(-first_pass, depth - 1)[:depth]]
+        scores = cosine_similarities(query_embedding, self.embeddings[rows])
+        order = np.lexsort((rows, -scores))[:limit]
+        return [[scores[i], int(rows[i])] for i in order]
+
 
 class ChunkedSemanticSearch(SemanticSearch):
-    def __init__(self, model_name="all-MiniLM-L6-v2") -> None:
-        super().__init__(model_name)
+    def __init__(
+        self,
+        model_name="all-MiniLM-L6-v2",
+        cache_dir: str | None = None,
+        backend: str = INFERENCE_BACKEND,
+        mmap: bool = VECTOR_MMAP,
+        block_size: int = VECTOR_BLOCK_SIZE,
+        reduced: bool = VECTOR_REDUCED,
+        rescore_factor: int = RESCORE_FACTOR,
+    ) -> None:
         self.chunk_embeddings = None
         self.chunk_metadata = None
+        self.chunk_reduced: ReducedVectors | None = None
+        # with mmap the embeddings stay on disk and are scored block_size rows at a time, so
+        # resident memory is bounded by a block rather than by the corpus
+        self.mmap = mmap
+        self.block_size = max(1, block_size)
+        self.chunk_movie_ids = None  # chunk row -> movie id
+        # movie ids sorted, row of each movie's first chunk, chunk row -> index into movie ids
+        self.chunk_movies = None
+        super().__init__(model_name, cache_dir, backend, reduced, rescore_factor)
+
+    def use_cache_dir(self, cache_dir: str) -> None:
+        super().use_cache_dir(cache_dir)
+        self.chunk_embeddings_path = os.path.join(cache_dir, "chunk_embeddings.npy")
+        self.chunk_metadata_path = os.path.join(cache_dir, "chunk_metadata.json")
+        self.partial_embeddings_path = os.path.join(
+            cache_dir, "chunk_embeddings.partial.npy"
+        )
+        self.partial_metadata_path = os.path.join(cache_dir, "chunk_metadata.partial.jsonl")
+        self.chunk_checkpoint_path = os.path.join(cache_dir, "chunk_checkpoint.json")
 
-        self.chunk_embeddings_path = os.path.join(CACHE_PATH, "chunk_embeddings.npy")
-        self.chunk_metadata_path = os.path.join(CACHE_PATH, "chunk_metadata.json")
+    def build_chunk_embeddings(self, documents: DocumentStore, workers: int = 1):
+        """Chunk and encode the catalog in fixed-size batches, resuming an interrupted build
 
-    def build_chunk_embeddings(self, documents: list[dict]):
+        Embeddings are written into a preallocated memmap and metadata is appended as JSON
+        lines after every batch; the checkpoint is only advanced once both are flushed.
+        """
         self.documents = documents
-        chunks: list[str] = []
-        chunk_metadata: list[dict] = []
-        for doc in documents:
-            self.documents_map[doc["id"]] = doc
-            description = doc["description"]
-            if description is None:
-                continue
-            semantic_chunks = semantic_chunk(description, chunk_size=4, overlap=1)
-            chunks.extend(semantic_chunks)
-            for idx in range(len(semantic_chunks)):
-                chunk_metadata.append(
-                    {
-                        "movie_idx": doc["id"],
-                        "chunk_idx": idx,
-                        "total_chunks": len(semantic_chunks),
-                    }
+        self.documents_map = documents
+        total_chunks = sum(1 for _ in iter_chunks(documents))
+        fingerprint = self.chunk_build_fingerprint(total_chunks)
+
+        os.makedirs(self.cache_dir, exist_ok=True)
+        done = 0
+        if os.path.exists(self.chunk_checkpoint_path) and os.path.exists(
+            self.partial_embeddings_path
+        ):
+            with open(self.chunk_checkpoint_path, "r") as f:
+                checkpoint = json.load(f)
+            if checkpoint["fingerprint"] == fingerprint:
+                done = checkpoint["done"]
+        kept = []
+        if done and os.path.exists(self.partial_metadata_path):
+            # metadata lines written after the last checkpoint are dropped
+            with open(self.partial_metadata_path, "r") as f:
+                kept = list(itertools.islice(f, done))
+        if done and len(kept) < done:
+            # metadata lost or cut short, the checkpoint cannot be trusted
+            print("Discarding chunk embedding checkpoint, its metadata is incomplete")
+            done = 0
+        if done:
+            print(f"Resuming chunk embedding build at {done}/{total_chunks} chunks")
+            embeddings = np.lib.format.open_memmap(
+                self.partial_embeddings_path, mode="r+"
+            )
+            with open(self.partial_metadata_path, "w") as f:
+                f.writelines(kept)
+        else:
+            embeddings = np.lib.format.open_memmap(
+                self.partial_embeddings_path,
+                mode="w+",
+                dtype=np.float32,
+                shape=(total_chunks, self.model.get_sentence_embedding_dimension()),
+            )
+            open(self.partial_metadata_path, "w").close()
+
+        chunks = itertools.islice(iter_chunks(documents), done, None)
+        encoder = ParallelEncoder(self.model_name, workers, self.encode, backend=self.backend)
+        with encoder, open(self.partial_metadata_path, "a") as metadata_file:
+            batches = encoder.encode_batches(batched_chunks(chunks, CHUNK_BATCH_SIZE))
+            for batch_embeddings, metadata in batches:
+                embeddings[done : done + len(metadata)] = batch_embeddings
+                embeddings.flush()
+                for chunk in metadata:
+                    metadata_file.write(json.dumps(chunk) + "\n")
+                metadata_file.flush()
+                done += len(metadata)
+                write_json_atomic(
+                    self.chunk_checkpoint_path,
+                    {"fingerprint": fingerprint, "done": done},
                 )
-        self.chunk_embeddings = self.model.encode(chunks, show_progress_bar=True)
-        self.chunk_metadata = chunk_metadata
-        np.save(self.chunk_embeddings_path, self.chunk_embeddings)
+                print(f"\rEncoded {done}/{total_chunks} chunks", end="", flush=True)
+        print()
+        print(encoder.report())
+        del embeddings
+
+        with open(self.partial_metadata_path, "r") as f:
+            chunk_metadata = [json.loads(line) for line in f]
         with open(self.chunk_metadata_path, "w") as f:
             json.dump(
-                {"chunks": chunk_metadata, "total_chunks": len(chunks)}, f, indent=2
+                {"chunks": chunk_metadata, "total_chunks": total_chunks}, f, indent=2
             )
+        os.replace(self.partial_embeddings_path, self.chunk_embeddings_path)
+        os.remove(self.partial_metadata_path)
+        os.remove(self.chunk_checkpoint_path)
         print(f"Chunk embeddings saved to {self.chunk_embeddings_path}")
         print(f"Chunk metadata saved to {self.chunk_metadata_path}")
-        return self.chunk_embeddings
+        invalidate_result_cache()
+        # the same path as a cached build, so the chunk -> movie arrays are always derived
+        return self.load_chunk_embeddings()
+
+    def chunk_build_fingerprint(self, total_chunks: int) -> str:
+        # a checkpoint only resumes the same catalog, model and chunking
+        return json.dumps(
+            [
+                source_signature(),
+                self.model_name,
+                self.backend,
+                CHUNK_SENTENCES,
+                CHUNK_OVERLAP,
+                total_chunks,
+            ]
+        )
 
-    def load_or_create_chunk_embeddings(self, documents: list[dict]) -> np.ndarray:
-        self.documents_map = {}
-        for doc in documents:
-            self.documents_map[doc["id"]] = doc
+    def load_or_create_chunk_embeddings(
+        self, documents: DocumentStore, workers: int = 1, rebuild: bool = False
+    ) -> np.ndarray:
+        self.documents_map = documents
         self.documents = documents
 
-        if os.path.exists(self.chunk_embeddings_path) and os.path.exists(
-            self.chunk_metadata_path
+        if (
+            not rebuild
+            and os.path.exists(self.chunk_embeddings_path)
+            and os.path.exists(self.chunk_metadata_path)
         ):
-            self.chunk_embeddings = np.load(self.chunk_embeddings_path)
-            with open(self.chunk_metadata_path, "r") as f:
-                self.chunk_metadata = json.load(f)["chunks"]
-            return self.chunk_embeddings
+            return self.load_chunk_embeddings()
+        if self.cache_dir != CACHE_PATH and not is_published(self.cache_dir):
+            # an explicit directory (a shard, a staging generation) is built in place
+            return self.build_chunk_embeddings(documents, workers)
+
+        # the staging directory survives an interrupted build, so its checkpoint resumes
+        staging = start_generation("chunks", resume=True)
+        ChunkedSemanticSearch(self.model_name, staging, self.backend).build_chunk_embeddings(
+            documents, workers
+        )
+        publish_generation(staging, CHUNK_EMBEDDING_FILES)
+        invalidate_result_cache()
+        self.use_cache_dir(index_dir())
+        return self.load_chunk_embeddings()
+
+    def load_chunk_embeddings(self) -> np.ndarray:
+        self.chunk_embeddings = np.load(
+            self.chunk_embeddings_path, mmap_mode="r" if self.mmap else None
+        )
+        with open(self.chunk_metadata_path, "r") as f:
+            self.chunk_metadata = json.load(f)["chunks"]
+        self.chunk_movie_ids = np.fromiter(
+            (chunk["movie_idx"] for chunk in self.chunk_metadata),
+            dtype=np.int64,
+            count=len(self.chunk_metadata),
+        )
+        self.chunk_movies = np.unique(
+            self.chunk_movie_ids, return_index=True, return_inverse=True
+        )
+        self.chunk_reduced = self.load_reduced(
+            self.chunk_embeddings_path, len(self.chunk_embeddings)
+        )
+        return self.chunk_embeddings
 
-        return self.build_chunk_embeddings(documents)
+    def movie_scores(
+        self, query_embedding, doc_filter: DocFilter | None = None
+    ) -> tuple[np.ndarray, np.ndarray]:
+        """Score every movie by its best matching chunk
 
-    def search_chunks(self, query: str, limit: int = 10) -> list[dict]:
+        Args:
+            query_embedding: Embedding of the query text
+            doc_filter: When given, only the chunks of movies it allows are scored
+
+        Returns:
+            Movie ids in the order their first chunk appears, and each movie's best cosine score
+        """
         if self.chunk_embeddings is None or self.chunk_metadata is None:
             raise ValueError(
                 "No chunk embeddings loaded. Call load_or_create_chunk_embeddings first."
             )
-
-        query_embedding = self.generate_embedding(query)
-
-        chunk_scores = []
-        for i, chunk_embedding in enumerate(self.chunk_embeddings):
-            score = cosine_similarity(query_embedding, chunk_embedding)
-            chunk_scores.append(
-                {
-                    "chunk_idx": i,
-                    "movie_idx": self.chunk_metadata[i]["movie_idx"],
-                    "score": score,
-                }
+        if self.mmap:
+            return self.blocked_movie_scores(query_embedding, doc_filter)
+        chunk_movie_ids = self.chunk_movie_ids
+        chunk_embeddings = self.chunk_embeddings
+        if doc_filter is not None:
+            allowed = doc_filter.contains(chunk_movie_ids)
+            chunk_movie_ids = chunk_movie_ids[allowed]
+            chunk_embeddings = chunk_embeddings[allowed]
+        chunk_scores = cosine_similarities(query_embedding, chunk_embeddings)
+        movie_ids, first_chunk, inverse = np.unique(
+            chunk_movie_ids, return_index=True, return_inverse=True
+        )
+        scores = np.full(len(movie_ids), -np.inf)
+        np.maximum.at(scores, inverse, chunk_scores)
+        order = np.argsort(first_chunk)
+        return movie_ids[order], scores[order]
+
+    def chunk_blocks(self, query_embedding, doc_filter: DocFilter | None = None):
+        """Yield (chunk rows, cosine scores) one block of rows at a time
+
+        Only the block being scored is paged in from the memory-mapped embeddings; chunks of
+        movies outside doc_filter are dropped before their rows are read.
+        """
+        allowed = None
+        if doc_filter is not None:
+            allowed = doc_filter.contains(self.chunk_movie_ids)
+        for start in range(0, len(self.chunk_embeddings), self.block_size):
+            rows = np.arange(start, min(start + self.block_size, len(self.chunk_embeddings)))
+            if allowed is not None:
+                rows = rows[allowed[rows]]
+                if len(rows) == 0:
+                    continue
+                block = np.asarray(self.chunk_embeddings[rows], dtype=np.float32)
+            else:
+                block = np.asarray(
+                    self.chunk_embeddings[rows[0] : rows[-1] + 1], dtype=np.float32
+                )
+            yield rows, cosine_similarities(query_embedding, block)
+
+    def blocked_movie_scores(
+        self, query_embedding, doc_filter: DocFilter | None = None
+    ) -> tuple[np.ndarray, np.ndarray]:
+        # movie_scores without ever holding more than one block of embeddings
+        movie_ids, first_chunk, inverse = self.chunk_movies
+        scores = np.full(len(movie_ids), -np.inf)
+        for rows, block_scores in self.chunk_blocks(query_embedding, doc_filter):
+            np.maximum.at(scores, inverse[rows], block_scores)
+        order = np.argsort(first_chunk)
+        # movies whose chunks were all filtered out keep -inf and are not candidates
+        order = order[np.isfinite(scores[order])]
+        return movie_ids[order], scores[order]
+
+    def blocked_top_k(
+        self, query_embedding, limit: int, doc_filter: DocFilter | None = None
+    ) -> tuple[np.ndarray, np.ndarray]:
+        """Best `limit` movies by their best chunk, keeping only a running top-k between blocks
+
+        A movie dropped from the running top-k can only come back through a later chunk that
+        beats the current k-th score, and then that chunk is its best one, so the result is
+        exact. Ties are broken by first appearance, as in movie_scores.
+
+        Returns:
+            Movie ids and scores, best first
+        """
+        movie_ids, first_chunk, inverse = self.chunk_movies
+        top = np.zeros(0, dtype=np.int64)  # indexes into movie_ids
+        top_scores = np.zeros(0, dtype=np.float64)
+        for rows, block_scores in self.chunk_blocks(query_embedding, doc_filter):
+            candidates = np.concatenate([top, inverse[rows]])
+            candidate_scores = np.concatenate([top_scores, block_scores])
+            # best score of every movie among the candidates
+            order = np.lexsort((-candidate_scores, candidates))
+            candidates, candidate_scores = candidates[order], candidate_scores[order]
+            first = np.ones(len(candidates), dtype=bool)
+            first[1:] = candidates[1:] != candidates[:-1]
+            candidates, candidate_scores = candidates[first], candidate_scores[first]
+            keep = np.lexsort((first_chunk[candidates], -candidate_scores))[:limit]
+            top, top_scores = candidates[keep], candidate_scores[keep]
+        return movie_ids[top], top_scores
+
+    def reduced_top_k(
+        self, query_embedding, limit: int, doc_filter: DocFilter | None = None
+    ) -> tuple[np.ndarray, np.ndarray]:
+        """Best `limit` movies by their best chunk, scoring full vectors for candidates only
+
+        Every allowed chunk is scored on the reduced copy; the limit * rescore_factor movies
+        with the best reduced chunk have all their chunks rescored at full dimension, which
+        decides the final order (ties by first appearance, as in movie_scores). Movies the
+        first pass ranks too low are missed, which the reduction report measures.
+
+        Returns:
+            Movie ids and scores, best first
+        """
+        movie_ids, first_chunk, inverse = self.chunk_movies
+        rows = None  # every chunk, scored without indexing the reduced matrix
+        if doc_filter is not None:
+            rows = np.flatnonzero(doc_filter.contains(self.chunk_movie_ids))
+        first_pass = self.chunk_maxima(rows, self.chunk_reduced.scores(query_embedding, rows))
+        candidates = np.flatnonzero(np.isfinite(first_pass))
+        depth = rescore_depth(limit, self.rescore_factor)
+        if len(candidates) > depth:
+            candidates = candidates[np.argpartition(-first_pass[candidates], depth - 1)[:depth]]
+        is_candidate = np.zeros(len(movie_ids), dtype=bool)
+        is_candidate[candidates] = True
+        if rows is None:
+            rows = np.flatnonzero(is_candidate[inverse])
+        else:
+            rows = rows[is_candidate[inverse[rows]]]
+        scores = self.chunk_maxima(
+            rows,
+            cosine_similarities(
+                query_embedding, np.asarray(self.chunk_embeddings[rows], dtype=np.float32)
+            ),
+        )
+        top = candidates[np.lexsort((first_chunk[candidates], -scores[candidates]))][:limit]
+        return movie_ids[top], scores[top]
+
+    def chunk_maxima(self, rows: np.ndarray | None, row_scores: np.ndarray) -> np.ndarray:
+        """Best score of every movie over the given chunk rows (all rows for None), -inf for
+        movies with none; a movie's chunks are contiguous, so each run reduces in one step"""
+        movie_ids, _, inverse = self.chunk_movies
+        row_movies = inverse if rows is None else inverse[rows]
+        scores = np.full(len(movie_ids), -np.inf)
+        if len(row_movies):
+            starts = np.flatnonzero(np.r_[True, row_movies[1:] != row_movies[:-1]])
+            np.maximum.at(scores, row_movies[starts], np.maximum.reduceat(row_scores, starts))
+        return scores
+
+    def search_chunks(
+        self,
+        query: str,
+        limit: int = 10,
+        doc_filter: DocFilter | None = None,
+        query_embedding: np.ndarray | None = None,
+    ) -> list[dict]:
+        if self.chunk_embeddings is None or self.chunk_metadata is None:
+            raise ValueError(
+                "No chunk embeddings loaded. Call load_or_create_chunk_embeddings first."
             )
 
-        m_scores = {}
-        for chunk_score in chunk_scores:
-            movie_idx = chunk_score["movie_idx"]
-            if movie_idx not in m_scores or chunk_score["score"] > m_scores[movie_idx]:
-                m_scores[movie_idx] = chunk_score["score"]
-
-        sorted_movies = sorted(m_scores.items(), key=lambda x: x[1], reverse=True)
+        # batch callers encode all their queries in one model call and pass the row in
+        if query_embedding is None:
+            query_embedding = self.generate_embedding(query)
+        if self.chunk_reduced is not None or self.mmap:
+            if self.chunk_reduced is not None:
+                movie_ids, scores = self.reduced_top_k(query_embedding, limit, doc_filter)
+            else:
+                movie_ids, scores = self.blocked_top_k(query_embedding, limit, doc_filter)
+            sorted_movies = [
+                (int(movie_id), float(score)) for movie_id, score in zip(movie_ids, scores)
+            ]
+        else:
+            movie_ids, scores = self.movie_scores(query_embedding, doc_filter)
+            # stable sort keeps ties in the order movies first appear, like the dict it replaces
+            order = np.argsort(-scores, kind="stable")
+            sorted_movies = [(int(movie_ids[i]), float(scores[i])) for i in order]
         results = []
         print(
             f"limit: {limit}, sorted_movies: {len(sorted_movies)}, sorted_movies_with_limit: {len(sorted_movies[:limit])}"
@@ -172,10 +559,19 @@ def verify_model():
     print(f"Max sequence length: {semantic_search.model.max_seq_length}")
 
 
-def verify_embeddings():
-    semantic_search = SemanticSearch()
-    documents = load_movies()
-    embeddings = semantic_search.load_or_create_embeddings(documents)
+def warn_unused_workers(workers: int, rebuild: bool, built: bool) -> None:
+    if workers > 1 and not rebuild and built:
+        print(
+            f"Embeddings already built, --workers {workers} unused; "
+            "pass --rebuild to encode them again"
+        )
+
+
+def verify_embeddings(workers: int = 1, rebuild: bool = False):
+    documents = get_document_store()
+    semantic_search = SemanticSearch(cache_dir=documents.store_dir)
+    warn_unused_workers(workers, rebuild, os.path.exists(semantic_search.embeddings_path))
+    embeddings = semantic_search.load_or_create_embeddings(documents, workers, rebuild)
     print(f"Number of docs:   {len(documents)}")
     print(
         f"Embeddings shape: {embeddings.shape[0]} vectors in {embeddings.shape[1]} dimensions"
@@ -199,11 +595,19 @@ def embed_query_text(query: str):
     return embedding
 
 
-def search(query: str, limit: int = 5):
-    semantic_search = SemanticSearch()
-    movies = load_movies()
+def search(
+    query: str,
+    limit: int = 5,
+    filters: list[str] | None = None,
+    reduced: bool = VECTOR_REDUCED,
+    rescore_factor: int = RESCORE_FACTOR,
+):
+    movies = get_document_store()
+    semantic_search = SemanticSearch(
+        cache_dir=movies.store_dir, reduced=reduced, rescore_factor=rescore_factor
+    )
     semantic_search.load_or_create_embeddings(movies)
-    results = semantic_search.search(query, limit)
+    results = semantic_search.search(query, limit, resolve_filters(filters))
     for index, result in enumerate(results, 0):
         print(f"{index + 1}. {result['title']} ({result['score']})")
         print(f"    {result['description']}")
@@ -231,28 +635,18 @@ def semantic_chunk(text: str, chunk_size: int = 4, overlap: int = 0):
     text = text.strip()
     if not text:
         return []
-    sentences = re.split(r"(?<=[.!?])\s+", text)
-    if len(sentences) == 1 and (
-        sentences[0].endswith(".")
-        or sentences[0].endswith("!")
-        or sentences[0].endswith("?")
-    ):
-        sentences = [text]
-    else:
-        for sentence in sentences:
-            sentence = sentence.strip()
-            if sentence == "":
-                sentences.remove(sentence)
+    # the text is stripped and boundaries consume the whitespace, so no sentence is empty
+    sentences = SENTENCE_BOUNDARY.split(text)
     chunks = []
+    window = []
     for i in range(0, len(sentences) - overlap, chunk_size - overlap):
+        previous_window = window
+        window = sentences[i : i + chunk_size]
         if overlap > 0 and len(chunks) > 0:
-            prev_chunk = chunks[-1]
-            overlap_sentences = re.split(r"(?<=[.!?])\s+", prev_chunk)[-overlap:]
-            current_chunk = " ".join(overlap_sentences + sentences[i : i + chunk_size])
-            chunks.append(current_chunk)
+            current_chunk = " ".join(previous_window[-overlap:] + window)
         else:
-            current_chunk = " ".join(sentences[i : i + chunk_size])
-            chunks.append(current_chunk)
+            current_chunk = " ".join(window)
+        chunks.append(current_chunk)
     return chunks
 
 
@@ -264,17 +658,64 @@ def semantic_chunk_text(text: str, chunk_size: int = 4, overlap: int = 0):
     return chunks
 
 
-def search_chunks(query: str, limit: int = 5):
-    chunked_semantic_search = ChunkedSemanticSearch()
-    movies = load_movies()
+def search_chunks(
+    query: str,
+    limit: int = 5,
+    filters: list[str] | None = None,
+    mmap: bool = VECTOR_MMAP,
+    block_size: int = VECTOR_BLOCK_SIZE,
+    reduced: bool = VECTOR_REDUCED,
+    rescore_factor: int = RESCORE_FACTOR,
+):
+    movies = get_document_store()
+    chunked_semantic_search = ChunkedSemanticSearch(
+        cache_dir=movies.store_dir,
+        mmap=mmap,
+        block_size=block_size,
+        reduced=reduced,
+        rescore_factor=rescore_factor,
+    )
     chunked_semantic_search.load_or_create_chunk_embeddings(movies)
-    results = chunked_semantic_search.search_chunks(query, limit)
+    results = chunked_semantic_search.search_chunks(query, limit, resolve_filters(filters))
     for index, result in enumerate(results, 0):
         print(f"{index + 1}. {result['title']} ({result['score']:0.4f})")
         description = result["document"][:100]
         print(f"    {description}...")
 
 
+def iter_chunks(documents: DocumentStore):
+    """Lazily yield (chunk text, chunk metadata) for every described document"""
+    for doc in documents.documents():
+        description = doc["description"]
+        if not description:
+            continue
+        semantic_chunks = semantic_chunk(
+            description, chunk_size=CHUNK_SENTENCES, overlap=CHUNK_OVERLAP
+        )
+        for idx, chunk_text in enumerate(semantic_chunks):
+            yield chunk_text, {
+                "movie_idx": doc["id"],
+                "chunk_idx": idx,
+                "total_chunks": len(semantic_chunks),
+            }
+
+
+def batched_chunks(chunks, batch_size: int):
+    while True:
+        batch = list(itertools.islice(chunks, batch_size))
+        if not batch:
+            return
+        texts, metadata = zip(*batch)
+        yield list(texts), list(metadata)
+
+
+def write_json_atomic(path: str, data) -> None:
+    temp_path = f"{path}.tmp"
+    with open(temp_path, "w") as f:
+        json.dump(data, f)
+    os.replace(temp_path, path)
+
+
 def cosine_similarity(vec1, vec2):
     dot_product = np.dot(vec1, vec2)
     norm1 = np.linalg.norm(vec1)
@@ -286,10 +727,295 @@ def cosine_similarity(vec1, vec2):
     return dot_product / (norm1 * norm2)
 
 
-def embed_chunks():
-    chunked_semantic_search = ChunkedSemanticSearch()
-    documents = load_movies()
-    chunked_semantic_search.load_or_create_chunk_embeddings(documents)
+def cosine_similarities(query_embedding, embeddings) -> np.ndarray:
+    norms = np.linalg.norm(embeddings, axis=1) * np.linalg.norm(query_embedding)
+    dot_products = embeddings @ query_embedding
+    return np.divide(
+        dot_products, norms, out=np.zeros(len(embeddings)), where=norms != 0
+    )
+
+
+def embed_chunks(workers: int = 1, rebuild: bool = False):
+    documents = get_document_store()
+    chunked_semantic_search = ChunkedSemanticSearch(cache_dir=documents.store_dir)
+    warn_unused_workers(
+        workers, rebuild, os.path.exists(chunked_semantic_search.chunk_embeddings_path)
+    )
+    chunked_semantic_search.load_or_create_chunk_embeddings(documents, workers, rebuild)
     print(
         f"Generated {len(chunked_semantic_search.chunk_embeddings)} chunked embeddings"
     )
+
+
+def build_term_neighbors(neighbors: int = TERM_NEIGHBORS):
+    from lib.keyword_search import InvertedIndex, surface_forms
+
+    inverted_index = InvertedIndex()
+    inverted_index.load()
+    forms = surface_forms(inverted_index)
+    # numbers and codes make poor expansions
+    terms = sorted(term for term, word in forms.items() if word.isalpha())
+    term_ids = np.array([inverted_index.vocabulary[term] for term in terms], dtype=np.int64)
+    dfs = np.asarray(inverted_index.postings.dfs)[term_ids]
+    doc_count = len(inverted_index.doc_ids)
+    idfs = np.log((doc_count - dfs + 0.5) / (dfs + 0.5) + 1)
+    surface = [forms[term] for term in terms]
+
+    semantic_search = SemanticSearch()
+    embeddings = semantic_search.encode(surface)
+    staging = start_generation("term-neighbors")
+    term_neighbors = TermNeighbors(staging)
+    term_neighbors.build(terms, surface, idfs, embeddings, neighbors)
+    term_neighbors.save()
+    print(f"Built {neighbors} neighbors for {len(terms)} terms")
+    publish_generation(staging, TERM_NEIGHBOR_FILES)
+    get_term_neighbors.cache_clear()
+    invalidate_result_cache()
+
+
+def vector_report_command(
+    queries: list[str],
+    block_size: int = VECTOR_BLOCK_SIZE,
+    limit: int = 10,
+    repeats: int = 5,
+) -> dict:
+    """Time chunk top-k over embeddings loaded in RAM against the memory-mapped blocked scan"""
+    documents = get_document_store()
+    engines = {
+        "in-ram": ChunkedSemanticSearch(cache_dir=documents.store_dir, mmap=False),
+        "mmap": ChunkedSemanticSearch(
+            cache_dir=documents.store_dir, mmap=True, block_size=block_size
+        ),
+    }
+    load_ms = {}
+    for name, engine in engines.items():
+        start = time.perf_counter()
+        engine.load_or_create_chunk_embeddings(documents)
+        load_ms[name] = (time.perf_counter() - start) * 1000
+    # scoring is what differs, so every query is encoded once up front
+    query_embeddings = engines["in-ram"].encode(queries)
+
+    def in_ram_top_k(query_embedding):
+        movie_ids, scores = engines["in-ram"].movie_scores(query_embedding)
+        order = np.argsort(-scores, kind="stable")[:limit]
+        return movie_ids[order], scores[order]
+
+    top_k = {
+        "in-ram": in_ram_top_k,
+        "mmap": lambda query_embedding: engines["mmap"].blocked_top_k(query_embedding, limit),
+    }
+    results = {}
+    query_ms = {}
+    for name, search in top_k.items():
+        start = time.perf_counter()
+        for _ in range(repeats):
+            results[name] = [search(query_embedding) for query_embedding in query_embeddings]
+        query_ms[name] = (time.perf_counter() - start) * 1000 / (repeats * len(queries))
+
+    chunks, dimensions = engines["in-ram"].chunk_embeddings.shape
+    agreement = [
+        len(set(ram_ids.tolist()) & set(mmap_ids.tolist())) / max(len(ram_ids), 1)
+        for (ram_ids, _), (mmap_ids, _) in zip(results["in-ram"], results["mmap"])
+    ]
+    max_score_diff = max(
+        (
+            float(np.abs(ram_scores - mmap_scores).max()) if len(ram_scores) else 0.0
+            for (_, ram_scores), (_, mmap_scores) in zip(results["in-ram"], results["mmap"])
+        ),
+        default=0.0,
+    )
+    return {
+        "queries": len(queries),
+        "chunks": chunks,
+        "dimensions": dimensions,
+        "block_size": block_size,
+        "matrix_bytes": engines["in-ram"].chunk_embeddings.nbytes,
+        "block_bytes": min(block_size, chunks) * dimensions * 4,
+        "load_ms": load_ms,
+        "query_ms": query_ms,
+        "chunks_per_second": {
+            name: chunks / (ms / 1000) if ms else 0.0 for name, ms in query_ms.items()
+        },
+        "top_k_agreement": float(np.mean(agreement)) if agreement else 1.0,
+        "max_score_diff": max_score_diff,
+    }
+
+
+def vector_report(
+    queries: list[str],
+    block_size: int = VECTOR_BLOCK_SIZE,
+    limit: int = 10,
+    repeats: int = 5,
+):
+    report = vector_report_command(queries, block_size, limit, repeats)
+    print(
+        f"{report['chunks']} chunks x {report['dimensions']} dims, "
+        f"{report['queries']} queries, top {limit}"
+    )
+    print(
+        f"Embeddings resident: in-ram {report['matrix_bytes'] / 1e6:.1f} MB, "
+        f"mmap one block of {report['block_size']} rows ({report['block_bytes'] / 1e6:.2f} MB)"
+    )
+    for name in ("in-ram", "mmap"):
+        print(
+            f"{name}: load {report['load_ms'][name]:.1f} ms, "
+            f"{report['query_ms'][name]:.2f} ms/query, "
+            f"{report['chunks_per_second'][name] / 1e6:.1f}M chunks/sec"
+        )
+    print(
+        f"Top-{limit} agreement {report['top_k_agreement']:.0%}, "
+        f"max score diff {report['max_score_diff']:.2e}"
+    )
+
+
+def reduce_embeddings(method: str = "pca", dimensions: int = REDUCED_DIMENSIONS):
+    """Fit and publish reduced copies of the chunk (and movie, if built) embeddings"""
+    documents = get_document_store()
+    chunked_semantic_search = ChunkedSemanticSearch(
+        cache_dir=documents.store_dir, mmap=True, reduced=False
+    )
+    chunked_semantic_search.load_or_create_chunk_embeddings(documents)
+    matrices = {"chunk_embeddings.npy": chunked_semantic_search.chunk_embeddings}
+    if os.path.exists(chunked_semantic_search.embeddings_path):
+        matrices["movie_embeddings.npy"] = np.load(
+            chunked_semantic_search.embeddings_path, mmap_mode="r"
+        )
+    staging = start_generation("reduced-embeddings")
+    for name, embeddings in matrices.items():
+        reduced = ReducedVectors.fit(embeddings, method, dimensions)
+        reduced.save(reduced_path(os.path.join(staging, name)))
+        print(
+            f"Reduced {len(embeddings)} {name.split('_')[0]} embeddings from "
+            f"{embeddings.shape[1]} to {reduced.dimensions} dims ({method})"
+        )
+    publish_generation(staging, REDUCED_EMBEDDING_FILES)
+    invalidate_result_cache()
+
+
+def reduction_report_command(
+    queries: list[str],
+    dimensions: list[int],
+    method: str = "pca",
+    limit: int = 10,
+    rescore_factor: int = RESCORE_FACTOR,
+    repeats: int = 5,
+) -> dict:
+    """Recall and latency of reduced first passes against exact chunk top-k, per dimension
+
+    first_pass ranks movies on the reduced vectors alone (a rescore factor of 1 keeps the
+    same movies and only reorders them), two_stage rescores limit * rescore_factor candidates
+    at full dimension. Recall is the fraction of the exact top-k each one finds.
+    """
+    documents = get_document_store()
+    engine = ChunkedSemanticSearch(cache_dir=documents.store_dir, mmap=False, reduced=False)
+    engine.load_or_create_chunk_embeddings(documents)
+    query_embeddings = engine.encode(queries)
+
+    def exact_top_k(query_embedding):
+        movie_ids, scores = engine.movie_scores(query_embedding)
+        return movie_ids[np.argsort(-scores, kind="stable")[:limit]]
+
+    def timed(search) -> tuple[list, float]:
+        start = time.perf_counter()
+        for _ in range(repeats):
+            results = [search(query_embedding) for query_embedding in query_embeddings]
+        return results, (time.perf_counter() - start) * 1000 / (repeats * len(queries))
+
+    exact, exact_ms = timed(exact_top_k)
+
+    def recall(results) -> float:
+        found = [
+            len(set(ids.tolist()) & set(expected.tolist())) / max(len(expected), 1)
+            for ids, expected in zip(results, exact)
+        ]
+        return float(np.mean(found)) if found else 1.0
+
+    rows = []
+    for target in dimensions:
+        start = time.perf_counter()
+        engine.chunk_reduced = ReducedVectors.fit(engine.chunk_embeddings, method, target)
+        fit_ms = (time.perf_counter() - start) * 1000
+        passes = {}
+        for name, factor in (("first_pass", 1), ("two_stage", rescore_factor)):
+            engine.rescore_factor = factor
+            results, ms = timed(
+                lambda query_embedding: engine.reduced_top_k(query_embedding, limit)[0]
+            )
+            passes[name] = {"query_ms": ms, "recall": recall(results)}
+        rows.append(
+            {
+                "dimensions": engine.chunk_reduced.dimensions,
+                "bytes": engine.chunk_reduced.vectors.nbytes,
+                "fit_ms": fit_ms,
+                **passes,
+            }
+        )
+    engine.chunk_reduced = None
+    chunks, full_dimensions = engine.chunk_embeddings.shape
+    return {
+        "queries": len(queries),
+        "chunks": chunks,
+        "method": method,
+        "limit": limit,
+        "rescore_factor": rescore_factor,
+        "exact": {
+            "dimensions": full_dimensions,
+            "bytes": engine.chunk_embeddings.nbytes,
+            "query_ms": exact_ms,
+        },
+        "reduced": rows,
+    }
+
+
+def reduction_report(
+    queries: list[str],
+    dimensions: list[int],
+    method: str = "pca",
+    limit: int = 10,
+    rescore_factor: int = RESCORE_FACTOR,
+    repeats: int = 5,
+):
+    report = reduction_report_command(
+        queries, dimensions, method, limit, rescore_factor, repeats
+    )
+    exact = report["exact"]
+    print(
+        f"{report['chunks']} chunks, {report['queries']} queries, top {limit}, "
+        f"{method}, rescoring {rescore_factor}x candidates"
+    )
+    print(
+        f"exact {exact['dimensions']} dims: {exact['bytes'] / 1e6:.1f} MB, "
+        f"{exact['query_ms']:.2f} ms/query"
+    )
+    for row in report["reduced"]:
+        first_pass, two_stage = row["first_pass"], row["two_stage"]
+        print(
+            f"{row['dimensions']} dims: {row['bytes'] / 1e6:.1f} MB "
+            f"(fit {row['fit_ms']:.0f} ms), "
+            f"first pass {first_pass['query_ms']:.2f} ms/query recall {first_pass['recall']:.0%}, "
+            f"two-stage {two_stage['query_ms']:.2f} ms/query recall {two_stage['recall']:.0%}"
+        )
+
+
+def backend_report(
+    queries: list[str], backend: str, num_documents: int = 20, repeats: int = 5
+):
+    documents = [
+        f"{doc['title']} - {doc['description']}"
+        for doc in itertools.islice(get_document_store().documents(), num_documents)
+    ]
+    report = backend_report_command(queries, documents, backend, repeats)
+    print(
+        f"Backend {report['backend']} vs torch, {report['queries']} queries x "
+        f"{report['documents']} documents"
+    )
+    print(
+        f"Bi-encoder cosine: min {report['min_cosine']:.4f}, mean {report['mean_cosine']:.4f}"
+    )
+    print(
+        f"Cross-encoder: max score diff {report['max_score_diff']:.4f}, "
+        f"top-1 agreement {report['top1_agreement']:.0%}"
+    )
+    for name, latencies in (("Encode", report["encode_ms"]), ("Rerank", report["rerank_ms"])):
+        timings = ", ".join(f"{b} {ms:.2f} ms" for b, ms in latencies.items())
+        print(f"{name} latency per query: {timings}")
@@ -0,0 +1,276 @@
+import heapq
+import json
+import multiprocessing
+import os
+import sys
+from collections import defaultdict
+
+import numpy as np
+
+from .doc_filter import DocFilter, resolve_filters
+from .document_store import get_document_store
+from .generations import current_generation, generation_index_dir
+from .hybrid_search import rrf_fuse
+from .keyword_search import InvertedIndex, tokenize_text
+from .search_utils import CACHE_PATH, DEFAULT_SEARCH_LIMIT, format_search_result
+from .semantic_search import ChunkedSemanticSearch, SemanticSearch
+
+SHARDS_PATH = os.path.join(CACHE_PATH, "shards")
+DEFAULT_NUM_SHARDS = 4
+
+
+def shard_dir(shard: int) -> str:
+    return os.path.join(SHARDS_PATH, f"shard_{shard}")
+
+
+def shard_of(doc_id: int, num_shards: int) -> int:
+    return doc_id % num_shards
+
+
+def build_shards(num_shards: int = DEFAULT_NUM_SHARDS) -> None:
+    """Partition the catalog by movie id into BM25 + chunk embedding shards
+
+    The chunk embeddings are split from the unsharded ones, so nothing is re-encoded. The
+    shards record the index generation they were split from, and are only served with it.
+    """
+    generation = current_generation()
+    documents = get_document_store(generation_index_dir(generation))
+    semantic_search = ChunkedSemanticSearch(cache_dir=documents.store_dir)
+    semantic_search.load_or_create_chunk_embeddings(documents)
+
+    shard_documents = defaultdict(list)
+    for doc in documents.documents():
+        shard_documents[shard_of(doc["id"], num_shards)].append(doc)
+
+    chunk_rows = defaultdict(list)
+    for row, chunk in enumerate(semantic_search.chunk_metadata):
+        chunk_rows[shard_of(chunk["movie_idx"], num_shards)].append(row)
+
+    for shard in range(num_shards):
+        directory = shard_dir(shard)
+        inverted_index = InvertedIndex(cache_dir=directory, docmap=documents)
+        inverted_index.build(shard_documents[shard])
+        inverted_index.save()
+
+        rows = chunk_rows[shard]
+        shard_search = ChunkedSemanticSearch(cache_dir=directory)
+        np.save(
+            shard_search.chunk_embeddings_path, semantic_search.chunk_embeddings[rows]
+        )
+        chunk_metadata = [semantic_search.chunk_metadata[row] for row in rows]
+        with open(shard_search.chunk_metadata_path, "w") as f:
+            json.dump({"chunks": chunk_metadata, "total_chunks": len(rows)}, f)
+        print(
+            f"Shard {shard}: {len(shard_documents[shard])} documents, {len(rows)} chunks"
+        )
+
+    with open(os.path.join(SHARDS_PATH, "shards.json"), "w") as f:
+        json.dump({"num_shards": num_shards, "generation": generation}, f)
+
+
+def shard_worker(shard: int, store_dir: str, connection) -> None:
+    documents = get_document_store(store_dir)
+    inverted_index = InvertedIndex(cache_dir=shard_dir(shard), docmap=documents)
+    inverted_index.load()
+    semantic_search = ChunkedSemanticSearch(cache_dir=shard_dir(shard))
+    semantic_search.load_chunk_embeddings()
+    row_of_id = documents.row_of_id
+
+    while True:
+        request = connection.recv()
+        match request["op"]:
+            case "stats":
+                connection.send(inverted_index.get_stats())
+            case "bm25":
+                allowed = inverted_index.allowed_ordinals(request["doc_filter"])
+                scores = inverted_index.bm25_scores(
+                    request["tokens"], global_stats=request["global_stats"], allowed=allowed
+                )
+                doc_ids = inverted_index.doc_ids
+                if allowed is not None:
+                    doc_ids, scores = doc_ids[allowed], scores[allowed]
+                connection.send(top_hits(doc_ids, scores, row_of_id, request["limit"]))
+            case "semantic":
+                movie_ids, scores = semantic_search.movie_scores(
+                    request["query_embedding"], request["doc_filter"]
+                )
+                connection.send(top_hits(movie_ids, scores, row_of_id, request["limit"]))
+            case "stop":
+                connection.close()
+                return
+
+
+def top_hits(
+    doc_ids: np.ndarray, scores: np.ndarray, row_of_id: np.ndarray, limit: int
+) -> list[tuple[float, int, int]]:
+    # (score, catalog row, doc_id); the catalog row breaks ties the way the unsharded sort does
+    rows = row_of_id[doc_ids]
+    order = np.lexsort((rows, -scores))[:limit]
+    return [(float(scores[i]), int(rows[i]), int(doc_ids[i])) for i in order]
+
+
+class ShardedSearch:
+    def __init__(self):
+        with open(os.path.join(SHARDS_PATH, "shards.json"), "r") as f:
+            shards = json.load(f)
+        generation = current_generation()
+        if shards.get("generation") != generation:
+            raise ValueError(
+                f"Shards were built from index generation {shards.get('generation')}, "
+                f"the current one is {generation}; run build-shards again"
+            )
+        self.num_shards = shards["num_shards"]
+        self.documents = get_document_store(generation_index_dir(generation))
+        self.semantic_search = SemanticSearch()
+        self.connections = []
+        self.processes = []
+
+        context = multiprocessing.get_context("spawn")
+        for shard in range(self.num_shards):
+            parent_connection, child_connection = context.Pipe()
+            process = context.Process(
+                target=shard_worker,
+                args=(shard, self.documents.store_dir, child_connection),
+                daemon=True,
+            )
+            process.start()
+            self.connections.append(parent_connection)
+            self.processes.append(process)
+
+        # df, document count and total length summed over every shard make the BM25 idf
+        # and length normalization identical to the unsharded index
+        dfs = defaultdict(int)
+        doc_count = 0
+        total_length = 0
+        for stats in self.scatter({"op": "stats"}):
+            doc_count += stats["doc_count"]
+            total_length += stats["total_length"]
+            for term, df in stats["dfs"].items():
+                dfs[term] += df
+        self.global_stats = {
+            "doc_count": doc_count,
+            "avg_doc_length": total_length / doc_count if doc_count else 0.0,
+            "dfs": dict(dfs),
+        }
+
+    def scatter(self, request: dict) -> list:
+        for connection in self.connections:
+            connection.send(request)
+        return [connection.recv() for connection in self.connections]
+
+    def gather(self, shard_hits: list[list[tuple]], limit: int) -> list[dict]:
+        merged = heapq.merge(*shard_hits, key=lambda hit: (-hit[0], hit[1]))
+        results = []
+        for score, _, doc_id in list(merged)[:limit]:
+            doc = self.documents[doc_id]
+            results.append(
+                format_search_result(
+                    doc_id=doc_id,
+                    title=doc["title"],
+                    document=doc["description"],
+                    score=score,
+                )
+            )
+        return results
+
+    def bm25_search(
+        self,
+        query: str,
+        limit: int = DEFAULT_SEARCH_LIMIT,
+        doc_filter: DocFilter | None = None,
+    ) -> list[dict]:
+        query_tokens = tokenize_text(query)
+        global_stats = {
+            "doc_count": self.global_stats["doc_count"],
+            "avg_doc_length": self.global_stats["avg_doc_length"],
+            "dfs": {token: self.global_stats["dfs"].get(token, 0) for token in query_tokens},
+        }
+        shard_hits = self.scatter(
+            {
+                "op": "bm25",
+                "tokens": query_tokens,
+                "global_stats": global_stats,
+                "limit": limit,
+                "doc_filter": doc_filter,
+            }
+        )
+        return self.gather(shard_hits, limit)
+
+    def search_chunks(
+        self,
+        query: str,
+        limit: int = DEFAULT_SEARCH_LIMIT,
+        doc_filter: DocFilter | None = None,
+    ) -> list[dict]:
+        query_embedding = self.semantic_search.generate_embedding(query)
+        shard_hits = self.scatter(
+            {
+                "op": "semantic",
+                "query_embedding": query_embedding,
+                "limit": limit,
+                "doc_filter": doc_filter,
+            }
+        )
+        return self.gather(shard_hits, limit)
+
+    def rrf_search(
+        self,
+        query: str,
+        k: int = 60,
+        limit: int = DEFAULT_SEARCH_LIMIT,
+        doc_filter: DocFilter | None = None,
+    ):
+        bm25_results = self.bm25_search(query, limit * 500, doc_filter)
+        semantic_results = self.search_chunks(query, limit * 500, doc_filter)
+        return rrf_fuse(bm25_results, semantic_results, k)[:limit]
+
+    def close(self) -> None:
+        for connection in self.connections:
+            connection.send({"op": "stop"})
+        for process in self.processes:
+            process.join()
+
+
+def sharded_search_command(
+    query: str,
+    mode: str = "rrf",
+    limit: int = DEFAULT_SEARCH_LIMIT,
+    verify=False,
+    filters: list[str] | None = None,
+) -> dict:
+    doc_filter = resolve_filters(filters)
+    try:
+        sharded_search = ShardedSearch()
+    except ValueError as e:
+        print(e)
+        sys.exit(1)
+    try:
+        match mode:
+            case "bm25":
+                results = sharded_search.bm25_search(query, limit, doc_filter)
+            case "semantic":
+                results = sharded_search.search_chunks(query, limit, doc_filter)
+            case _:
+                results = sharded_search.rrf_search(
+                    query, limit=limit, doc_filter=doc_filter
+                )
+    finally:
+        sharded_search.close()
+
+    matches_unsharded = None
+    if verify and mode == "bm25":
+        inverted_index = InvertedIndex(
+            cache_dir=sharded_search.documents.store_dir, docmap=sharded_search.documents
+        )
+        inverted_index.load()
+        unsharded = inverted_index.bm25_search(query, limit, doc_filter)
+        matches_unsharded = [(r["doc_id"], r["score"]) for r in unsharded] == [
+            (r["doc_id"], r["score"]) for r in results
+        ]
+    return {
+        "query": query,
+        "mode": mode,
+        "num_shards": sharded_search.num_shards,
+        "results": results,
+        "matches_unsharded": matches_unsharded,
+    }
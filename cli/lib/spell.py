@@ -0,0 +1,177 @@
+import os
+import pickle
+from collections import defaultdict
+from functools import lru_cache
+
+from .generations import index_dir
+
+SPELL_MAX_EDIT_DISTANCE = 2
+# deletes are only generated for this many leading characters, as in SymSpell
+SPELL_PREFIX_LENGTH = 7
+# shorter words are left alone, two edits could turn them into almost anything
+SPELL_MIN_WORD_LENGTH = 3
+# words shorter than this get a single edit ("movie" is two edits from "love")
+SPELL_TWO_EDIT_LENGTH = 6
+# below this the local correction is not trusted and the LLM may be asked instead
+SPELL_CONFIDENCE_THRESHOLD = 0.5
+SPELL_INDEX_NAME = "spell_index.pkl"
+
+
+def deletes(word: str, max_distance: int) -> set[str]:
+    # every string reachable from word by removing up to max_distance characters
+    found = set()
+    frontier = {word}
+    for _ in range(max_distance):
+        next_frontier = set()
+        for text in frontier:
+            for i in range(len(text)):
+                deleted = text[:i] + text[i + 1 :]
+                if deleted not in found:
+                    found.add(deleted)
+                    next_frontier.add(deleted)
+        frontier = next_frontier
+    return found
+
+
+def edit_distance(a: str, b: str, max_distance: int) -> int:
+    """Optimal string alignment distance, or max_distance + 1 once it is exceeded"""
+    if abs(len(a) - len(b)) > max_distance:
+        return max_distance + 1
+    previous2 = None
+    previous = list(range(len(b) + 1))
+    for i in range(1, len(a) + 1):
+        current = [i] + [0] * len(b)
+        for j in range(1, len(b) + 1):
+            cost = a[i - 1] != b[j - 1]
+            current[j] = min(previous[j] + 1, current[j - 1] + 1, previous[j - 1] + cost)
+            if (
+                previous2 is not None
+                and i > 1
+                and j > 1
+                and a[i - 1] == b[j - 2]
+                and a[i - 2] == b[j - 1]
+            ):
+                current[j] = min(current[j], previous2[j - 2] + 1)
+        if min(current) > max_distance:
+            return max_distance + 1
+        previous2, previous = previous, current
+    return previous[-1]
+
+
+class SpellCorrector:
+    """SymSpell-style corrector: dictionary words are found through shared deletions
+
+    Every dictionary word's deletions (up to SPELL_MAX_EDIT_DISTANCE over its first
+    SPELL_PREFIX_LENGTH characters) are precomputed, so a lookup only generates the deletions
+    of the typed word and verifies the few words they lead to.
+    """
+
+    def __init__(self, cache_dir: str | None = None):
+        self.words: list[str] = []
+        self.counts: list[int] = []
+        self.word_ids: dict[str, int] = {}  # word -> index into words / counts
+        self.delete_map: dict[str, list[int]] = {}  # deletion -> word ids
+        self.skip_words: frozenset[str] = frozenset()  # known words that are never corrected
+        self.known_stems: frozenset[str] = frozenset()  # inflections of these are known too
+        self.path = os.path.join(cache_dir or index_dir(), SPELL_INDEX_NAME)
+
+    def build(self, word_counts: dict[str, int], skip_words=(), known_stems=()) -> None:
+        self.words = sorted(word_counts, key=lambda word: (-word_counts[word], word))
+        self.counts = [word_counts[word] for word in self.words]
+        self.word_ids = {word: i for i, word in enumerate(self.words)}
+        self.skip_words = frozenset(skip_words)
+        self.known_stems = frozenset(known_stems)
+        delete_map = defaultdict(list)
+        for word_id, word in enumerate(self.words):
+            prefix = word[:SPELL_PREFIX_LENGTH]
+            delete_map[prefix].append(word_id)
+            for deleted in deletes(prefix, SPELL_MAX_EDIT_DISTANCE):
+                delete_map[deleted].append(word_id)
+        self.delete_map = dict(delete_map)
+
+    def save(self) -> None:
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        with open(self.path, "wb") as f:
+            pickle.dump(
+                {
+                    "words": self.words,
+                    "counts": self.counts,
+                    "delete_map": self.delete_map,
+                    "skip_words": self.skip_words,
+                    "known_stems": self.known_stems,
+                },
+                f,
+            )
+
+    def load(self) -> None:
+        if not os.path.exists(self.path):
+            raise FileNotFoundError(f"Spell index not found at {self.path}")
+        with open(self.path, "rb") as f:
+            saved = pickle.load(f)
+        self.words = saved["words"]
+        self.counts = saved["counts"]
+        self.delete_map = saved["delete_map"]
+        self.skip_words = saved["skip_words"]
+        self.known_stems = saved["known_stems"]
+        self.word_ids = {word: i for i, word in enumerate(self.words)}
+
+    def lookup(self, word: str) -> tuple[str, float]:
+        """Best correction of a lowercase word and the confidence in it
+
+        The confidence is the best candidate's share of the corpus frequency of all
+        candidates at the smallest distance: 1.0 for known words and unambiguous fixes,
+        0.0 when nothing is within the edit distance allowed for the word's length.
+        """
+        if (
+            word in self.word_ids
+            or word in self.skip_words
+            or len(word) < SPELL_MIN_WORD_LENGTH
+            or not word.isalpha()
+        ):
+            return word, 1.0
+        from .keyword_search import stem_word
+
+        if stem_word(word) in self.known_stems:
+            return word, 1.0
+        prefix = word[:SPELL_PREFIX_LENGTH]
+        candidate_ids = set(self.delete_map.get(prefix, ()))
+        for deleted in deletes(prefix, SPELL_MAX_EDIT_DISTANCE):
+            candidate_ids.update(self.delete_map.get(deleted, ()))
+
+        max_distance = SPELL_MAX_EDIT_DISTANCE if len(word) >= SPELL_TWO_EDIT_LENGTH else 1
+        best_distance = max_distance + 1
+        best = []
+        for word_id in candidate_ids:
+            distance = edit_distance(word, self.words[word_id], best_distance)
+            if distance < best_distance:
+                best_distance = distance
+                best = [word_id]
+            elif distance == best_distance and distance <= max_distance:
+                best.append(word_id)
+        if not best:
+            return word, 0.0
+        # word ids are ordered by descending count, so the smallest id is the most frequent
+        best.sort()
+        total = sum(self.counts[word_id] for word_id in best)
+        return self.words[best[0]], self.counts[best[0]] / total
+
+    def correct(self, query: str) -> tuple[str, float]:
+        """Correct every word of a query, returning it with the lowest word confidence"""
+        corrected = []
+        confidence = 1.0
+        for word in query.lower().split():
+            stripped = word.strip(".,!?;:'\"()")
+            suggestion, word_confidence = self.lookup(stripped)
+            corrected.append(word.replace(stripped, suggestion) if stripped else word)
+            confidence = min(confidence, word_confidence)
+        return " ".join(corrected), confidence
+
+
+@lru_cache(maxsize=1)
+def get_spell_corrector() -> SpellCorrector | None:
+    spell_corrector = SpellCorrector()
+    try:
+        spell_corrector.load()
+    except FileNotFoundError:
+        return None
+    return spell_corrector
@@ -0,0 +1,124 @@
+import os
+from functools import lru_cache
+
+import numpy as np
+
+from .generations import index_dir
+
+# nearest terms kept per vocabulary term
+TERM_NEIGHBORS = 10
+# neighbors less similar than this are not used for expansion
+TERM_NEIGHBOR_MIN_SIMILARITY = 0.5
+# terms appended to a query by local expansion
+LOCAL_EXPANSION_TERMS = 5
+# rows of the similarity matrix computed at a time while building
+TERM_NEIGHBOR_BLOCK_SIZE = 1024
+
+
+class TermNeighbors:
+    """Nearest neighbors of every indexed term in embedding space
+
+    Terms are index stems; each is embedded through its most common surface word, which is
+    also what an expansion appends to the query so the keyword pipeline stems it back.
+    """
+
+    def __init__(self, cache_dir: str | None = None):
+        cache_dir = cache_dir or index_dir()
+        self.terms = np.zeros(0, dtype=str)  # term id -> stem
+        self.surface = np.zeros(0, dtype=str)  # term id -> surface word
+        self.idfs = np.zeros(0, dtype=np.float32)  # term id -> BM25 idf
+        self.neighbors = np.zeros((0, TERM_NEIGHBORS), dtype=np.int32)  # -1 padded
+        self.similarities = np.zeros((0, TERM_NEIGHBORS), dtype=np.float32)
+        self.term_ids: dict[str, int] = {}
+        self.path = os.path.join(cache_dir, "term_neighbors.npz")
+
+    def build(
+        self,
+        terms: list[str],
+        surface: list[str],
+        idfs: np.ndarray,
+        embeddings: np.ndarray,
+        neighbors: int = TERM_NEIGHBORS,
+    ) -> None:
+        self.terms = np.array(terms, dtype=str)
+        self.surface = np.array(surface, dtype=str)
+        self.idfs = np.asarray(idfs, dtype=np.float32)
+        self.term_ids = {term: i for i, term in enumerate(terms)}
+
+        norms = np.linalg.norm(embeddings, axis=1, keepdims=True)
+        unit = (embeddings / np.maximum(norms, 1e-12)).astype(np.float32)
+        count = min(neighbors, len(terms) - 1)
+        self.neighbors = np.full((len(terms), neighbors), -1, dtype=np.int32)
+        self.similarities = np.zeros((len(terms), neighbors), dtype=np.float32)
+        if count <= 0:
+            return
+        # blocks of rows keep the similarity matrix out of memory for large vocabularies
+        for start in range(0, len(terms), TERM_NEIGHBOR_BLOCK_SIZE):
+            block = unit[start : start + TERM_NEIGHBOR_BLOCK_SIZE] @ unit.T
+            rows = np.arange(len(block))
+            block[rows, start + rows] = -np.inf  # a term is not its own neighbor
+            top = np.argpartition(-block, count - 1, axis=1)[:, :count]
+            top_scores = np.take_along_axis(block, top, axis=1)
+            order = np.argsort(-top_scores, axis=1, kind="stable")
+            self.neighbors[start : start + len(block), :count] = np.take_along_axis(
+                top, order, axis=1
+            )
+            self.similarities[start : start + len(block), :count] = np.take_along_axis(
+                top_scores, order, axis=1
+            )
+
+    def save(self) -> None:
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        np.savez(
+            self.path,
+            terms=self.terms,
+            surface=self.surface,
+            idfs=self.idfs,
+            neighbors=self.neighbors,
+            similarities=self.similarities,
+        )
+
+    def load(self) -> None:
+        if not os.path.exists(self.path):
+            raise FileNotFoundError(f"Term neighbors not found at {self.path}")
+        with np.load(self.path) as arrays:
+            self.terms = arrays["terms"]
+            self.surface = arrays["surface"]
+            self.idfs = arrays["idfs"]
+            self.neighbors = arrays["neighbors"]
+            self.similarities = arrays["similarities"]
+        self.term_ids = {str(term): i for i, term in enumerate(self.terms)}
+
+    def expand(
+        self, query_tokens: list[str], limit: int = LOCAL_EXPANSION_TERMS
+    ) -> list[str]:
+        """Surface words of the best neighbors of the query stems, by similarity * idf
+
+        Rare neighbors are preferred since they narrow BM25 the most; a neighbor shared by
+        several query terms keeps its best score.
+        """
+        query_ids = {self.term_ids[token] for token in query_tokens if token in self.term_ids}
+        scores: dict[int, float] = {}
+        for term_id in query_ids:
+            for neighbor, similarity in zip(
+                self.neighbors[term_id], self.similarities[term_id]
+            ):
+                if neighbor < 0 or similarity < TERM_NEIGHBOR_MIN_SIMILARITY:
+                    break
+                if neighbor in query_ids:
+                    continue
+                score = float(similarity) * float(self.idfs[neighbor])
+                if score > scores.get(int(neighbor), 0.0):
+                    scores[int(neighbor)] = score
+        best = sorted(scores, key=lambda neighbor: (-scores[neighbor], neighbor))[:limit]
+        return [str(self.surface[neighbor]) for neighbor in best]
+
+
+@lru_cache(maxsize=1)
+def get_term_neighbors() -> TermNeighbors | None:
+    term_neighbors = TermNeighbors()
+    try:
+        term_neighbors.load()
+    except FileNotFoundError:
+        return None
+    return term_neighbors
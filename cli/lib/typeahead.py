@@ -0,0 +1,214 @@
+import os
+import string
+
+import numpy as np
+
+from .generations import index_dir
+
+# completions kept on every trie node, so a lookup never visits a subtree
+TYPEAHEAD_TOP_K = 10
+PUNCTUATION_TABLE = str.maketrans("", "", string.punctuation)
+
+
+def normalize_key(text: str) -> str:
+    return " ".join(text.lower().translate(PUNCTUATION_TABLE).split())
+
+
+class Trie:
+    """Character trie flattened into arrays, every node storing its top-k entry ids
+
+    Children of a node are contiguous and sorted by character, so a lookup is one binary
+    search per prefix character followed by reading the node's precomputed completions.
+    """
+
+    def __init__(self):
+        self.first_child = np.zeros(1, dtype=np.int32)  # node -> index of its first child
+        self.child_count = np.zeros(1, dtype=np.int32)
+        self.chars = np.zeros(1, dtype=np.int32)  # node -> code point of its incoming edge
+        self.top = np.full((1, TYPEAHEAD_TOP_K), -1, dtype=np.int32)  # node -> entry ids
+
+    @classmethod
+    def from_keys(cls, keys: list[tuple[str, int]], weights: np.ndarray) -> "Trie":
+        """Build from (key, entry id) pairs; several keys may point at the same entry"""
+        children = [{}]  # node -> {char: child node}
+        terminal = [[]]  # node -> entry ids whose key ends here
+        for key, entry in keys:
+            node = 0
+            for char in key:
+                child = children[node].get(char)
+                if child is None:
+                    child = len(children)
+                    children[node][char] = child
+                    children.append({})
+                    terminal.append([])
+                node = child
+            terminal[node].append(entry)
+
+        def rank(entries) -> list[int]:
+            # best weight first, entry id breaks ties so the build is deterministic
+            unique = sorted(set(entries), key=lambda entry: (-weights[entry], entry))
+            return unique[:TYPEAHEAD_TOP_K]
+
+        # breadth-first numbering keeps every node's children contiguous
+        order = [0]
+        new_id = {0: 0}
+        trie = cls()
+        first_child = [0]
+        child_count = [0]
+        chars = [0]
+        for node in order:
+            first_child[new_id[node]] = len(order)
+            child_count[new_id[node]] = len(children[node])
+            for char in sorted(children[node]):
+                child = children[node][char]
+                new_id[child] = len(order)
+                order.append(child)
+                first_child.append(0)
+                child_count.append(0)
+                chars.append(ord(char))
+
+        top = np.full((len(order), TYPEAHEAD_TOP_K), -1, dtype=np.int32)
+        best = {}
+        for node in reversed(order):  # children are numbered after their parents
+            entries = list(terminal[node])
+            for child in children[node].values():
+                entries.extend(best.pop(child))
+            best[node] = rank(entries)
+            top[new_id[node], : len(best[node])] = best[node]
+
+        trie.first_child = np.array(first_child, dtype=np.int32)
+        trie.child_count = np.array(child_count, dtype=np.int32)
+        trie.chars = np.array(chars, dtype=np.int32)
+        trie.top = top
+        return trie
+
+    def find(self, prefix: str) -> int:
+        node = 0
+        for char in prefix:
+            start = int(self.first_child[node])
+            end = start + int(self.child_count[node])
+            code = ord(char)
+            position = start + int(np.searchsorted(self.chars[start:end], code))
+            if position == end or self.chars[position] != code:
+                return -1
+            node = position
+        return node
+
+    def complete(self, prefix: str, limit: int = TYPEAHEAD_TOP_K) -> list[int]:
+        node = self.find(prefix)
+        if node < 0:
+            return []
+        entries = self.top[node, :limit]
+        return [int(entry) for entry in entries if entry >= 0]
+
+    def arrays(self, name: str) -> dict[str, np.ndarray]:
+        return {
+            f"{name}_first_child": self.first_child,
+            f"{name}_child_count": self.child_count,
+            f"{name}_chars": self.chars,
+            f"{name}_top": self.top,
+        }
+
+    @classmethod
+    def from_arrays(cls, arrays, name: str) -> "Trie":
+        trie = cls()
+        trie.first_child = arrays[f"{name}_first_child"]
+        trie.child_count = arrays[f"{name}_child_count"]
+        trie.chars = arrays[f"{name}_chars"]
+        trie.top = arrays[f"{name}_top"]
+        return trie
+
+
+class TypeaheadIndex:
+    """Prefix completions over catalog titles and indexed terms
+
+    Titles are reachable from the start of every word in them ("knight" completes
+    "The Dark Knight"); terms are the surface words of the catalog.
+    """
+
+    def __init__(self, cache_dir: str | None = None):
+        cache_dir = cache_dir or index_dir()
+        self.titles = Trie()
+        self.title_text = np.zeros(0, dtype=str)
+        self.title_doc_ids = np.zeros(0, dtype=np.int64)
+        self.title_weights = np.zeros(0, dtype=np.float32)
+        self.terms = Trie()
+        self.term_text = np.zeros(0, dtype=str)
+        self.term_weights = np.zeros(0, dtype=np.float32)
+        self.path = os.path.join(cache_dir, "typeahead.npz")
+
+    def build(
+        self,
+        titles: list[tuple[int, str, float]],
+        terms: list[tuple[str, float]],
+    ) -> None:
+        """Build from (doc_id, title, weight) and (term, weight), higher weights first"""
+        self.title_doc_ids = np.array([doc_id for doc_id, _, _ in titles], dtype=np.int64)
+        self.title_text = np.array([title for _, title, _ in titles], dtype=str)
+        self.title_weights = np.array([w for _, _, w in titles], dtype=np.float32)
+        title_keys = []
+        for entry, (_, title, _) in enumerate(titles):
+            words = normalize_key(title).split()
+            for start in range(len(words)):
+                title_keys.append((" ".join(words[start:]), entry))
+        self.titles = Trie.from_keys(title_keys, self.title_weights)
+
+        self.term_text = np.array([term for term, _ in terms], dtype=str)
+        self.term_weights = np.array([w for _, w in terms], dtype=np.float32)
+        term_keys = [(normalize_key(term), entry) for entry, (term, _) in enumerate(terms)]
+        self.terms = Trie.from_keys(term_keys, self.term_weights)
+
+    def save(self) -> None:
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        np.savez(
+            self.path,
+            title_text=self.title_text,
+            title_doc_ids=self.title_doc_ids,
+            title_weights=self.title_weights,
+            term_text=self.term_text,
+            term_weights=self.term_weights,
+            **self.titles.arrays("titles"),
+            **self.terms.arrays("terms"),
+        )
+
+    def load(self) -> None:
+        if not os.path.exists(self.path):
+            raise FileNotFoundError(f"Typeahead index not found at {self.path}")
+        with np.load(self.path) as arrays:
+            arrays = dict(arrays)
+        self.title_text = arrays["title_text"]
+        self.title_doc_ids = arrays["title_doc_ids"]
+        self.title_weights = arrays["title_weights"]
+        self.term_text = arrays["term_text"]
+        self.term_weights = arrays["term_weights"]
+        self.titles = Trie.from_arrays(arrays, "titles")
+        self.terms = Trie.from_arrays(arrays, "terms")
+
+    def suggest(self, prefix: str, limit: int = TYPEAHEAD_TOP_K) -> dict:
+        if limit < 1:
+            raise ValueError(f"limit must be at least 1, got {limit}")
+        key = normalize_key(prefix)
+        # a trailing space means the last word is complete, keep it in the key
+        if prefix.endswith(" ") and key:
+            key += " "
+        limit = min(limit, TYPEAHEAD_TOP_K)
+        titles = [
+            {
+                "title": str(self.title_text[entry]),
+                "doc_id": int(self.title_doc_ids[entry]),
+                "score": float(self.title_weights[entry]),
+            }
+            for entry in self.titles.complete(key, limit)
+        ]
+        # terms complete the last word being typed
+        last_word = key.split(" ")[-1] if key else ""
+        terms = []
+        if last_word:
+            terms = [
+                {
+                    "term": str(self.term_text[entry]),
+                    "score": float(self.term_weights[entry]),
+                }
+                for entry in self.terms.complete(last_word, limit)
+            ]
+        return {"prefix": prefix, "titles": titles, "terms": terms}
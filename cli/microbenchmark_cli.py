@@ -0,0 +1,359 @@
+#!/usr/bin/env python3
+
+import argparse
+import json
+import math
+import os
+import platform
+import random
+import statistics
+import sys
+import time
+import tracemalloc
+from typing import Callable
+
+import numpy as np
+
+from lib.hybrid_search import combine_search_results, normalize, rrf_fuse
+from lib.keyword_search import InvertedIndex, tokenize_text
+from lib.search_utils import CACHE_PATH
+from lib.semantic_search import semantic_chunk
+
+DEFAULT_BASELINE_PATH = os.path.join(CACHE_PATH, "microbenchmark_baseline.json")
+DEFAULT_SAMPLES = 30
+# calls per sample are raised until one sample takes this long, so timer resolution and
+# loop overhead stay negligible
+MIN_SAMPLE_MS = 5.0
+# a benchmark regresses when its samples are slower with p below this (Mann-Whitney U) ...
+DEFAULT_ALPHA = 0.01
+# ... and its median is this much slower, so noise-level shifts on a quiet machine pass
+DEFAULT_THRESHOLD = 0.05
+# inputs are deterministic, so more allocated memory beyond this is a real change
+ALLOC_THRESHOLD = 0.10
+
+SYNTHETIC_SEED = 0
+SYNTHETIC_DOCUMENTS = 5000
+SYNTHETIC_WORDS = 60
+# results per engine as the hybrid searches fetch them, limit * 500 for the default limit
+SYNTHETIC_RESULTS = 2500
+SYNTHETIC_VOCABULARY = (
+    "bear london marmalade family adventure space war alien robot detective murder city "
+    "night love story comedy horror ghost haunted house school friends summer island ocean "
+    "pirate treasure king queen castle dragon magic wizard forest journey brother sister "
+    "father mother daughter son wedding police chase heist bank prison escape train desert "
+    "western sheriff outlaw music band singer dancer zombie vampire werewolf hunters running "
+    "jumped discovers finally loved"
+).split()
+
+
+def synthetic_text(rng: random.Random, words: int) -> str:
+    sentences = []
+    while words > 0:
+        length = min(words, rng.randint(6, 14))
+        sentence = " ".join(rng.choice(SYNTHETIC_VOCABULARY) for _ in range(length))
+        sentences.append(sentence.capitalize() + rng.choice([".", "!", "?"]))
+        words -= length
+    return " ".join(sentences)
+
+
+def synthetic_documents() -> dict[int, dict]:
+    rng = random.Random(SYNTHETIC_SEED)
+    return {
+        doc_id: {
+            "id": doc_id,
+            "title": synthetic_text(rng, 3).rstrip(".!?"),
+            "description": synthetic_text(rng, SYNTHETIC_WORDS),
+        }
+        for doc_id in range(1, SYNTHETIC_DOCUMENTS + 1)
+    }
+
+
+def synthetic_results(seed: int, documents: dict[int, dict]) -> list[dict]:
+    # ranked results of one engine; two seeds share about half their documents
+    rng = random.Random(seed)
+    doc_ids = rng.sample(sorted(documents), SYNTHETIC_RESULTS)
+    scores = sorted((rng.random() * 10 for _ in doc_ids), reverse=True)
+    return [
+        {
+            "doc_id": doc_id,
+            "title": documents[doc_id]["title"],
+            "document": documents[doc_id]["description"],
+            "score": score,
+        }
+        for doc_id, score in zip(doc_ids, scores)
+    ]
+
+
+def benchmark_cases() -> dict[str, Callable[[], object]]:
+    """Name -> zero-argument call over fixed synthetic inputs, built once up front"""
+    documents = synthetic_documents()
+    rng = random.Random(SYNTHETIC_SEED + 1)
+    texts = [documents[doc_id]["description"] for doc_id in rng.sample(sorted(documents), 50)]
+    queries = [synthetic_text(rng, rng.randint(2, 5)).rstrip(".!?") for _ in range(20)]
+
+    index = InvertedIndex(docmap=documents)
+    index.build(documents.values())
+    terms = [
+        (rng.choice(sorted(documents)), rng.choice(SYNTHETIC_VOCABULARY)) for _ in range(100)
+    ]
+
+    bm25_results = synthetic_results(SYNTHETIC_SEED + 2, documents)
+    semantic_results = synthetic_results(SYNTHETIC_SEED + 3, documents)
+    scores = [result["score"] for result in bm25_results]
+
+    return {
+        "tokenize_text": lambda: [tokenize_text(text) for text in texts],
+        "semantic_chunk": lambda: [semantic_chunk(text, 4, 1) for text in texts],
+        "get_bm25_tf": lambda: [index.get_bm25_tf(doc_id, term) for doc_id, term in terms],
+        "bm25_search": lambda: [index.bm25_search(query, 2500) for query in queries],
+        "normalize": lambda: normalize(scores),
+        "combine_search_results": lambda: combine_search_results(
+            bm25_results, semantic_results
+        ),
+        # the fusion step of HybridSearch.rrf_search, without the two engines it fuses
+        "rrf_fuse": lambda: rrf_fuse(bm25_results, semantic_results),
+    }
+
+
+def calibrate(call: Callable[[], object]) -> int:
+    number = 1
+    while True:
+        start = time.perf_counter()
+        for _ in range(number):
+            call()
+        if (time.perf_counter() - start) * 1000 >= MIN_SAMPLE_MS or number >= 1 << 20:
+            return number
+        number *= 2
+
+
+def measure_allocations(call: Callable[[], object]) -> dict:
+    # traced separately from the timings, tracemalloc slows every allocation down
+    tracemalloc.start()
+    try:
+        before = tracemalloc.take_snapshot()
+        tracemalloc.reset_peak()
+        start_bytes, _ = tracemalloc.get_traced_memory()
+        result = call()
+        _, peak_bytes = tracemalloc.get_traced_memory()
+        after = tracemalloc.take_snapshot()
+    finally:
+        tracemalloc.stop()
+    retained = after.compare_to(before, "traceback")
+    del result
+    return {
+        "peak_bytes": peak_bytes - start_bytes,
+        # blocks allocated by the call still alive at its end, mostly its result
+        "blocks": sum(max(stat.count_diff, 0) for stat in retained),
+    }
+
+
+def run_benchmark(
+    call: Callable[[], object], samples: int = DEFAULT_SAMPLES, number: int | None = None
+) -> dict:
+    call()  # warm caches (stems, stopwords) so every sample measures the steady state
+    number = number or calibrate(call)
+    timings_us = []
+    for _ in range(samples):
+        start = time.perf_counter()
+        for _ in range(number):
+            call()
+        timings_us.append((time.perf_counter() - start) * 1e6 / number)
+    return {
+        "number": number,
+        "samples_us": [round(t, 3) for t in timings_us],
+        "median_us": statistics.median(timings_us),
+        "mean_us": statistics.fmean(timings_us),
+        "stdev_us": statistics.stdev(timings_us) if samples > 1 else 0.0,
+        "min_us": min(timings_us),
+        "max_us": max(timings_us),
+        "allocations": measure_allocations(call),
+    }
+
+
+def run_suite(
+    names: list[str] | None = None,
+    samples: int = DEFAULT_SAMPLES,
+    numbers: dict[str, int] | None = None,
+) -> dict:
+    cases = benchmark_cases()
+    unknown = set(names or []) - set(cases)
+    if unknown:
+        raise ValueError(f"Unknown benchmarks {sorted(unknown)}, expected {sorted(cases)}")
+    numbers = numbers or {}
+    return {
+        "python": platform.python_version(),
+        "machine": platform.machine(),
+        "numpy": np.__version__,
+        "samples": samples,
+        "benchmarks": {
+            name: run_benchmark(call, samples, numbers.get(name))
+            for name, call in cases.items()
+            if not names or name in names
+        },
+    }
+
+
+def mann_whitney_p(slower: list[float], faster: list[float]) -> float:
+    """One-sided p-value that `slower` tends to be larger than `faster`
+
+    Normal approximation of the Mann-Whitney U test with tie-corrected variance, fine for the
+    tens of samples per side a run takes; no assumption that timings are normally distributed.
+    """
+    n1, n2 = len(slower), len(faster)
+    if n1 == 0 or n2 == 0:
+        return 1.0
+    values = np.concatenate([slower, faster])
+    order = np.argsort(values, kind="stable")
+    ranks = np.empty(len(values))
+    ranks[order] = np.arange(1, len(values) + 1)
+    # tied values share their average rank
+    _, inverse, counts = np.unique(values, return_inverse=True, return_counts=True)
+    ranks = (np.bincount(inverse, weights=ranks) / counts)[inverse]
+    u = ranks[:n1].sum() - n1 * (n1 + 1) / 2
+    n = n1 + n2
+    variance = n1 * n2 / 12 * ((n + 1) - float((counts**3 - counts).sum()) / (n * (n - 1)))
+    if variance <= 0:
+        return 1.0
+    z = (u - n1 * n2 / 2 - 0.5) / math.sqrt(variance)
+    return 0.5 * math.erfc(z / math.sqrt(2))
+
+
+def compare_runs(
+    baseline: dict,
+    current: dict,
+    alpha: float = DEFAULT_ALPHA,
+    threshold: float = DEFAULT_THRESHOLD,
+) -> list[dict]:
+    rows = []
+    for name, result in current["benchmarks"].items():
+        base = baseline["benchmarks"].get(name)
+        if base is None:
+            rows.append({"name": name, "status": "new", "median_us": result["median_us"]})
+            continue
+        change = result["median_us"] / base["median_us"] - 1 if base["median_us"] else 0.0
+        p_slower = mann_whitney_p(result["samples_us"], base["samples_us"])
+        p_faster = mann_whitney_p(base["samples_us"], result["samples_us"])
+        alloc_change = {
+            key: (result["allocations"][key] / base["allocations"][key] - 1)
+            if base["allocations"][key]
+            else 0.0
+            for key in ("peak_bytes", "blocks")
+        }
+        status = "ok"
+        if p_slower < alpha and change > threshold:
+            status = "SLOWER"
+        elif max(alloc_change.values()) > ALLOC_THRESHOLD:
+            status = "ALLOCS"
+        elif p_faster < alpha and change < -threshold:
+            status = "faster"
+        rows.append(
+            {
+                "name": name,
+                "status": status,
+                "baseline_us": base["median_us"],
+                "median_us": result["median_us"],
+                "change": change,
+                "p_value": p_slower if change >= 0 else p_faster,
+                "alloc_change": alloc_change,
+            }
+        )
+    return rows
+
+
+def print_run(run: dict) -> None:
+    for name, result in run["benchmarks"].items():
+        allocations = result["allocations"]
+        print(
+            f"{name:<24} median {result['median_us']:10.1f}us "
+            f"(min {result['min_us']:.1f}, stdev {result['stdev_us']:.1f}, "
+            f"{run['samples']} x {result['number']} calls) "
+            f"peak {allocations['peak_bytes'] / 1024:.1f} KiB, {allocations['blocks']} blocks"
+        )
+
+
+def print_comparison(rows: list[dict]) -> None:
+    for row in rows:
+        if row["status"] == "new":
+            print(f"[   new] {row['name']:<24} median {row['median_us']:10.1f}us, no baseline")
+            continue
+        print(
+            f"[{row['status']:>6}] {row['name']:<24} {row['baseline_us']:10.1f}us -> "
+            f"{row['median_us']:10.1f}us ({row['change']:+.1%}, p={row['p_value']:.3g}), "
+            f"peak {row['alloc_change']['peak_bytes']:+.1%}, "
+            f"blocks {row['alloc_change']['blocks']:+.1%}"
+        )
+
+
+def load_baseline(path: str) -> dict:
+    if not os.path.exists(path):
+        print(f"No baseline at {path}, run `record` first")
+        sys.exit(1)
+    with open(path, "r") as f:
+        return json.load(f)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Per-function Microbenchmarks")
+    subparsers = parser.add_subparsers(dest="command", help="Available commands")
+    for command, help_text in (
+        ("record", "Run the suite and store it as the baseline"),
+        ("compare", "Run the suite and flag regressions against the baseline"),
+    ):
+        command_parser = subparsers.add_parser(command, help=help_text)
+        command_parser.add_argument(
+            "benchmarks", type=str, nargs="*", help="Benchmarks to run (default all)"
+        )
+        command_parser.add_argument(
+            "--baseline", type=str, default=DEFAULT_BASELINE_PATH, help="Baseline JSON path"
+        )
+        command_parser.add_argument(
+            "--samples", type=int, default=DEFAULT_SAMPLES, help="Timed samples per benchmark"
+        )
+    compare_parser = subparsers.choices["compare"]
+    compare_parser.add_argument(
+        "--alpha",
+        type=float,
+        default=DEFAULT_ALPHA,
+        help="Significance level of the Mann-Whitney U test",
+    )
+    compare_parser.add_argument(
+        "--threshold",
+        type=float,
+        default=DEFAULT_THRESHOLD,
+        help="Median slowdown (fraction) a significant change must exceed",
+    )
+    args = parser.parse_args()
+
+    match args.command:
+        case "record":
+            run = run_suite(args.benchmarks, args.samples)
+            print_run(run)
+            os.makedirs(os.path.dirname(os.path.abspath(args.baseline)), exist_ok=True)
+            with open(args.baseline, "w") as f:
+                json.dump(run, f, indent=2)
+            print(f"Baseline saved to {args.baseline}")
+        case "compare":
+            baseline = load_baseline(args.baseline)
+            # the baseline's calls per sample, so both sides average over the same batches
+            numbers = {
+                name: result["number"] for name, result in baseline["benchmarks"].items()
+            }
+            run = run_suite(args.benchmarks, args.samples, numbers)
+            for key in ("python", "machine", "numpy"):
+                if baseline[key] != run[key]:
+                    print(
+                        f"Warning: baseline {key} {baseline[key]} != {run[key]}, "
+                        "timings may not be comparable"
+                    )
+            rows = compare_runs(baseline, run, args.alpha, args.threshold)
+            print_comparison(rows)
+            regressions = [row for row in rows if row["status"] in ("SLOWER", "ALLOCS")]
+            if regressions:
+                print(f"{len(regressions)} benchmark(s) regressed")
+                sys.exit(1)
+        case _:
+            parser.print_help()
+
+
+if __name__ == "__main__":
+    main()
@@ -1,17 +1,43 @@
 import argparse
-from lib.multimodal_search import verify_image_embedding, search_with_image
+from lib.multimodal_search import (
+    verify_image_embedding,
+    search_with_image,
+    search_with_image_directory,
+)
+from lib.search_utils import DEFAULT_SEARCH_LIMIT
+
 
 def main():
     parser = argparse.ArgumentParser(description="Multimodal Search CLI")
     subparsers = parser.add_subparsers(dest="command", help="Available commands")
 
     verify_image_embedding_parser = subparsers.add_parser(
-        "verify_image_embedding", help="Verify the image embedding")
-    verify_image_embedding_parser.add_argument("image", type=str, help="Path to the image to embed")
+        "verify_image_embedding", help="Verify the image embedding"
+    )
+    verify_image_embedding_parser.add_argument(
+        "image", type=str, help="Path to the image to embed"
+    )
 
     image_search_parser = subparsers.add_parser(
-        "image_search", help="Search with image")
-    image_search_parser.add_argument("image", type=str, help="Path to the image to search with")
+        "image_search", help="Search with image"
+    )
+    image_search_parser.add_argument(
+        "image", type=str, help="Path to the image to search with"
+    )
+
+    image_search_batch_parser = subparsers.add_parser(
+        "image_search_batch",
+        help="Search with every image in a directory, embedded in one batch",
+    )
+    image_search_batch_parser.add_argument(
+        "directory", type=str, help="Directory of images to search with"
+    )
+    image_search_batch_parser.add_argument(
+        "--limit",
+        type=int,
+        help="Limit the number of results per image",
+        default=DEFAULT_SEARCH_LIMIT,
+    )
 
     args = parser.parse_args()
     match args.command:
@@ -19,8 +45,11 @@ def main():
             verify_image_embedding(args.image)
         case "image_search":
             search_with_image(args.image)
+        case "image_search_batch":
+            search_with_image_directory(args.directory, args.limit)
         case _:
             parser.print_help()
 
+
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main()
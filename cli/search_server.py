@@ -0,0 +1,106 @@
+#!/usr/bin/env python3
+
+import argparse
+import json
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+from lib.generations import ResidentIndex
+from lib.search_utils import DEFAULT_SEARCH_LIMIT
+from lib.typeahead import TypeaheadIndex
+
+
+def load_typeahead(cache_dir: str) -> TypeaheadIndex:
+    typeahead_index = TypeaheadIndex(cache_dir)
+    typeahead_index.load()
+    return typeahead_index
+
+
+class SearchRequestHandler(BaseHTTPRequestHandler):
+    # loaded when the server starts and swapped whenever a new index generation is published
+    typeahead: ResidentIndex[TypeaheadIndex]
+
+    def do_GET(self) -> None:
+        url = urlparse(self.path)
+        params = {name: values[0] for name, values in parse_qs(url.query).items()}
+        match url.path:
+            case "/suggest":
+                self.suggest(params)
+            case "/generation":
+                self.send_json(200, self.generation_status())
+            case _:
+                self.send_json(404, {"error": f"Unknown endpoint {url.path}"})
+
+    def do_POST(self) -> None:
+        url = urlparse(self.path)
+        match url.path:
+            case "/reload":
+                # the new generation loads in the background, queries keep being served
+                loading = self.typeahead.reload() is not None
+                self.send_json(
+                    202 if loading else 200,
+                    {**self.generation_status(), "loading": loading},
+                )
+            case _:
+                self.send_json(404, {"error": f"Unknown endpoint {url.path}"})
+
+    def generation_status(self) -> dict:
+        return {
+            "generation": self.typeahead.generation,
+            "last_error": self.typeahead.last_error,
+        }
+
+    def suggest(self, params: dict) -> None:
+        try:
+            limit = int(params.get("limit", DEFAULT_SEARCH_LIMIT))
+        except ValueError:
+            self.send_json(400, {"error": "limit must be an integer"})
+            return
+        if limit < 1:
+            self.send_json(400, {"error": "limit must be at least 1"})
+            return
+        start = time.perf_counter()
+        # one reference for the whole request, a reload swapping the index does not affect it
+        typeahead_index = self.typeahead.index
+        suggestions = typeahead_index.suggest(params.get("q", ""), limit)
+        suggestions["elapsed_ms"] = (time.perf_counter() - start) * 1000
+        self.send_json(200, suggestions)
+
+    def send_json(self, status: int, body: dict) -> None:
+        data = json.dumps(body).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Search HTTP server")
+    parser.add_argument("--host", type=str, default="127.0.0.1", help="Address to bind")
+    parser.add_argument("--port", type=int, default=8000, help="Port to listen on")
+    parser.add_argument(
+        "--watch",
+        type=float,
+        default=0,
+        help="Seconds between checks for a new index generation, 0 reloads only on POST /reload",
+    )
+    args = parser.parse_args()
+
+    SearchRequestHandler.typeahead = ResidentIndex(load_typeahead)
+    if args.watch > 0:
+        SearchRequestHandler.typeahead.watch(args.watch)
+
+    server = ThreadingHTTPServer((args.host, args.port), SearchRequestHandler)
+    print(f"Serving on http://{args.host}:{args.port} (GET /suggest?q=<prefix>&limit=<n>)")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+
+if __name__ == "__main__":
+    main()
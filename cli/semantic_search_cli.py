@@ -12,7 +12,16 @@ from lib.semantic_search import (
     embed_chunks,
     semantic_chunk_text,
     search_chunks,
+    backend_report,
+    build_term_neighbors,
+    vector_report,
+    reduce_embeddings,
+    reduction_report,
 )
+from lib.inference_backend import INFERENCE_BACKENDS
+from lib.reduced_vectors import REDUCED_DIMENSIONS, REDUCTION_METHODS, RESCORE_FACTOR
+from lib.search_utils import VECTOR_BLOCK_SIZE, VECTOR_MMAP, VECTOR_REDUCED
+from lib.term_neighbors import TERM_NEIGHBORS
 
 
 def main():
@@ -32,6 +41,24 @@ def main():
     search_parser.add_argument(
         "--limit", type=int, help="Limit the number of results", default=5, nargs="?"
     )
+    search_parser.add_argument(
+        "--filter",
+        action="append",
+        dest="filters",
+        help="Only return documents in this named filter (repeat to intersect)",
+    )
+    search_parser.add_argument(
+        "--reduced",
+        action="store_true",
+        default=VECTOR_REDUCED,
+        help="Score reduced embeddings first and rescore the best at full dimension",
+    )
+    search_parser.add_argument(
+        "--rescore-factor",
+        type=int,
+        default=RESCORE_FACTOR,
+        help="Candidates rescored per result with --reduced",
+    )
 
     chunk_parser = subparsers.add_parser("chunk", help="Chunk a text")
     chunk_parser.add_argument("text", type=str, help="Text to chunk")
@@ -68,16 +95,162 @@ def main():
     embed_chunks_parser = subparsers.add_parser(
         "embed_chunks", help="Generate chunk embeddings from documents"
     )
+    embed_chunks_parser.add_argument(
+        "--workers",
+        type=int,
+        default=1,
+        help="Encoder processes to spread the batches over",
+    )
+    embed_chunks_parser.add_argument(
+        "--rebuild",
+        action="store_true",
+        help="Encode the embeddings again even when they are already built",
+    )
 
     search_chunks_parser = subparsers.add_parser("search_chunked", help="Search chunks")
     search_chunks_parser.add_argument("query", type=str, help="Search query")
     search_chunks_parser.add_argument(
         "--limit", type=int, help="Limit the number of results", default=5, nargs="?"
     )
+    search_chunks_parser.add_argument(
+        "--mmap",
+        action="store_true",
+        default=VECTOR_MMAP,
+        help="Memory-map the embeddings and score them block by block",
+    )
+    search_chunks_parser.add_argument(
+        "--block-size",
+        type=int,
+        default=VECTOR_BLOCK_SIZE,
+        help="Embedding rows scored per block with --mmap",
+    )
+    search_chunks_parser.add_argument(
+        "--filter",
+        action="append",
+        dest="filters",
+        help="Only return documents in this named filter (repeat to intersect)",
+    )
+    search_chunks_parser.add_argument(
+        "--reduced",
+        action="store_true",
+        default=VECTOR_REDUCED,
+        help="Score reduced embeddings first and rescore the best at full dimension",
+    )
+    search_chunks_parser.add_argument(
+        "--rescore-factor",
+        type=int,
+        default=RESCORE_FACTOR,
+        help="Candidates rescored per result with --reduced",
+    )
 
     verify_embeddings_parser = subparsers.add_parser(
         "verify_embeddings", help="Verify the embeddings"
     )
+    verify_embeddings_parser.add_argument(
+        "--workers",
+        type=int,
+        default=1,
+        help="Encoder processes to spread the batches over when building",
+    )
+    verify_embeddings_parser.add_argument(
+        "--rebuild",
+        action="store_true",
+        help="Encode the embeddings again even when they are already built",
+    )
+
+    term_neighbors_parser = subparsers.add_parser(
+        "build_term_neighbors",
+        help="Embed the index vocabulary and store every term's nearest terms",
+    )
+    term_neighbors_parser.add_argument(
+        "--neighbors", type=int, default=TERM_NEIGHBORS, help="Neighbors kept per term"
+    )
+
+    vector_report_parser = subparsers.add_parser(
+        "vector_report",
+        help="Compare in-RAM chunk scoring against the memory-mapped blocked scan",
+    )
+    vector_report_parser.add_argument(
+        "queries", type=str, nargs="+", help="Queries to score the chunks with"
+    )
+    vector_report_parser.add_argument(
+        "--block-size",
+        type=int,
+        default=VECTOR_BLOCK_SIZE,
+        help="Embedding rows scored per block",
+    )
+    vector_report_parser.add_argument(
+        "--limit", type=int, default=10, help="Movies kept per query"
+    )
+    vector_report_parser.add_argument(
+        "--repeats", type=int, default=5, help="Times to run every query"
+    )
+
+    reduce_parser = subparsers.add_parser(
+        "reduce_embeddings",
+        help="Build reduced-dimension copies of the embeddings for a first scoring pass",
+    )
+    reduce_parser.add_argument(
+        "--method",
+        type=str,
+        choices=REDUCTION_METHODS,
+        default="pca",
+        help="pca, or truncate for Matryoshka-trained models",
+    )
+    reduce_parser.add_argument(
+        "--dims", type=int, default=REDUCED_DIMENSIONS, help="Reduced dimensions"
+    )
+
+    reduction_report_parser = subparsers.add_parser(
+        "reduction_report",
+        help="Compare recall and latency of reduced first passes against exact search",
+    )
+    reduction_report_parser.add_argument(
+        "queries", type=str, nargs="+", help="Queries to score the chunks with"
+    )
+    reduction_report_parser.add_argument(
+        "--dims",
+        type=int,
+        nargs="+",
+        default=[32, 64, 128],
+        help="Reduced dimensions to compare",
+    )
+    reduction_report_parser.add_argument(
+        "--method", type=str, choices=REDUCTION_METHODS, default="pca"
+    )
+    reduction_report_parser.add_argument(
+        "--limit", type=int, default=10, help="Movies kept per query"
+    )
+    reduction_report_parser.add_argument(
+        "--rescore-factor",
+        type=int,
+        default=RESCORE_FACTOR,
+        help="Candidates rescored at full dimension per result",
+    )
+    reduction_report_parser.add_argument(
+        "--repeats", type=int, default=5, help="Times to run every query"
+    )
+
+    backend_report_parser = subparsers.add_parser(
+        "backend_report",
+        help="Check parity and latency of an inference backend against PyTorch",
+    )
+    backend_report_parser.add_argument(
+        "queries", type=str, nargs="+", help="Queries to encode and rerank with"
+    )
+    backend_report_parser.add_argument(
+        "--backend",
+        type=str,
+        choices=INFERENCE_BACKENDS,
+        default="onnx-int8",
+        help="Backend to compare against torch",
+    )
+    backend_report_parser.add_argument(
+        "--documents", type=int, default=20, help="Catalog documents to rerank"
+    )
+    backend_report_parser.add_argument(
+        "--repeats", type=int, default=5, help="Times to run every query"
+    )
 
     args = parser.parse_args()
 
@@ -87,19 +260,46 @@ def main():
         case "embed_text":
             embed_text(args.text)
         case "verify_embeddings":
-            verify_embeddings()
+            verify_embeddings(args.workers, args.rebuild)
         case "embedquery":
             embed_query_text(args.query)
         case "search":
-            search(args.query, args.limit)
+            search(
+                args.query, args.limit, args.filters, args.reduced, args.rescore_factor
+            )
         case "chunk":
             chunk(args.text, args.chunk_size, args.overlap)
         case "semantic_chunk":
             semantic_chunk_text(args.text, args.max_chunk_size, args.overlap)
         case "embed_chunks":
-            embed_chunks()
+            embed_chunks(args.workers, args.rebuild)
         case "search_chunked":
-            search_chunks(args.query, args.limit)
+            search_chunks(
+                args.query,
+                args.limit,
+                args.filters,
+                args.mmap,
+                args.block_size,
+                args.reduced,
+                args.rescore_factor,
+            )
+        case "build_term_neighbors":
+            build_term_neighbors(args.neighbors)
+        case "vector_report":
+            vector_report(args.queries, args.block_size, args.limit, args.repeats)
+        case "reduce_embeddings":
+            reduce_embeddings(args.method, args.dims)
+        case "reduction_report":
+            reduction_report(
+                args.queries,
+                args.dims,
+                args.method,
+                args.limit,
+                args.rescore_factor,
+                args.repeats,
+            )
+        case "backend_report":
+            backend_report(args.queries, args.backend, args.documents, args.repeats)
         case _:
             parser.print_help()
 
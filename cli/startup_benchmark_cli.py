@@ -0,0 +1,121 @@
+#!/usr/bin/env python3
+
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+CLI_DIR = os.path.dirname(os.path.abspath(__file__))
+HEAVY_MODULES = ["google.genai", "sentence_transformers", "torch", "PIL", "nltk"]
+DEFAULT_RUNS = 5
+DEFAULT_BUDGET_MS = 1000
+
+# (cli script, subcommand args, heavy modules the subcommand genuinely needs).
+# Subcommands that always call the LLM or an embedding model are only timed up to argument
+# parsing via --help, which still measures the cost of the module-level imports.
+STARTUP_CASES = [
+    ("keyword_search_cli.py", ["search", "bear"], ["nltk"]),
+    ("keyword_search_cli.py", ["bm25search", "bear"], ["nltk"]),
+    ("keyword_search_cli.py", ["tf", "1", "bear"], ["nltk"]),
+    ("keyword_search_cli.py", ["idf", "bear"], ["nltk"]),
+    ("keyword_search_cli.py", ["tfidf", "1", "bear"], ["nltk"]),
+    ("keyword_search_cli.py", ["bm25idf", "bear"], ["nltk"]),
+    ("keyword_search_cli.py", ["bm25tf", "1", "bear"], ["nltk"]),
+    ("keyword_search_cli.py", ["suggest", "bea"], []),
+    ("hybrid_search_cli.py", ["normalize", "1", "2", "3"], []),
+    ("hybrid_search_cli.py", ["weighted-search", "--help"], []),
+    ("hybrid_search_cli.py", ["rrf-search", "--help"], []),
+    ("hybrid_search_cli.py", ["enhance-query", "--help"], []),
+    ("semantic_search_cli.py", ["chunk", "one two three"], []),
+    ("semantic_search_cli.py", ["semantic_chunk", "One. Two. Three."], []),
+    ("semantic_search_cli.py", ["search", "--help"], []),
+    ("semantic_search_cli.py", ["search", "bear"], ["sentence_transformers", "torch"]),
+    ("augmented_generation_cli.py", ["rag", "--help"], []),
+    ("evaluation_cli.py", ["--help"], []),
+    ("multimodal_search_cli.py", ["image_search", "--help"], []),
+    ("describe_image_cli.py", ["--help"], []),
+]
+
+
+def imported_heavy_modules(importtime_output: str) -> list[str]:
+    # -X importtime writes one "import time: self | cumulative | module" line per import
+    imported = set()
+    for line in importtime_output.splitlines():
+        if not line.startswith("import time:"):
+            continue
+        module = line.rsplit("|", 1)[-1].strip()
+        for heavy in HEAVY_MODULES:
+            if module == heavy or module.startswith(heavy + "."):
+                imported.add(heavy)
+    return sorted(imported)
+
+
+def time_startup(script: str, args: list[str], runs: int = DEFAULT_RUNS) -> dict:
+    command = [sys.executable, os.path.join(CLI_DIR, script), *args]
+    timings = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        subprocess.run(command, cwd=CLI_DIR, capture_output=True)
+        timings.append((time.perf_counter() - start) * 1000)
+
+    traced = subprocess.run(
+        [sys.executable, "-X", "importtime", *command[1:]],
+        cwd=CLI_DIR,
+        capture_output=True,
+        text=True,
+    )
+    return {
+        "command": f"{script} {' '.join(args)}",
+        "median_ms": statistics.median(timings),
+        "min_ms": min(timings),
+        "max_ms": max(timings),
+        "exit_code": traced.returncode,
+        "heavy_modules": imported_heavy_modules(traced.stderr),
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="CLI Startup Benchmark")
+    parser.add_argument(
+        "--runs", type=int, default=DEFAULT_RUNS, help="Cold starts per subcommand"
+    )
+    parser.add_argument(
+        "--budget-ms",
+        type=float,
+        default=DEFAULT_BUDGET_MS,
+        help="Startup budget for subcommands that do not load an embedding model",
+    )
+    parser.add_argument(
+        "--include-heavy",
+        action="store_true",
+        help="Also time subcommands that load an embedding model",
+    )
+    args = parser.parse_args()
+
+    over_budget = 0
+    for script, cli_args, expected_heavy in STARTUP_CASES:
+        needs_model = "sentence_transformers" in expected_heavy
+        if needs_model and not args.include_heavy:
+            continue
+        result = time_startup(script, cli_args, args.runs)
+        unexpected = set(result["heavy_modules"]) - set(expected_heavy)
+        status = "ok"
+        if not needs_model and (result["median_ms"] > args.budget_ms or unexpected):
+            status = "SLOW"
+            over_budget += 1
+        heavy = ", ".join(result["heavy_modules"]) or "-"
+        print(
+            f"[{status:>4}] {result['command']:<50} median {result['median_ms']:7.1f}ms "
+            f"(min {result['min_ms']:.1f}, max {result['max_ms']:.1f}) "
+            f"exit={result['exit_code']} heavy: {heavy}"
+        )
+
+    if over_budget:
+        print(f"{over_budget} subcommand(s) over the {args.budget_ms:.0f}ms budget")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()